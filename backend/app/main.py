@@ -1,11 +1,15 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import files, vectors, config
+from app.routers import files, vectors, config, profiling
+from app.services import profiler
+from app.services.resilience import RequestDeadlineMiddleware
+from app.services.serialization import FastJSONResponse
 
 app = FastAPI(
     title="文件处理与向量索引API",
     description="提供文件上传、数据清洗、文本拆分和向量索引功能的API",
-    version="0.1.0"
+    version="0.1.0",
+    default_response_class=FastJSONResponse
 )
 
 # 配置CORS
@@ -17,10 +21,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 搜索请求的截止时间
+app.add_middleware(RequestDeadlineMiddleware)
+
+# 采样分析
+app.add_middleware(profiler.ProfileMiddleware)
+
 # 包含路由
 app.include_router(files.router, prefix="/api")
 app.include_router(vectors.router, prefix="/api")
 app.include_router(config.router, prefix="/api")
+app.include_router(profiling.router, prefix="/api")
 
 @app.get("/")
 async def root():
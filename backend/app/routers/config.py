@@ -1,7 +1,11 @@
 from fastapi import APIRouter, HTTPException, Body
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
 from typing import Dict, Any
 from app.services.config_service import ConfigService
+from app.services.embedding_service import list_embedding_providers
+from app.services.resilience import guard_stats
+from app.services import shard_client
 
 router = APIRouter(tags=["配置管理"])
 
@@ -27,4 +31,35 @@ async def update_config(config_updates: Dict[str, Any] = Body(...)):
             "config": updated_config
         }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"更新配置失败: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"更新配置失败: {str(e)}")
+
+@router.get("/config/embedding-providers")
+async def get_embedding_providers():
+    """获取所有可用的嵌入模型提供方"""
+    return {
+        "message": "获取嵌入模型提供方成功",
+        "providers": list_embedding_providers(),
+        "current": ConfigService.get_embedding_type()
+    }
+
+@router.get("/config/resilience")
+async def get_resilience_status():
+    """获取远程模型调用的熔断状态、并发、排队和调用计数（当前进程）"""
+    return {
+        "message": "获取远程调用状态成功",
+        "config": ConfigService.get_resilience_config(),
+        "services": guard_stats()
+    }
+
+@router.get("/config/sharding")
+async def get_sharding_status():
+    """获取分片服务进程的健康状态，以及当前进程对各服务进程的熔断状态和调用计数"""
+    try:
+        return {
+            "message": "获取分片服务状态成功",
+            "config": ConfigService.get_sharding_config(),
+            "workers": await run_in_threadpool(shard_client.worker_health),
+            "calls": shard_client.shard_stats()
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取分片服务状态失败: {str(e)}")
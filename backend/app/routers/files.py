@@ -1,12 +1,20 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Form
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from typing import List, Dict, Any, Optional
 import os
-import pandas as pd
+import shutil
 import numpy as np
 from pathlib import Path
 import json
-from app.services.file_processor import clean_data, split_text
+from app.services.selection_log import append_selection
+from app.services.chunk_store import open_chunk_store, processed_exists, legacy_processed_path
+from app.services.bulk_ingest import (
+    TABLE_FILE_TYPES, TEXT_FILE_TYPES, process_file, is_archive, is_supported, extract_archive,
+    iter_ingest, build_index
+)
+from app.services.config_service import ConfigService
+from app.services.serialization import FastJSONResponse, dumps_line
 
 router = APIRouter(tags=["文件处理"])
 
@@ -14,10 +22,34 @@ router = APIRouter(tags=["文件处理"])
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
+# 分页获取文本块时每页的最大数量
+MAX_PAGE_SIZE = 1000
+
+def _validate_chunk_params(max_chunk_size: int, overlap: int):
+    if max_chunk_size < 1 or overlap < 0 or overlap >= max_chunk_size:
+        raise HTTPException(
+            status_code=400,
+            detail=f"拆分参数无效: max_chunk_size={max_chunk_size}, overlap={overlap}，需要 0 <= overlap < max_chunk_size"
+        )
+
+def _process_file(file_id: str, file_path: Path, file_ext: str, max_chunk_size: int, overlap: int,
+                  text_column: Optional[str] = None, content_hash: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """拆分文件并写入处理结果，表格无法解析或文本列不存在时返回400"""
+    try:
+        return process_file(file_id, file_path, file_ext, max_chunk_size, overlap, text_column, content_hash)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
-    """上传文件并进行数据清洗和文本拆分"""
+async def upload_file(
+    file: UploadFile = File(...),
+    max_chunk_size: int = Form(512),
+    overlap: int = Form(100)
+):
+    """上传文件并进行数据清洗和文本拆分，返回处理结果摘要，文本块通过分页接口获取"""
     try:
+        _validate_chunk_params(max_chunk_size, overlap)
+        
         # 保存上传的文件
         file_path = UPLOAD_DIR / file.filename
         with open(file_path, "wb") as f:
@@ -27,127 +59,292 @@ async def upload_file(file: UploadFile = File(...)):
         # 根据文件类型进行处理
         file_ext = file.filename.split('.')[-1].lower()
         
-        if file_ext in ['csv', 'xlsx', 'xls']:
-            # 处理表格文件
-            if file_ext == 'csv':
-                df = pd.read_csv(file_path)
-            else:
-                df = pd.read_excel(file_path)
-            
-            # 数据清洗
-            cleaned_df = clean_data(df)
-            
-            # 文本拆分 (假设有一个文本列)
-            text_columns = [col for col in cleaned_df.columns if cleaned_df[col].dtype == 'object']
-            
-            if not text_columns:
-                return JSONResponse(
-                    status_code=400,
-                    content={"message": "未找到可拆分的文本列"}
-                )
-            
-            # 选择第一个文本列进行拆分
-            text_column = text_columns[0]
-            split_results = []
-            
-            for idx, row in cleaned_df.iterrows():
-                if pd.notna(row[text_column]):
-                    text = str(row[text_column])
-                    chunks = split_text(text)
-                    split_results.append({
-                        "row_id": idx,
-                        "original_text": text,
-                        "chunks": chunks
-                    })
-            
-            # 保存处理结果
-            result_file = UPLOAD_DIR / f"processed_{file.filename}.json"
-            with open(result_file, "w", encoding="utf-8") as f:
-                json.dump(split_results, f, ensure_ascii=False, indent=2)
-            
-            return {
-                "message": "文件处理成功",
-                "file_id": file.filename,
-                "split_results": split_results
-            }
-            
-        elif file_ext in ['txt', 'md', 'json']:
-            # 处理文本文件
-            with open(file_path, "r", encoding="utf-8") as f:
-                text = f.read()
-            
-            # 文本拆分
-            chunks = split_text(text)
-            
-            split_results = [{
-                "original_text": text,
-                "chunks": chunks
-            }]
-            
-            # 保存处理结果
-            result_file = UPLOAD_DIR / f"processed_{file.filename}.json"
-            with open(result_file, "w", encoding="utf-8") as f:
-                json.dump(split_results, f, ensure_ascii=False, indent=2)
-            
-            return {
-                "message": "文件处理成功",
-                "file_id": file.filename,
-                "split_results": split_results
-            }
-            
-        else:
+        if file_ext not in TABLE_FILE_TYPES + TEXT_FILE_TYPES:
             return JSONResponse(
                 status_code=400,
                 content={"message": f"不支持的文件类型: {file_ext}"}
             )
+        
+        summary = _process_file(file.filename, file_path, file_ext, max_chunk_size, overlap)
+        if summary is None:
+            return JSONResponse(
+                status_code=400,
+                content={"message": "未找到可拆分的文本列"}
+            )
+        
+        # 删除旧版本的JSON处理结果，避免与新结果混淆
+        legacy_processed_path(file.filename).unlink(missing_ok=True)
+        
+        return {
+            "message": "文件处理成功",
+            "file_id": file.filename,
+            "summary": summary,
+            "chunks_url": f"/api/files/{file.filename}/chunks"
+        }
             
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"文件处理失败: {str(e)}")
 
-@router.post("/select-chunks")
-async def select_chunks(file_id: str = Form(...), selected_chunks: List[str] = Form(...)):
-    """接收前端选择的文本块，准备进行向量索引"""
+def _save_bulk_uploads(files: List[UploadFile]) -> List[tuple]:
+    """
+    保存批量上传的文件，压缩包解压出其中支持的文件
+
+    Returns:
+        (文件ID, 文件路径) 列表；不支持的文件类型记为 (文件名, None)
+    """
+    items = []
+    for upload in files:
+        name = Path(upload.filename or "").name
+        if not name:
+            continue
+        file_path = UPLOAD_DIR / name
+        if not is_archive(name) and not is_supported(name):
+            items.append((name, None))
+            continue
+        with open(file_path, "wb") as f:
+            shutil.copyfileobj(upload.file, f, 1024 * 1024)
+        if is_archive(name):
+            try:
+                # 解压出的文件以压缩包名为前缀，不同压缩包中的同名文件不会互相覆盖
+                items.extend(extract_archive(file_path, prefix=name.split('.')[0]))
+            finally:
+                file_path.unlink(missing_ok=True)
+        else:
+            items.append((name, file_path))
+    return items
+
+@router.post("/bulk-upload")
+async def bulk_upload(
+    files: List[UploadFile] = File(...),
+    max_chunk_size: int = Form(512),
+    overlap: int = Form(100),
+    workers: Optional[int] = Form(None),
+    create_index: bool = Form(False),
+    index_name: str = Form("bulk"),
+    tags: Optional[str] = Form(None),
+    stream: bool = Form(True)
+):
+    """
+    批量上传多个文件或压缩包（zip、tar、tar.gz），在进程池中并行解析、清洗和拆分
+
+    stream 为 true 时以NDJSON逐行返回每个文件的处理结果，最后一行为统计（每秒文件数、MB数）；
+    create_index 为 true 时所有文件处理完成后用全部文本块创建一个向量索引，
+    tags 为附加到每个文本块的自定义标签（JSON对象）。
+    """
     try:
-        # 验证文件是否存在
-        result_file = UPLOAD_DIR / f"processed_{file_id}.json"
-        if not result_file.exists():
-            raise HTTPException(status_code=404, detail=f"找不到处理结果文件: {file_id}")
+        _validate_chunk_params(max_chunk_size, overlap)
         
-        # 分批处理文本块，每批最多1000个
-        batch_size = 1000
-        total_chunks = len(selected_chunks)
-        processed_chunks = []
+        tag_values = None
+        if tags:
+            try:
+                tag_values = json.loads(tags)
+            except json.JSONDecodeError as e:
+                raise HTTPException(status_code=400, detail=f"标签不是合法的JSON: {str(e)}")
+            if not isinstance(tag_values, dict):
+                raise HTTPException(status_code=400, detail="标签必须是JSON对象")
+        
+        try:
+            saved = await run_in_threadpool(_save_bulk_uploads, files)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        items = [(file_id, path) for file_id, path in saved if path is not None]
+        unsupported = [file_id for file_id, path in saved if path is None]
+        if not items:
+            raise HTTPException(status_code=400, detail="没有支持的文件")
+        max_files = ConfigService.get_bulk_ingest_config()["max_files"]
+        if len(items) > max_files:
+            raise HTTPException(status_code=400, detail=f"文件数量 {len(items)} 超过上限 {max_files}")
         
-        for i in range(0, total_chunks, batch_size):
-            batch = selected_chunks[i:i + batch_size]
-            processed_chunks.extend(batch)
+        def generate_events():
+            for file_id in unsupported:
+                yield {"event": "file", "file_id": file_id, "status": "error",
+                       "error": f"不支持的文件类型: {file_id.split('.')[-1].lower()}"}
+            succeeded = []
+            for event in iter_ingest(items, max_chunk_size, overlap, workers):
+                if event["event"] == "file" and event["status"] == "ok":
+                    succeeded.append(event["file_id"])
+                yield event
+            if create_index:
+                try:
+                    yield {"event": "index", "status": "ok", **build_index(succeeded, index_name, tag_values)}
+                except Exception as e:
+                    yield {"event": "index", "status": "error", "error": str(e)}
         
-        # 保存选择的文本块
-        selection_file = UPLOAD_DIR / f"selected_{file_id}.json"
+        if stream:
+            def generate():
+                for event in generate_events():
+                    yield dumps_line(event)
+            
+            return StreamingResponse(generate(), media_type="application/x-ndjson")
+        
+        events = await run_in_threadpool(lambda: list(generate_events()))
+        return {
+            "message": "批量处理完成",
+            "files": [event for event in events if event["event"] == "file"],
+            "stats": next(event for event in events if event["event"] == "done"),
+            "index": next((event for event in events if event["event"] == "index"), None)
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"批量处理失败: {str(e)}")
 
-        # 先读取现有内容（如果文件存在）
-        try:
-            with open(selection_file, "r", encoding="utf-8") as f:
-                existing_data = json.load(f)
-        except FileNotFoundError:
-            existing_data = []
+@router.post("/files/{file_id}/rechunk")
+async def rechunk_file(
+    file_id: str,
+    max_chunk_size: int = Form(512),
+    overlap: int = Form(100),
+    text_column: Optional[str] = Form(None)
+):
+    """
+    以新的拆分参数或文本列重新拆分已上传的文件
+    
+    表格文件从解析缓存中只读取文本列，不再重新解析和清洗。文本块ID会随拆分结果变化，
+    该文件已有的文本块选择会被清空。
+    """
+    try:
+        _validate_chunk_params(max_chunk_size, overlap)
+        
+        file_path = UPLOAD_DIR / file_id
+        if not file_path.is_file():
+            raise HTTPException(status_code=404, detail=f"找不到上传的文件: {file_id}")
+        
+        file_ext = file_id.split('.')[-1].lower()
+        if file_ext not in TABLE_FILE_TYPES + TEXT_FILE_TYPES:
+            raise HTTPException(status_code=400, detail=f"不支持的文件类型: {file_ext}")
+        if text_column is not None and file_ext not in TABLE_FILE_TYPES:
+            raise HTTPException(status_code=400, detail="只有表格文件可以指定文本列")
+        
+        # 上传时记录的内容哈希与当前上传的文件一致，重新拆分不必再读取整个文件
+        content_hash = None
+        if processed_exists(file_id):
+            content_hash = open_chunk_store(file_id).summary.get("content_hash")
+        
+        summary = _process_file(file_id, file_path, file_ext, max_chunk_size, overlap, text_column, content_hash)
+        if summary is None:
+            return JSONResponse(
+                status_code=400,
+                content={"message": "未找到可拆分的文本列"}
+            )
+        
+        legacy_processed_path(file_id).unlink(missing_ok=True)
+        
+        return {
+            "message": "重新拆分成功",
+            "file_id": file_id,
+            "summary": summary,
+            "chunks_url": f"/api/files/{file_id}/chunks"
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"重新拆分失败: {str(e)}")
+
+def _get_chunk_store(file_id: str):
+    """打开处理结果，不存在时返回404"""
+    try:
+        return open_chunk_store(file_id)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"找不到处理结果文件: {file_id}")
+
+def _parse_cursor(cursor: Optional[str]) -> int:
+    """游标为文本块的全局序号"""
+    if not cursor:
+        return 0
+    try:
+        position = int(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"无效的游标: {cursor}")
+    if position < 0:
+        raise HTTPException(status_code=400, detail=f"无效的游标: {cursor}")
+    return position
+
+@router.get("/files/{file_id}/summary")
+async def get_file_summary(file_id: str):
+    """获取处理结果摘要"""
+    store = _get_chunk_store(file_id)
+    return {
+        "message": "获取处理结果摘要成功",
+        "file_id": file_id,
+        "summary": store.summary
+    }
+
+@router.get("/files/{file_id}/chunks")
+async def list_chunks(
+    file_id: str,
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(200, ge=1, le=MAX_PAGE_SIZE)
+):
+    """按游标分页获取文本块"""
+    store = _get_chunk_store(file_id)
+    start = _parse_cursor(cursor)
+    end = min(start + limit, store.chunk_count)
+    chunks = list(store.iter_chunks(start, end))
+    return FastJSONResponse({
+        "message": "获取文本块成功",
+        "file_id": file_id,
+        "chunks": chunks,
+        "total": store.chunk_count,
+        "next_cursor": str(end) if end < store.chunk_count else None
+    })
 
-        # 确保现有数据是列表
-        if not isinstance(existing_data, list):
-            existing_data = [existing_data]
+@router.get("/files/{file_id}/chunks/stream")
+async def stream_chunks(file_id: str, cursor: Optional[str] = Query(None)):
+    """以NDJSON流式返回文本块，每行一个文本块"""
+    store = _get_chunk_store(file_id)
+    start = _parse_cursor(cursor)
 
-        # 追加新数据
-        existing_data.extend(processed_chunks if isinstance(processed_chunks, list) else [processed_chunks])
+    def generate():
+        for chunk in store.iter_chunks(start):
+            yield dumps_line(chunk)
 
-        # 写入更新后的内容
-        with open(selection_file, "w", encoding="utf-8") as f:
-            json.dump(existing_data, f, ensure_ascii=False, indent=2)
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+@router.get("/files/{file_id}/groups/{group_index}")
+async def get_chunk_group(file_id: str, group_index: int):
+    """获取一组原始文本及其拆分后的文本块"""
+    store = _get_chunk_store(file_id)
+    try:
+        group = store.get_group(group_index)
+    except IndexError:
+        raise HTTPException(status_code=404, detail=f"找不到文本组: {group_index}")
+    return {
+        "message": "获取文本组成功",
+        "file_id": file_id,
+        **group
+    }
+
+@router.post("/select-chunks")
+async def select_chunks(
+    file_id: str = Form(...),
+    selected_chunks: List[str] = Form([]),
+    chunk_ids: List[str] = Form([]),
+    select_all: bool = Form(False)
+):
+    """接收前端选择的文本块，追加到选择日志中，准备进行向量索引"""
+    try:
+        # 验证文件是否存在
+        if not processed_exists(file_id):
+            raise HTTPException(status_code=404, detail=f"找不到处理结果文件: {file_id}")
+        
+        # 全选时直接从处理结果中取出所有文本块ID
+        if select_all:
+            chunk_ids = list(open_chunk_store(file_id).iter_chunk_ids())
+        
+        # 以文本块ID追加到选择日志，重复项在读取时去除
+        selected_count = append_selection(file_id, chunk_ids=chunk_ids, texts=selected_chunks)
         
         return {
             "message": "已接收选定的文本块",
             "file_id": file_id,
-            "selected_count": len(processed_chunks)
+            "selected_count": selected_count
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"处理选定文本块失败: {str(e)}")
\ No newline at end of file
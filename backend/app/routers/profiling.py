@@ -0,0 +1,84 @@
+import hmac
+import os
+from fastapi import APIRouter, HTTPException, Form, Header, Depends
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+from app.services import profiler
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """性能分析接口只对持有管理员令牌（环境变量 PROFILER_ADMIN_TOKEN）的请求开放"""
+    token = os.environ.get(profiler.ADMIN_TOKEN_ENV)
+    if not token:
+        raise HTTPException(status_code=403, detail=f"未设置 {profiler.ADMIN_TOKEN_ENV}，性能分析接口已禁用")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, token):
+        raise HTTPException(status_code=403, detail="管理员令牌无效")
+
+
+router = APIRouter(tags=["性能分析"], dependencies=[Depends(require_admin)])
+
+@router.post("/profiling/start")
+async def start_profiling(
+    requests: Optional[int] = Form(None),
+    seconds: Optional[float] = Form(None),
+    path: Optional[str] = Form(None),
+    tag: Optional[str] = Form(None),
+    interval_ms: Optional[float] = Form(None)
+):
+    """
+    开始采样分析，在处理完 requests 个匹配的请求或经过 seconds 秒后自动结束
+
+    path 只分析路径以此开头的请求，tag 只分析 X-Profile-Tag 请求头等于此值的请求。
+    """
+    try:
+        session = profiler.start(requests, seconds, path, tag, interval_ms)
+        return {
+            "message": "开始采样分析",
+            "session": session.summary()
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"开始采样分析失败: {str(e)}")
+
+@router.post("/profiling/stop")
+async def stop_profiling():
+    """结束进行中的采样分析"""
+    session = profiler.stop()
+    if session is None:
+        raise HTTPException(status_code=404, detail="没有进行中的采样分析")
+    return {
+        "message": "采样分析已结束",
+        "session": session.summary()
+    }
+
+@router.get("/profiling")
+async def list_profiles():
+    """当前进程进行中的和最近的采样分析"""
+    session = profiler.active_session()
+    return {
+        "message": "获取采样分析成功",
+        "active": session.summary() if session is not None else None,
+        "sessions": profiler.list_sessions()
+    }
+
+@router.get("/profiling/{session_id}")
+async def get_profile(session_id: str):
+    """采样分析的摘要，包含自身耗时和累计耗时最多的函数"""
+    summary = profiler.get_summary(session_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail=f"找不到采样分析: {session_id}")
+    return {
+        "message": "获取采样分析成功",
+        "session": summary
+    }
+
+@router.get("/profiling/{session_id}/collapsed", response_class=PlainTextResponse)
+async def get_profile_collapsed(session_id: str):
+    """折叠栈格式的采样结果，可以用 flamegraph.pl 或 speedscope 生成火焰图"""
+    collapsed = profiler.get_collapsed(session_id)
+    if collapsed is None:
+        raise HTTPException(status_code=404, detail=f"找不到采样分析: {session_id}")
+    return PlainTextResponse(collapsed, headers={
+        "Content-Disposition": f'attachment; filename="{session_id}.collapsed"'
+    })
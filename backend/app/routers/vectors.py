@@ -1,5 +1,6 @@
 from fastapi import APIRouter, HTTPException, Form, Body
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from typing import List, Dict, Any, Optional
 import os
 import json
@@ -7,7 +8,15 @@ from pathlib import Path
 import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
-from app.services.vector_service import create_vector_index, search_vector_index, semantic_search, semantic_search_multi
+from app.services.vector_service import (
+    create_vector_index, search_vector_index, semantic_search, semantic_search_multi, iter_batch_search
+)
+from app.services.selection_log import selection_exists, iter_selected_chunks
+from app.services.config_service import ConfigService
+from app.services.dedup_service import deduplicate, build_source_map
+from app.services.chunk_metadata import build_chunk_metadata, parse_filters
+from app.services import answer_cache
+from app.services.serialization import FastJSONResponse, dumps_line, load
 
 router = APIRouter(tags=["向量索引"])
 
@@ -19,18 +28,50 @@ UPLOAD_DIR.mkdir(exist_ok=True)
 VECTOR_DIR = Path("vector_indices")
 VECTOR_DIR.mkdir(exist_ok=True)
 
+# 批量搜索单次请求的最大查询数量
+MAX_BATCH_QUERIES = 10000
+
 @router.post("/create-index")
-async def create_index(file_id: str = Form(...)):
-    """根据选定的文本块创建向量索引"""
+async def create_index(
+    file_id: str = Form(...),
+    dedup: Optional[bool] = Form(None),
+    dedup_threshold: Optional[float] = Form(None),
+    index_id: Optional[str] = Form(None),
+    tags: Optional[str] = Form(None)
+):
+    """
+    根据选定的文本块创建向量索引
+    
+    dedup 和 dedup_threshold 未提供时使用配置中的近似去重设置。
+    提供 index_id 时重建该索引：新版本构建完成前搜索继续使用旧版本。
+    tags 为JSON对象，作为自定义标签附加到每个文本块，搜索时以 "tags.<名称>" 过滤。
+    """
     try:
-        # 验证选择文件是否存在
-        selection_file = UPLOAD_DIR / f"selected_{file_id}.json"
-        if not selection_file.exists():
+        # 解析自定义标签
+        tag_values = None
+        if tags:
+            try:
+                tag_values = json.loads(tags)
+            except json.JSONDecodeError as e:
+                raise HTTPException(status_code=400, detail=f"标签不是合法的JSON: {str(e)}")
+            if not isinstance(tag_values, dict):
+                raise HTTPException(status_code=400, detail="标签必须是JSON对象")
+        
+        # 验证选择日志是否存在
+        if not selection_exists(file_id):
             raise HTTPException(status_code=404, detail=f"找不到选择文件: {file_id}")
         
-        # 读取选择的文本块
-        with open(selection_file, "r", encoding="utf-8") as f:
-            selected_chunks = json.load(f)
+        # 验证要重建的索引是否存在
+        if index_id is not None and not (VECTOR_DIR / f"{index_id}.json").exists():
+            raise HTTPException(status_code=404, detail=f"找不到向量索引: {index_id}")
+        
+        dedup_config = ConfigService.get_dedup_config()
+        use_dedup = dedup if dedup is not None else dedup_config["enabled"]
+        
+        # 流式读取选中文本块，近似去重时保留文本相同的文本块以记录其来源
+        selected = list(iter_selected_chunks(file_id, unique_texts=not use_dedup))
+        chunk_ids = [chunk_id for chunk_id, _ in selected]
+        selected_chunks = [text for _, text in selected]
         
         if not selected_chunks:
             return JSONResponse(
@@ -38,21 +79,60 @@ async def create_index(file_id: str = Form(...)):
                 content={"message": "没有选择任何文本块"}
             )
         
+        # 每个文本块的来源行、列和标签，用于搜索时过滤
+        metadata = build_chunk_metadata(file_id, chunk_ids, tag_values)
+        
+        # 近似去重：相似的文本块只嵌入一次，并记录被合并文本块的来源
+        dedup_info = None
+        if use_dedup:
+            threshold = dedup_threshold if dedup_threshold is not None else dedup_config["threshold"]
+            if not 0 < threshold <= 1:
+                raise HTTPException(status_code=400, detail=f"去重阈值必须在 (0, 1] 之间: {threshold}")
+            result = deduplicate(
+                selected_chunks,
+                threshold=threshold,
+                num_perm=dedup_config["num_perm"],
+                shingle_size=dedup_config["shingle_size"]
+            )
+            dedup_info = {
+                "stats": result.stats(),
+                "source_map": build_source_map(result, selected_chunks, chunk_ids)
+            }
+            selected_chunks = [selected_chunks[i] for i in result.kept_indices]
+            metadata = [metadata[i] for i in result.kept_indices]
+        
         # 创建向量索引
-        index_id = create_vector_index(selected_chunks, file_id, use_llm=True)
+        index_id = create_vector_index(
+            selected_chunks, file_id, use_llm=True, dedup=dedup_info, index_id=index_id, metadata=metadata
+        )
         
-        return {
+        response = {
             "message": "向量索引创建成功",
             "index_id": index_id,
             "chunk_count": len(selected_chunks)
         }
+        if dedup_info:
+            response["dedup"] = dedup_info["stats"]
+        return response
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"创建向量索引失败: {str(e)}")
 
 @router.post("/search")
-async def search_vectors(index_id: str = Form(...), query: str = Form(...), top_k: int = Form(5)):
-    """在向量索引中搜索相似内容"""
+async def search_vectors(
+    index_id: str = Form(...),
+    query: str = Form(...),
+    top_k: int = Form(5),
+    filters: Optional[str] = Form(None)
+):
+    """
+    在向量索引中搜索相似内容
+    
+    filters 为JSON过滤表达式，例如 {"column": "content", "row_id": {"$gte": 100}}，
+    只在满足条件的文本块中搜索。
+    """
     try:
         # 验证索引是否存在
         index_file = VECTOR_DIR / f"{index_id}.json"
@@ -60,13 +140,20 @@ async def search_vectors(index_id: str = Form(...), query: str = Form(...), top_
             raise HTTPException(status_code=404, detail=f"找不到向量索引: {index_id}")
         
         # 搜索向量
-        results = semantic_search(query, index_id, top_k)
+        try:
+            # 在线程池中执行，等待远程模型时不阻塞其他请求
+            results = await run_in_threadpool(semantic_search, query, index_id, top_k, filters=parse_filters(filters))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        return {
+        # 结果较大，直接编码返回，跳过 jsonable_encoder 的逐项转换
+        return FastJSONResponse({
             "message": "搜索成功",
             "results": results
-        }
+        })
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"搜索向量失败: {str(e)}")
 
@@ -80,8 +167,7 @@ async def list_indices():
         for index_file in VECTOR_DIR.glob("*.json"):
             try:
                 # 读取索引文件
-                with open(index_file, "r", encoding="utf-8") as f:
-                    index_data = json.load(f)
+                index_data = load(index_file)
                 
                 # 添加到结果列表
                 indices.append(index_data)
@@ -89,17 +175,22 @@ async def list_indices():
                 # 跳过无法读取的索引文件
                 continue
         
-        return {
+        return FastJSONResponse({
             "message": "获取索引列表成功",
             "indices": indices
-        }
+        })
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取索引列表失败: {str(e)}")
 
 @router.post("/semantic-search-multi")
-async def semantic_search_multiple(query: str = Form(...), index_ids: List[str] = Form(...), top_k: int = Form(5)):
-    """在多个向量索引中搜索相似内容"""
+async def semantic_search_multiple(
+    query: str = Form(...),
+    index_ids: List[str] = Form(...),
+    top_k: int = Form(5),
+    filters: Optional[str] = Form(None)
+):
+    """在多个向量索引中搜索相似内容，filters 为应用于每个索引的JSON过滤表达式"""
     try:
         # 验证是否提供了索引ID
         if not index_ids:
@@ -112,12 +203,98 @@ async def semantic_search_multiple(query: str = Form(...), index_ids: List[str]
                 raise HTTPException(status_code=404, detail=f"找不到向量索引: {index_id}")
         
         # 搜索向量
-        results = semantic_search_multi(query, index_ids, top_k)
+        try:
+            results = await run_in_threadpool(
+                semantic_search_multi, query, index_ids, top_k, filters=parse_filters(filters)
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        return {
+        # 结果较大，直接编码返回，跳过 jsonable_encoder 的逐项转换
+        return FastJSONResponse({
             "message": "搜索成功",
             "results": results
+        })
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"搜索向量失败: {str(e)}")
+
+@router.get("/answer-cache")
+async def get_answer_cache_stats():
+    """获取生成回答的语义缓存统计（当前进程的查找次数、命中率和缓存条目数）"""
+    try:
+        return {
+            "message": "获取回答缓存统计成功",
+            "stats": answer_cache.get_stats()
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取回答缓存统计失败: {str(e)}")
+
+@router.delete("/answer-cache")
+async def clear_answer_cache():
+    """清空生成回答的语义缓存"""
+    try:
+        removed = answer_cache.clear()
+        return {
+            "message": f"已清空回答缓存，删除 {removed} 个条目",
+            "removed": removed
         }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"清空回答缓存失败: {str(e)}")
+
+@router.post("/batch-search")
+async def batch_search_vectors(request: Dict[str, Any] = Body(...)):
+    """
+    批量搜索：一次请求提交多个查询
+    
+    请求体为 {"queries": [...], "index_ids": [...], "top_k": 5, "filters": {...}, "stream": false}。
+    查询按批调用嵌入模型，每个索引按批做一次矩阵搜索，结果与 queries 顺序一致；
+    stream 为 true 时以NDJSON流式返回，每行为 {"query": 序号, "results": [...]}。
+    只返回向量搜索结果，不进行LLM重排序或生成回答。
+    """
+    try:
+        queries = request.get("queries")
+        index_ids = request.get("index_ids")
+        top_k = request.get("top_k", 5)
+        if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+            raise HTTPException(status_code=400, detail="queries 必须是字符串列表")
+        if len(queries) > MAX_BATCH_QUERIES:
+            raise HTTPException(status_code=400, detail=f"单次最多提交 {MAX_BATCH_QUERIES} 个查询")
+        if not isinstance(index_ids, list) or not index_ids:
+            raise HTTPException(status_code=400, detail="未提供索引ID")
+        if isinstance(top_k, bool) or not isinstance(top_k, int) or top_k < 1:
+            raise HTTPException(status_code=400, detail=f"top_k 必须是正整数: {top_k}")
+        
+        # 验证索引是否存在
+        for index_id in index_ids:
+            index_file = VECTOR_DIR / f"{index_id}.json"
+            if not index_file.exists():
+                raise HTTPException(status_code=404, detail=f"找不到向量索引: {index_id}")
+        
+        # 打开索引并解析过滤表达式，错误在开始返回结果之前报告
+        try:
+            results = await run_in_threadpool(
+                iter_batch_search, queries, index_ids, top_k, filters=parse_filters(request.get("filters"))
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        if request.get("stream"):
+            def generate():
+                for position, query_results in enumerate(results):
+                    yield dumps_line({"query": position, "results": query_results})
+            
+            return StreamingResponse(generate(), media_type="application/x-ndjson")
+        
+        # 嵌入和矩阵搜索在线程池中执行，不阻塞事件循环
+        return FastJSONResponse({
+            "message": "批量搜索成功",
+            "results": await run_in_threadpool(list, results)
+        })
         
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"搜索向量失败: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"批量搜索失败: {str(e)}")
@@ -0,0 +1,307 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.config_service import ConfigService
+from app.services.serialization import dump, dumps, load, loads
+
+logger = logging.getLogger(__name__)
+
+# 生成回答的缓存目录，每个条目一个JSON文件，文件修改时间为最近一次命中的时间
+ANSWER_CACHE_DIR = Path("answer_cache")
+ANSWER_CACHE_DIR.mkdir(exist_ok=True)
+
+ENTRY_SUFFIX = ".json"
+
+_lock = threading.Lock()
+# 上次与磁盘同步时缓存目录的修改时间，其他进程写入或删除条目后目录修改时间变化
+_synced_mtime: Optional[int] = None
+# 缓存范围 -> 条目列表；条目包含 id、query、vector、result、index_ids、created_at、last_used
+_scopes: Dict[str, List[Dict[str, Any]]] = {}
+# 缓存范围 -> 归一化后的查询向量矩阵，条目变化时删除，下次查找时重建
+_matrices: Dict[str, Optional[np.ndarray]] = {}
+_stats = {"lookups": 0, "hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+
+def scope_key(index_versions: List[Tuple[str, str]], params: Dict[str, Any]) -> str:
+    """
+    缓存范围：索引版本集合加上影响回答的参数（搜索方式、top_k、过滤条件、嵌入模型、LLM）
+
+    任一索引重建后版本变化，范围随之变化，旧回答不会再被命中。
+    """
+    payload = json.dumps({"indices": sorted(index_versions), "params": params},
+                         ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def _normalize_query(query: str) -> str:
+    return " ".join(query.split()).lower()
+
+
+def _normalize_vector(vector: Optional[np.ndarray]) -> Optional[np.ndarray]:
+    if vector is None:
+        return None
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def _entry_path(entry_id: str) -> Path:
+    return ANSWER_CACHE_DIR / f"{entry_id}{ENTRY_SUFFIX}"
+
+
+def _read_entry(path: Path) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """读取一个条目文件，返回 (缓存范围, 条目)"""
+    try:
+        data = load(path)
+        vector = data.get("vector")
+        return data["scope"], {
+            "id": path.stem,
+            "query": data["query"],
+            "vector": np.asarray(vector, dtype=np.float32) if vector is not None else None,
+            "result": data["result"],
+            "index_ids": data.get("index_ids", []),
+            "created_at": data["created_at"],
+            "last_used": path.stat().st_mtime
+        }
+    except FileNotFoundError:
+        # 读取前已被其他进程删除
+        return None
+    except (OSError, KeyError, ValueError) as e:
+        logger.warning(f"跳过无法读取的回答缓存条目 {path.name}: {str(e)}")
+        return None
+
+
+def _sync():
+    """
+    与磁盘上的缓存条目同步，调用方需持有 _lock
+
+    多个服务进程共用缓存目录：目录修改时间变化时重新列出目录，加载其他进程写入的条目，
+    丢弃已被其他进程删除的条目；目录没有变化时不做任何事。
+    """
+    global _synced_mtime
+    mtime = ANSWER_CACHE_DIR.stat().st_mtime_ns
+    if mtime == _synced_mtime:
+        return
+    first_load = _synced_mtime is None
+    # 先记录修改时间再列出目录，列出期间的变化留到下次同步
+    _synced_mtime = mtime
+    on_disk = {path.stem: path for path in ANSWER_CACHE_DIR.glob(f"*{ENTRY_SUFFIX}")}
+    known = set()
+    for scope in list(_scopes):
+        entries = [entry for entry in _scopes[scope] if entry["id"] in on_disk]
+        known.update(entry["id"] for entry in entries)
+        if len(entries) != len(_scopes[scope]):
+            _matrices.pop(scope, None)
+            if entries:
+                _scopes[scope] = entries
+            else:
+                _scopes.pop(scope)
+    for entry_id, path in on_disk.items():
+        if entry_id in known:
+            continue
+        loaded = _read_entry(path)
+        if loaded is not None:
+            scope, entry = loaded
+            _scopes.setdefault(scope, []).append(entry)
+            _matrices.pop(scope, None)
+    if first_load:
+        logger.info(f"加载回答缓存: {sum(len(entries) for entries in _scopes.values())} 个条目")
+
+
+def _remove(scope: str, entries: List[Dict[str, Any]]):
+    """删除同一范围内的若干条目，调用方需持有 _lock"""
+    ids = {entry["id"] for entry in entries}
+    remaining = [entry for entry in _scopes.get(scope, []) if entry["id"] not in ids]
+    if remaining:
+        _scopes[scope] = remaining
+    else:
+        _scopes.pop(scope, None)
+    _matrices.pop(scope, None)
+    for entry_id in ids:
+        _entry_path(entry_id).unlink(missing_ok=True)
+
+
+def _matrix(scope: str) -> Optional[np.ndarray]:
+    if scope not in _matrices:
+        vectors = [entry["vector"] for entry in _scopes[scope]]
+        _matrices[scope] = np.stack(vectors) if vectors and all(v is not None for v in vectors) else None
+    return _matrices[scope]
+
+
+def lookup(scope: str, query: str, query_vector: Optional[np.ndarray] = None) -> Optional[Dict[str, Any]]:
+    """
+    查找语义相近的已缓存回答
+
+    查询文本规范化后完全相同时直接命中；否则与同一范围内已缓存查询的向量计算余弦相似度，
+    最高的不低于 similarity_threshold 时命中。过期条目在查找时删除。
+
+    Args:
+        scope: scope_key 计算的缓存范围
+        query: 查询文本
+        query_vector: 查询向量，范围内的索引都不使用嵌入模型时为 None，只按文本匹配
+
+    Returns:
+        命中时为 {"result": 缓存的结果, "similarity": 相似度, "cached_query": 缓存的查询, "age_seconds": 缓存时长}，
+        未命中时为 None
+    """
+    config = ConfigService.get_answer_cache_config()
+    vector = _normalize_vector(query_vector)
+    now = time.time()
+    with _lock:
+        _sync()
+        _stats["lookups"] += 1
+        entries = _scopes.get(scope, [])
+        expired = [entry for entry in entries if now - entry["created_at"] > config["ttl_seconds"]]
+        if expired:
+            _stats["expirations"] += len(expired)
+            _remove(scope, expired)
+            entries = _scopes.get(scope, [])
+
+        best, similarity = None, 0.0
+        normalized = _normalize_query(query)
+        for entry in entries:
+            if _normalize_query(entry["query"]) == normalized:
+                best, similarity = entry, 1.0
+                break
+        if best is None and entries and vector is not None:
+            matrix = _matrix(scope)
+            if matrix is not None and matrix.shape[1] == vector.shape[0]:
+                scores = matrix @ vector
+                position = int(np.argmax(scores))
+                if scores[position] >= config["similarity_threshold"]:
+                    best, similarity = entries[position], float(scores[position])
+
+        if best is not None:
+            try:
+                os.utime(_entry_path(best["id"]))
+            except FileNotFoundError:
+                # 条目已被其他进程删除（清空缓存、淘汰或索引重建），不再返回
+                _remove(scope, [best])
+                best = None
+            except OSError:
+                pass
+
+        if best is None:
+            _stats["misses"] += 1
+            return None
+        _stats["hits"] += 1
+        best["last_used"] = now
+    logger.info(f"回答缓存命中: {query!r} -> {best['query']!r}（相似度 {similarity:.4f}）")
+    return {
+        "result": loads(dumps(best["result"])),
+        "similarity": similarity,
+        "cached_query": best["query"],
+        "age_seconds": round(now - best["created_at"], 1)
+    }
+
+
+def store(scope: str, index_ids: List[str], query: str, query_vector: Optional[np.ndarray],
+          result: List[Dict[str, Any]]):
+    """
+    缓存生成的回答，超出 max_entries 时淘汰最久未使用的条目
+
+    Args:
+        scope: 缓存范围
+        index_ids: 生成回答使用的索引，用于索引重建时删除相关条目
+        query: 查询文本
+        query_vector: 查询向量
+        result: 包含直接回答和来源文本的结果列表
+    """
+    config = ConfigService.get_answer_cache_config()
+    vector = _normalize_vector(query_vector)
+    # 先同步已有条目，即将写入的条目在写入后直接加入内存
+    with _lock:
+        _sync()
+    try:
+        # 保存副本，调用方之后修改结果不影响缓存
+        result = loads(dumps(result))
+    except (TypeError, ValueError) as e:
+        logger.warning(f"回答无法序列化，不缓存: {str(e)}")
+        return
+    entry = {
+        "id": uuid.uuid4().hex,
+        "query": query,
+        "vector": vector,
+        "result": result,
+        "index_ids": list(index_ids),
+        "created_at": time.time()
+    }
+    entry["last_used"] = entry["created_at"]
+    data = {**entry, "scope": scope, "vector": vector.tolist() if vector is not None else None}
+    data.pop("id")
+    data.pop("last_used")
+    path = _entry_path(entry["id"])
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    try:
+        dump(data, tmp_path)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        tmp_path.unlink(missing_ok=True)
+        logger.warning(f"写入回答缓存失败: {str(e)}")
+        return
+
+    with _lock:
+        # 其他线程同步时可能已从磁盘加载了该条目
+        entries = _scopes.setdefault(scope, [])
+        if all(item["id"] != entry["id"] for item in entries):
+            entries.append(entry)
+        _matrices.pop(scope, None)
+        _stats["stores"] += 1
+        total = sum(len(entries) for entries in _scopes.values())
+        if total > config["max_entries"]:
+            ranked = sorted(
+                ((item["last_used"], scope_id, item) for scope_id, entries in _scopes.items() for item in entries),
+                key=lambda x: x[0]
+            )
+            evicted: Dict[str, List[Dict[str, Any]]] = {}
+            for _, scope_id, item in ranked[:total - config["max_entries"]]:
+                evicted.setdefault(scope_id, []).append(item)
+            for scope_id, items in evicted.items():
+                _remove(scope_id, items)
+            _stats["evictions"] += total - config["max_entries"]
+
+
+def invalidate_index(index_id: str):
+    """索引重建后删除使用该索引生成的所有回答"""
+    with _lock:
+        _sync()
+        removed = 0
+        for scope_id in list(_scopes):
+            items = [entry for entry in _scopes[scope_id] if index_id in entry["index_ids"]]
+            if items:
+                _remove(scope_id, items)
+                removed += len(items)
+        _stats["invalidations"] += removed
+    if removed:
+        logger.info(f"索引 {index_id} 已变化，删除 {removed} 个回答缓存条目")
+
+
+def clear() -> int:
+    """清空缓存，返回删除的条目数"""
+    with _lock:
+        _sync()
+        removed = 0
+        for scope_id in list(_scopes):
+            removed += len(_scopes[scope_id])
+            _remove(scope_id, list(_scopes[scope_id]))
+    return removed
+
+
+def get_stats() -> Dict[str, Any]:
+    """当前进程的命中统计和缓存条目数"""
+    with _lock:
+        _sync()
+        stats = dict(_stats)
+        stats["entries"] = sum(len(entries) for entries in _scopes.values())
+        stats["scopes"] = len(_scopes)
+    stats["hit_rate"] = round(stats["hits"] / stats["lookups"], 4) if stats["lookups"] else 0.0
+    return stats
@@ -0,0 +1,381 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import tarfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path, PurePosixPath
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from app.services.chunk_store import ChunkStoreWriter, legacy_processed_path, processed_dir
+from app.services.config_service import ConfigService
+from app.services.file_processor import split_text
+from app.services.ingest_cache import load_text_column
+from app.services.selection_log import clear_selection
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = Path("uploads")
+UPLOAD_DIR.mkdir(exist_ok=True)
+
+# 支持的文件类型
+TABLE_FILE_TYPES = ['csv', 'xlsx', 'xls']
+TEXT_FILE_TYPES = ['txt', 'md', 'json']
+
+# 批量上传时会被展开的压缩包
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz")
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def file_type(name: str) -> str:
+    return name.split('.')[-1].lower()
+
+
+def is_supported(name: str) -> bool:
+    return file_type(name) in TABLE_FILE_TYPES + TEXT_FILE_TYPES
+
+
+def is_archive(name: str) -> bool:
+    return name.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def process_file(file_id: str, file_path: Path, file_ext: str, max_chunk_size: int, overlap: int,
+                 text_column: Optional[str] = None, content_hash: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    拆分文件并写入处理结果
+
+    表格文件的解析和清洗结果按内容哈希缓存，重新处理时只读取文本列。
+    content_hash 为已知的文件内容哈希，提供时不再读取整个文件计算。
+    处理结果重写后文本块ID指向新的文本块，该文件已有的选择会被清空。
+
+    Returns:
+        处理结果摘要，表格中没有可拆分的文本列时返回 None
+
+    Raises:
+        ValueError: 表格无法解析或指定的文本列不存在
+    """
+    chunk_params = {"max_chunk_size": max_chunk_size, "overlap": overlap}
+    if file_ext in TABLE_FILE_TYPES:
+        # 解析并清洗表格，相同内容直接读取缓存中的文本列
+        cache_key, table_info, texts = load_text_column(file_path, file_ext, text_column, content_hash)
+        if texts is None:
+            return None
+
+        # 逐行拆分文本列并写入处理结果
+        with ChunkStoreWriter(processed_dir(file_id)) as writer:
+            for idx, value in texts.items():
+                if pd.notna(value):
+                    text = str(value)
+                    writer.add_group(text, split_text(text, max_chunk_size, overlap), row_id=idx)
+            summary = writer.finish({
+                "file_id": file_id,
+                "file_type": file_ext,
+                "text_column": str(texts.name),
+                "text_columns": table_info["text_columns"],
+                "row_count": table_info["row_count"],
+                "content_hash": cache_key,
+                "chunk_params": chunk_params
+            })
+    else:
+        # 处理文本文件
+        with open(file_path, "r", encoding="utf-8") as f:
+            text = f.read()
+
+        with ChunkStoreWriter(processed_dir(file_id)) as writer:
+            writer.add_group(text, split_text(text, max_chunk_size, overlap))
+            summary = writer.finish({"file_id": file_id, "file_type": file_ext, "chunk_params": chunk_params})
+
+    # 旧的选择指向旧的文本块ID
+    clear_selection(file_id)
+    return summary
+
+
+def flat_file_id(relative_path: str) -> str:
+    """
+    目录或压缩包中的相对路径转换为文件ID，各级目录以下划线连接，如 docs/faq.md -> docs_faq.md
+
+    Raises:
+        ValueError: 路径为绝对路径或包含 ..
+    """
+    parts = [part for part in PurePosixPath(relative_path.replace("\\", "/")).parts if part not in ("", ".")]
+    if not parts or relative_path.startswith("/") or ".." in parts:
+        raise ValueError(f"不安全的文件路径: {relative_path}")
+    return "_".join(parts)
+
+
+def _skipped(name: str) -> bool:
+    """隐藏文件和 macOS 压缩时附带的元数据"""
+    return any(part.startswith(".") or part == "__MACOSX" for part in PurePosixPath(name).parts)
+
+
+def collect_directory(directory: Path, recursive: bool = True) -> List[Tuple[str, Path]]:
+    """
+    列出目录中支持的文件
+
+    Returns:
+        按路径排序的 (文件ID, 文件路径) 列表
+    """
+    directory = Path(directory)
+    paths = directory.rglob("*") if recursive else directory.iterdir()
+    items = []
+    for path in sorted(paths):
+        relative = path.relative_to(directory).as_posix()
+        if path.is_file() and is_supported(path.name) and not _skipped(relative):
+            items.append((flat_file_id(relative), path))
+    return items
+
+
+def extract_archive(archive_path: Path, prefix: str = "") -> List[Tuple[str, Path]]:
+    """
+    把压缩包中支持的文件解压到上传目录
+
+    解压前按成员声明的大小检查总量，不超过配置的 max_archive_mb。
+
+    Args:
+        archive_path: zip 或 tar（可 gzip 压缩）文件
+        prefix: 文件ID前缀，通常为压缩包名，避免不同压缩包中的同名文件互相覆盖
+
+    Returns:
+        (文件ID, 解压后的路径) 列表
+
+    Raises:
+        ValueError: 不是支持的压缩包，或解压后超过大小上限
+    """
+    max_bytes = ConfigService.get_bulk_ingest_config()["max_archive_mb"] * 1024 * 1024
+    members = []
+    if zipfile.is_zipfile(archive_path):
+        archive = zipfile.ZipFile(archive_path)
+        for info in archive.infolist():
+            if not info.is_dir() and is_supported(info.filename) and not _skipped(info.filename):
+                members.append((info.filename, info.file_size, lambda info=info: archive.open(info)))
+    elif tarfile.is_tarfile(archive_path):
+        archive = tarfile.open(archive_path)
+        for info in archive.getmembers():
+            if info.isfile() and is_supported(info.name) and not _skipped(info.name):
+                members.append((info.name, info.size, lambda info=info: archive.extractfile(info)))
+    else:
+        raise ValueError(f"无法识别的压缩包: {archive_path.name}")
+
+    with archive:
+        total = sum(size for _, size, _ in members)
+        if total > max_bytes:
+            raise ValueError(f"压缩包 {archive_path.name} 解压后 {total / 1024 / 1024:.1f} MB，超过上限")
+        items = []
+        for name, _, open_member in members:
+            file_id = flat_file_id(f"{prefix}/{name}" if prefix else name)
+            target = UPLOAD_DIR / file_id
+            with open_member() as source, open(target, "wb") as f:
+                shutil.copyfileobj(source, f, COPY_BUFFER_SIZE)
+            items.append((file_id, target))
+    return items
+
+
+def ingest_file(file_id: str, source: str, max_chunk_size: int, overlap: int) -> Dict[str, Any]:
+    """
+    处理单个文件：复制到上传目录（已在上传目录时跳过），解析、清洗、拆分并写入处理结果
+
+    在进程池的工作进程中执行，失败时不抛出异常，而是返回带有错误信息的结果。
+
+    Returns:
+        {"file_id", "status": "ok" 或 "error", "bytes", "seconds", "chunk_count" 或 "error"}
+    """
+    start = time.perf_counter()
+    result: Dict[str, Any] = {"file_id": file_id, "status": "error", "bytes": 0}
+    try:
+        target = UPLOAD_DIR / file_id
+        source_path = Path(source)
+        if source_path.resolve() != target.resolve():
+            shutil.copyfile(source_path, target)
+        result["bytes"] = target.stat().st_size
+        summary = process_file(file_id, target, file_type(file_id), max_chunk_size, overlap)
+        if summary is None:
+            result["error"] = "未找到可拆分的文本列"
+        else:
+            # 删除旧版本的JSON处理结果，避免与新结果混淆
+            legacy_processed_path(file_id).unlink(missing_ok=True)
+            result.update({"status": "ok", "chunk_count": summary["chunk_count"]})
+    except Exception as e:
+        result["error"] = str(e)
+    result["seconds"] = round(time.perf_counter() - start, 4)
+    return result
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def worker_count(workers: Optional[int] = None) -> int:
+    """进程数：参数、配置（0 表示CPU核数）依次生效"""
+    workers = workers or ConfigService.get_bulk_ingest_config()["workers"]
+    return max(1, workers or os.cpu_count() or 1)
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    进程池在多次批量处理之间复用，避免每次重新启动进程和导入 pandas
+
+    使用 spawn 启动工作进程：服务进程中已有其他线程，fork 可能复制被持有的锁。
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_workers = workers
+        return _pool
+
+
+def _discard_pool():
+    """工作进程异常退出后进程池不可再用，下次重新创建"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = None
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = None
+
+
+def iter_ingest(items: List[Tuple[str, Path]], max_chunk_size: int, overlap: int,
+                workers: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """
+    并行处理多个文件，按完成顺序逐个返回进度
+
+    Args:
+        items: (文件ID, 文件路径) 列表
+        max_chunk_size: 文本块最大长度
+        overlap: 相邻文本块的重叠长度
+        workers: 进程数，默认使用配置；为 1 时在当前进程中依次处理
+
+    Yields:
+        每个文件一条 {"event": "file", ...ingest_file 的结果, "done": 已完成数, "total": 总数}，
+        最后一条 {"event": "done", ...统计}，包含每秒处理的文件数和MB数
+    """
+    # 同一文件ID只处理一次（如两个压缩包中有同名文件），否则多个进程会同时写同一个处理结果
+    items = list(dict(items).items())
+    workers = min(worker_count(workers), max(len(items), 1))
+    start = time.perf_counter()
+    tasks = [(file_id, str(path), max_chunk_size, overlap) for file_id, path in items]
+    if workers == 1:
+        results = (ingest_file(*task) for task in tasks)
+    else:
+        pool = _get_pool(workers)
+        futures = {pool.submit(ingest_file, *task): task[0] for task in tasks}
+
+        def _results():
+            for future in as_completed(futures):
+                try:
+                    yield future.result()
+                except BrokenProcessPool as e:
+                    _discard_pool()
+                    yield {"file_id": futures[future], "status": "error", "bytes": 0, "seconds": 0.0,
+                           "error": f"工作进程异常退出: {str(e)}"}
+        results = _results()
+
+    stats = {"succeeded": 0, "failed": 0, "chunk_count": 0, "bytes": 0}
+    for done, result in enumerate(results, 1):
+        if result["status"] == "ok":
+            stats["succeeded"] += 1
+            stats["chunk_count"] += result["chunk_count"]
+        else:
+            stats["failed"] += 1
+            logger.warning(f"批量处理文件 {result['file_id']} 失败: {result['error']}")
+        stats["bytes"] += result["bytes"]
+        yield {"event": "file", **result, "done": done, "total": len(tasks)}
+
+    seconds = time.perf_counter() - start
+    yield {
+        "event": "done",
+        "files": len(tasks),
+        **stats,
+        "workers": workers,
+        "seconds": round(seconds, 3),
+        "files_per_second": round(len(tasks) / seconds, 2) if seconds > 0 else None,
+        "mb_per_second": round(stats["bytes"] / 1024 / 1024 / seconds, 2) if seconds > 0 else None
+    }
+
+
+def build_index(file_ids: List[str], name: str, tags: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    用多个文件的全部文本块创建一个向量索引
+
+    与 /create-index 相同：按配置进行近似去重，否则跳过文本完全相同的文本块；
+    每个文本块的元数据记录其来源文件，搜索时可以按 file_id 过滤。
+
+    Args:
+        file_ids: 已处理的文件ID
+        name: 索引名称，作为索引ID的前缀
+        tags: 附加到每个文本块的自定义标签
+
+    Returns:
+        {"index_id", "chunk_count", "file_count", 近似去重时还有 "dedup"}
+
+    Raises:
+        ValueError: 文件中没有任何文本块
+    """
+    # 建索引依赖嵌入模型等较重的模块，只在需要时导入，工作进程不必加载
+    from app.services.chunk_metadata import build_chunk_metadata
+    from app.services.chunk_store import open_chunk_store
+    from app.services.dedup_service import build_source_map, deduplicate
+    from app.services.vector_service import create_vector_index
+
+    dedup_config = ConfigService.get_dedup_config()
+    texts: List[str] = []
+    chunk_ids: List[str] = []
+    metadata: List[Dict[str, Any]] = []
+    seen = set()
+    for file_id in file_ids:
+        file_chunk_ids = []
+        for chunk_id, text in open_chunk_store(file_id).iter_chunk_texts():
+            if not dedup_config["enabled"]:
+                if text in seen:
+                    continue
+                seen.add(text)
+            file_chunk_ids.append(chunk_id)
+            texts.append(text)
+            chunk_ids.append(f"{file_id}:{chunk_id}")
+        metadata.extend(build_chunk_metadata(file_id, file_chunk_ids, tags))
+    if not texts:
+        raise ValueError("没有可以建立索引的文本块")
+
+    dedup_info = None
+    if dedup_config["enabled"]:
+        result = deduplicate(
+            texts,
+            threshold=dedup_config["threshold"],
+            num_perm=dedup_config["num_perm"],
+            shingle_size=dedup_config["shingle_size"]
+        )
+        dedup_info = {
+            "stats": result.stats(),
+            "source_map": build_source_map(result, texts, chunk_ids)
+        }
+        texts = [texts[i] for i in result.kept_indices]
+        metadata = [metadata[i] for i in result.kept_indices]
+
+    start = time.perf_counter()
+    index_id = create_vector_index(texts, name, use_llm=True, dedup=dedup_info, metadata=metadata)
+    response = {
+        "index_id": index_id,
+        "chunk_count": len(texts),
+        "file_count": len(file_ids),
+        "seconds": round(time.perf_counter() - start, 3)
+    }
+    if dedup_info:
+        response["dedup"] = dedup_info["stats"]
+    return response
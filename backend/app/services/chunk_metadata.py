@@ -0,0 +1,239 @@
+import json
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+
+from app.services.chunk_store import open_chunk_store, parse_chunk_id
+from app.services.serialization import dump, load
+
+logger = logging.getLogger(__name__)
+
+# 元数据表保存在索引版本目录下的子目录
+METADATA_DIR = "metadata"
+SCHEMA_FILE = "schema.json"
+
+# 内置的整数列和类别列，自定义标签以 "tags.<名称>" 作为类别列保存
+INT_COLUMNS = ("row_id", "group", "chunk")
+CATEGORY_COLUMNS = ("file_id", "column")
+TAG_PREFIX = "tags."
+
+# 整数列和类别列中表示缺失值的编码
+MISSING = -1
+
+COMPARISON_OPERATORS = ("$gt", "$gte", "$lt", "$lte")
+OPERATORS = ("$eq", "$ne", "$in", "$nin") + COMPARISON_OPERATORS
+
+
+def build_chunk_metadata(file_id: str, chunk_ids: List[Optional[str]],
+                         tags: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    根据文本块ID从处理结果中整理每个文本块的元数据
+
+    Args:
+        file_id: 文件ID
+        chunk_ids: 文本块ID列表，直接以原文选择的文本为 None
+        tags: 附加到每个文本块的自定义标签
+
+    Returns:
+        与 chunk_ids 一一对应的元数据
+    """
+    try:
+        store = open_chunk_store(file_id)
+        column = store.summary.get("text_column")
+    except FileNotFoundError:
+        store = None
+        column = None
+
+    rows = []
+    for chunk_id in chunk_ids:
+        row = {"file_id": file_id, "column": column}
+        if chunk_id is not None and store is not None:
+            group_index, chunk_index = parse_chunk_id(chunk_id)
+            row_id = int(store.row_ids[group_index])
+            row.update({
+                "group": group_index,
+                "chunk": chunk_index,
+                "row_id": None if row_id == MISSING else row_id
+            })
+        if tags:
+            row["tags"] = tags
+        rows.append(row)
+    return rows
+
+
+def _flatten(row: Dict[str, Any]) -> Dict[str, Any]:
+    flat = {key: value for key, value in row.items() if key != "tags"}
+    for key, value in (row.get("tags") or {}).items():
+        flat[f"{TAG_PREFIX}{key}"] = value
+    return flat
+
+
+def write_metadata(path: Path, rows: List[Dict[str, Any]]):
+    """
+    以列式格式保存元数据
+
+    整数列直接保存为 int64 数组，其余列保存为类别编码数组和类别列表，
+    过滤时按列生成位图，不需要逐行解析。
+
+    Args:
+        path: 输出目录
+        rows: 每行的元数据
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    flat_rows = [_flatten(row) for row in rows]
+    names = sorted({name for row in flat_rows for name in row})
+
+    columns = {}
+    for position, name in enumerate(names):
+        file_name = f"col_{position}.npy"
+        values = [row.get(name) for row in flat_rows]
+        if name in INT_COLUMNS:
+            array = np.array([MISSING if value is None else int(value) for value in values], dtype=np.int64)
+            columns[name] = {"type": "int", "file": file_name}
+        else:
+            categories = sorted({str(value) for value in values if value is not None})
+            codes = {category: code for code, category in enumerate(categories)}
+            array = np.array([MISSING if value is None else codes[str(value)] for value in values], dtype=np.int32)
+            columns[name] = {"type": "category", "file": file_name, "categories": categories}
+        np.save(path / file_name, array)
+
+    dump({"count": len(rows), "columns": columns}, path / SCHEMA_FILE)
+
+
+class MetadataTable:
+    """列式元数据的只读视图，支持按过滤表达式生成行位图"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        schema = load(self.path / SCHEMA_FILE)
+        self.count = int(schema["count"])
+        self.schema = schema["columns"]
+        self._arrays = {
+            name: np.load(self.path / column["file"], mmap_mode="r")
+            for name, column in self.schema.items()
+        }
+        self._codes = {
+            name: {category: code for code, category in enumerate(column["categories"])}
+            for name, column in self.schema.items() if column["type"] == "category"
+        }
+
+    def __len__(self) -> int:
+        return self.count
+
+    def get(self, i: int) -> Dict[str, Any]:
+        """读取第 i 行的元数据，缺失值省略"""
+        row = {}
+        tags = {}
+        for name, column in self.schema.items():
+            value = int(self._arrays[name][i])
+            if value == MISSING:
+                continue
+            if column["type"] == "category":
+                value = column["categories"][value]
+            if name.startswith(TAG_PREFIX):
+                tags[name[len(TAG_PREFIX):]] = value
+            else:
+                row[name] = value
+        if tags:
+            row["tags"] = tags
+        return row
+
+    def evaluate(self, expression: Dict[str, Any]) -> np.ndarray:
+        """
+        计算过滤表达式命中的行
+
+        表达式为字段到条件的映射，多个字段之间为与关系；条件可以是值本身（等于），
+        或 {"$eq"|"$ne"|"$in"|"$nin"|"$gt"|"$gte"|"$lt"|"$lte": 值} 形式的操作符映射。
+        "$and" 和 "$or" 接受子表达式列表。自定义标签以 "tags.<名称>" 引用。
+
+        Raises:
+            ValueError: 表达式不合法
+
+        Returns:
+            长度为行数的布尔数组
+        """
+        if not isinstance(expression, dict):
+            raise ValueError("过滤表达式必须是JSON对象")
+        mask = np.ones(self.count, dtype=bool)
+        for key, condition in expression.items():
+            if key in ("$and", "$or"):
+                if not isinstance(condition, list) or not condition:
+                    raise ValueError(f"{key} 需要非空的子表达式列表")
+                masks = [self.evaluate(sub) for sub in condition]
+                mask &= np.logical_and.reduce(masks) if key == "$and" else np.logical_or.reduce(masks)
+            elif key.startswith("$"):
+                raise ValueError(f"不支持的过滤操作符: {key}")
+            else:
+                mask &= self._evaluate_field(key, condition)
+        return mask
+
+    def _evaluate_field(self, name: str, condition: Any) -> np.ndarray:
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        column = self.schema.get(name)
+        if column is None and name not in INT_COLUMNS + CATEGORY_COLUMNS and not name.startswith(TAG_PREFIX):
+            raise ValueError(f"未知的过滤字段: {name}")
+
+        mask = np.ones(self.count, dtype=bool)
+        for operator, value in condition.items():
+            if operator not in OPERATORS:
+                raise ValueError(f"不支持的过滤操作符: {operator}")
+            if operator in ("$in", "$nin") and not isinstance(value, list):
+                raise ValueError(f"{operator} 需要值列表: {name}")
+
+            if column is not None and column["type"] == "category" and operator in COMPARISON_OPERATORS:
+                raise ValueError(f"字段 {name} 不支持大小比较")
+            values = self._arrays[name] if column is not None else np.full(self.count, MISSING, dtype=np.int64)
+
+            if operator == "$eq":
+                mask &= values == self._encode(name, value)
+            elif operator == "$ne":
+                mask &= values != self._encode(name, value)
+            elif operator == "$in":
+                mask &= np.isin(values, [self._encode(name, v) for v in value])
+            elif operator == "$nin":
+                mask &= ~np.isin(values, [self._encode(name, v) for v in value])
+            else:
+                if value is None:
+                    raise ValueError(f"{operator} 不能与 null 比较: {name}")
+                bound = self._encode(name, value)
+                present = values != MISSING
+                if operator == "$gt":
+                    mask &= present & (values > bound)
+                elif operator == "$gte":
+                    mask &= present & (values >= bound)
+                elif operator == "$lt":
+                    mask &= present & (values < bound)
+                else:
+                    mask &= present & (values <= bound)
+        return mask
+
+    def _encode(self, name: str, value: Any) -> Union[int, float]:
+        """将过滤值转换为列中的编码，不存在的类别编码为不会出现的值"""
+        if value is None:
+            return MISSING
+        column = self.schema.get(name)
+        if column is None:
+            return MISSING - 1
+        if column["type"] == "int":
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValueError(f"字段 {name} 需要数值: {value}")
+            return value
+        return self._codes[name].get(str(value), MISSING - 1)
+
+
+def parse_filters(filters: Union[str, Dict[str, Any], None]) -> Optional[Dict[str, Any]]:
+    """解析请求中的过滤表达式，空表达式返回 None"""
+    if filters is None or filters == "":
+        return None
+    if isinstance(filters, str):
+        try:
+            filters = json.loads(filters)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"过滤表达式不是合法的JSON: {str(e)}")
+    if not isinstance(filters, dict):
+        raise ValueError("过滤表达式必须是JSON对象")
+    return filters or None
@@ -0,0 +1,302 @@
+import logging
+import mmap
+import os
+import shutil
+import uuid
+from array import array
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.serialization import dump, load
+
+logger = logging.getLogger(__name__)
+
+# 上传目录
+UPLOAD_DIR = Path("uploads")
+UPLOAD_DIR.mkdir(exist_ok=True)
+
+# 处理结果格式版本号，格式变化时递增
+CHUNK_STORE_VERSION = 1
+
+SUMMARY_FILE = "summary.json"
+CHUNKS_FILE = "chunks.bin"
+CHUNK_OFFSETS_FILE = "chunk_offsets.npy"
+ORIGINALS_FILE = "originals.bin"
+ORIGINAL_OFFSETS_FILE = "original_offsets.npy"
+GROUP_OFFSETS_FILE = "group_offsets.npy"
+ROW_IDS_FILE = "row_ids.npy"
+
+# 没有行号的文本组（如纯文本文件）
+NO_ROW_ID = -1
+
+# 已打开的处理结果：file_id -> (summary.json 修改时间, ChunkStore)
+_open_stores: Dict[str, Tuple[float, "ChunkStore"]] = {}
+
+
+def processed_dir(file_id: str) -> Path:
+    return UPLOAD_DIR / f"processed_{file_id}"
+
+
+def legacy_processed_path(file_id: str) -> Path:
+    """旧版本使用的整体JSON处理结果"""
+    return UPLOAD_DIR / f"processed_{file_id}.json"
+
+
+def make_chunk_id(group_index: int, chunk_index: int) -> str:
+    """文本块ID：拆分结果中的组序号和块序号"""
+    return f"{group_index}:{chunk_index}"
+
+
+def parse_chunk_id(chunk_id: str) -> Tuple[int, int]:
+    group_index, chunk_index = chunk_id.split(":", 1)
+    return int(group_index), int(chunk_index)
+
+
+class ChunkStoreWriter:
+    """
+    流式写入处理结果
+
+    原始文本和文本块分别拼接为二进制文件并记录偏移表，另存每组的首个文本块序号和行号，
+    读取时可以按文本块或文本组随机访问，而不必解析整个文件。
+    先写入唯一命名的临时目录，完成后整体替换，读者不会看到写了一半的结果，同一文件的多次写入互不干扰。
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._tmp_path = self.path.with_name(f"{self.path.name}.{uuid.uuid4().hex[:8]}.tmp")
+        self._tmp_path.mkdir(parents=True)
+
+        self._chunks_file = open(self._tmp_path / CHUNKS_FILE, "wb")
+        self._originals_file = open(self._tmp_path / ORIGINALS_FILE, "wb")
+        self._chunk_offsets = array("q", [0])
+        self._original_offsets = array("q", [0])
+        self._group_offsets = array("q", [0])
+        self._row_ids = array("q")
+        self._total_chars = 0
+        self._max_chunk_chars = 0
+
+    def __enter__(self) -> "ChunkStoreWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+
+    def add_group(self, original_text: str, chunks: List[str], row_id: Optional[int] = None):
+        """写入一组原始文本及其拆分后的文本块"""
+        data = original_text.encode("utf-8")
+        self._originals_file.write(data)
+        self._original_offsets.append(self._original_offsets[-1] + len(data))
+
+        for chunk in chunks:
+            data = chunk.encode("utf-8")
+            self._chunks_file.write(data)
+            self._chunk_offsets.append(self._chunk_offsets[-1] + len(data))
+            self._total_chars += len(chunk)
+            self._max_chunk_chars = max(self._max_chunk_chars, len(chunk))
+
+        self._group_offsets.append(self._group_offsets[-1] + len(chunks))
+        self._row_ids.append(NO_ROW_ID if row_id is None else int(row_id))
+
+    def finish(self, summary_extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """写入偏移表和摘要，并发布到目标目录"""
+        self._chunks_file.close()
+        self._originals_file.close()
+        np.save(self._tmp_path / CHUNK_OFFSETS_FILE, np.frombuffer(self._chunk_offsets, dtype=np.int64))
+        np.save(self._tmp_path / ORIGINAL_OFFSETS_FILE, np.frombuffer(self._original_offsets, dtype=np.int64))
+        np.save(self._tmp_path / GROUP_OFFSETS_FILE, np.frombuffer(self._group_offsets, dtype=np.int64))
+        np.save(self._tmp_path / ROW_IDS_FILE, np.frombuffer(self._row_ids, dtype=np.int64))
+
+        chunk_count = len(self._chunk_offsets) - 1
+        summary = {
+            "version": CHUNK_STORE_VERSION,
+            "created_at": datetime.now().isoformat(),
+            "group_count": len(self._row_ids),
+            "chunk_count": chunk_count,
+            "total_chars": self._total_chars,
+            "avg_chunk_chars": round(self._total_chars / chunk_count, 1) if chunk_count else 0,
+            "max_chunk_chars": self._max_chunk_chars,
+            **(summary_extra or {})
+        }
+        dump(summary, self._tmp_path / SUMMARY_FILE)
+
+        self._publish()
+        return summary
+
+    def _publish(self):
+        """
+        旧目录先改名移开，新目录改名到位后再删除旧目录
+
+        改名不复制数据，目标目录不存在的时间很短；已打开的读者继续读取移开的旧文件。
+        另一个写入者同时发布时重试，最后完成的结果生效。
+        """
+        for _ in range(10):
+            old_path = self.path.with_name(f"{self.path.name}.{uuid.uuid4().hex[:8]}.old")
+            try:
+                os.rename(self.path, old_path)
+            except FileNotFoundError:
+                old_path = None
+            try:
+                os.rename(self._tmp_path, self.path)
+            except OSError:
+                # 另一个写入者在此期间发布了结果，目标目录非空
+                if old_path is not None:
+                    shutil.rmtree(old_path, ignore_errors=True)
+                continue
+            if old_path is not None:
+                shutil.rmtree(old_path, ignore_errors=True)
+            return
+        raise RuntimeError(f"无法发布处理结果: {self.path}")
+
+    def abort(self):
+        self._chunks_file.close()
+        self._originals_file.close()
+        shutil.rmtree(self._tmp_path, ignore_errors=True)
+
+
+def _open_blob(path: Path):
+    """只读内存映射打开二进制文件，空文件返回空字节串"""
+    if path.stat().st_size == 0:
+        return b""
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class ChunkStore:
+    """处理结果的只读视图，按文本块或文本组随机访问"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.summary = load(self.path / SUMMARY_FILE)
+        self.chunk_offsets = np.load(self.path / CHUNK_OFFSETS_FILE, mmap_mode="r")
+        self.original_offsets = np.load(self.path / ORIGINAL_OFFSETS_FILE, mmap_mode="r")
+        self.group_offsets = np.load(self.path / GROUP_OFFSETS_FILE, mmap_mode="r")
+        self.row_ids = np.load(self.path / ROW_IDS_FILE, mmap_mode="r")
+        self._chunks = _open_blob(self.path / CHUNKS_FILE)
+        self._originals = _open_blob(self.path / ORIGINALS_FILE)
+
+    @property
+    def chunk_count(self) -> int:
+        return len(self.chunk_offsets) - 1
+
+    @property
+    def group_count(self) -> int:
+        return len(self.row_ids)
+
+    def close(self):
+        for blob in (self._chunks, self._originals):
+            if isinstance(blob, mmap.mmap):
+                blob.close()
+
+    def get_text(self, index: int) -> str:
+        """按全局序号读取文本块"""
+        return bytes(self._chunks[int(self.chunk_offsets[index]):int(self.chunk_offsets[index + 1])]).decode("utf-8")
+
+    def group_of(self, index: int) -> int:
+        """全局序号对应的文本组"""
+        return int(np.searchsorted(self.group_offsets, index, side="right")) - 1
+
+    def index_of(self, chunk_id: str) -> int:
+        """文本块ID对应的全局序号"""
+        group_index, chunk_index = parse_chunk_id(chunk_id)
+        if not 0 <= group_index < self.group_count:
+            raise KeyError(chunk_id)
+        index = int(self.group_offsets[group_index]) + chunk_index
+        if not 0 <= chunk_index or index >= int(self.group_offsets[group_index + 1]):
+            raise KeyError(chunk_id)
+        return index
+
+    def get_chunk(self, index: int, group_index: Optional[int] = None) -> Dict[str, Any]:
+        """读取文本块及其来源信息"""
+        if group_index is None:
+            group_index = self.group_of(index)
+        chunk_index = index - int(self.group_offsets[group_index])
+        row_id = int(self.row_ids[group_index])
+        return {
+            "id": make_chunk_id(group_index, chunk_index),
+            "group": group_index,
+            "chunk": chunk_index,
+            "row_id": None if row_id == NO_ROW_ID else row_id,
+            "text": self.get_text(index)
+        }
+
+    def iter_chunks(self, start: int = 0, end: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """顺序遍历 [start, end) 范围内的文本块"""
+        end = self.chunk_count if end is None else min(end, self.chunk_count)
+        if start >= end:
+            return
+        group_index = self.group_of(start)
+        for index in range(start, end):
+            while index >= int(self.group_offsets[group_index + 1]):
+                group_index += 1
+            yield self.get_chunk(index, group_index)
+
+    def iter_chunk_ids(self) -> Iterator[str]:
+        """顺序遍历所有文本块ID，不解码文本"""
+        for group_index in range(self.group_count):
+            count = int(self.group_offsets[group_index + 1]) - int(self.group_offsets[group_index])
+            for chunk_index in range(count):
+                yield make_chunk_id(group_index, chunk_index)
+
+    def iter_chunk_texts(self) -> Iterator[Tuple[str, str]]:
+        """顺序遍历所有 (文本块ID, 文本)"""
+        for chunk in self.iter_chunks():
+            yield chunk["id"], chunk["text"]
+
+    def get_group(self, group_index: int) -> Dict[str, Any]:
+        """读取一组原始文本及其全部文本块"""
+        if not 0 <= group_index < self.group_count:
+            raise IndexError(group_index)
+        start, end = int(self.group_offsets[group_index]), int(self.group_offsets[group_index + 1])
+        row_id = int(self.row_ids[group_index])
+        original = self._originals[int(self.original_offsets[group_index]):int(self.original_offsets[group_index + 1])]
+        return {
+            "group": group_index,
+            "row_id": None if row_id == NO_ROW_ID else row_id,
+            "original_text": bytes(original).decode("utf-8"),
+            "chunks": [chunk["text"] for chunk in self.iter_chunks(start, end)]
+        }
+
+
+def _migrate_legacy(file_id: str):
+    """将旧版JSON处理结果转换为可随机访问的格式"""
+    split_results = load(legacy_processed_path(file_id))
+    with ChunkStoreWriter(processed_dir(file_id)) as writer:
+        for group in split_results:
+            writer.add_group(group.get("original_text", ""), group.get("chunks", []), group.get("row_id"))
+        writer.finish({"file_id": file_id, "migrated_from": "json"})
+    legacy_processed_path(file_id).unlink()
+    logger.info(f"已将旧版处理结果转换为新格式: {file_id}")
+
+
+def processed_exists(file_id: str) -> bool:
+    return (processed_dir(file_id) / SUMMARY_FILE).exists() or legacy_processed_path(file_id).exists()
+
+
+def processed_mtime(file_id: str) -> float:
+    """处理结果的修改时间，重新上传后会变化"""
+    return (processed_dir(file_id) / SUMMARY_FILE).stat().st_mtime
+
+
+def open_chunk_store(file_id: str) -> ChunkStore:
+    """
+    打开文件的处理结果，同一版本只打开一次
+
+    Raises:
+        FileNotFoundError: 文件尚未处理
+    """
+    if not (processed_dir(file_id) / SUMMARY_FILE).exists():
+        if not legacy_processed_path(file_id).exists():
+            raise FileNotFoundError(f"找不到处理结果文件: {file_id}")
+        _migrate_legacy(file_id)
+
+    mtime = processed_mtime(file_id)
+    cached = _open_stores.get(file_id)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    store = ChunkStore(processed_dir(file_id))
+    _open_stores[file_id] = (mtime, store)
+    return store
@@ -0,0 +1,318 @@
+import logging
+import mmap
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:  # zstd 压缩为可选功能
+    zstandard = None
+
+from app.services.serialization import dump, load
+
+logger = logging.getLogger(__name__)
+
+# 紧凑格式版本号，格式变化时递增
+COMPACT_FORMAT_VERSION = 1
+
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.npy"
+SCALES_FILE = "scales.npy"
+OFFSETS_FILE = "offsets.npy"
+TEXTS_FILE = "texts.bin"
+DICT_FILE = "texts.dict"
+
+QUANTIZATIONS = ("float32", "float16", "int8")
+COMPRESSIONS = ("none", "zstd")
+
+# 搜索时每次反量化的向量行数，限制临时内存占用
+SEARCH_BLOCK_ROWS = 65536
+
+# 过滤命中比例高于该值时仍按连续块扫描并屏蔽未命中的行，低于该值时只读取命中的行
+DENSE_MASK_RATIO = 0.25
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2归一化，使内积等于余弦相似度"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def quantize(vectors: np.ndarray, quantization: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    标量量化向量
+
+    Args:
+        vectors: float32 向量矩阵
+        quantization: float32、float16 或 int8
+
+    Returns:
+        (量化后的矩阵, int8 量化时每行的缩放系数)
+    """
+    if quantization == "float32":
+        return vectors.astype(np.float32), None
+    if quantization == "float16":
+        return vectors.astype(np.float16), None
+    if quantization == "int8":
+        # 按行对称量化，缩放系数为每行绝对值最大值
+        scales = np.abs(vectors).max(axis=1).astype(np.float32)
+        scales[scales == 0] = 1.0
+        quantized = np.round(vectors / scales[:, None] * 127).astype(np.int8)
+        return quantized, scales / 127
+    raise ValueError(f"不支持的量化方式: {quantization}")
+
+
+def _train_dictionary(encoded: List[bytes]) -> Optional[bytes]:
+    """用部分文本训练zstd字典，短文本单独压缩时字典能显著提升压缩率"""
+    samples = encoded[:: max(1, len(encoded) // 2000)][:2000]
+    if len(samples) < 8:
+        return None
+    try:
+        return zstandard.train_dictionary(64 * 1024, samples).as_bytes()
+    except Exception as e:
+        logger.warning(f"训练zstd字典失败，不使用字典: {str(e)}")
+        return None
+
+
+def write_text_store(path: Path, texts: List[str], compression: str = "none") -> str:
+    """
+    将文本逐条编码（可选zstd压缩）后拼接为一个二进制文件，并保存偏移表
+
+    Args:
+        path: 输出目录
+        texts: 文本列表
+        compression: none 或 zstd
+
+    Returns:
+        实际使用的压缩方式，未安装zstandard时为 none
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"不支持的压缩方式: {compression}")
+    if compression == "zstd" and zstandard is None:
+        logger.warning("未安装zstandard，文本不压缩")
+        compression = "none"
+
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+
+    encoded = [text.encode("utf-8") for text in texts]
+    if compression == "zstd":
+        dictionary = _train_dictionary(encoded)
+        if dictionary:
+            (path / DICT_FILE).write_bytes(dictionary)
+            compressor = zstandard.ZstdCompressor(level=3, dict_data=zstandard.ZstdCompressionDict(dictionary))
+        else:
+            compressor = zstandard.ZstdCompressor(level=3)
+        encoded = [compressor.compress(data) for data in encoded]
+
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    with open(path / TEXTS_FILE, "wb") as f:
+        position = 0
+        for i, data in enumerate(encoded):
+            f.write(data)
+            position += len(data)
+            offsets[i + 1] = position
+    np.save(path / OFFSETS_FILE, offsets)
+    return compression
+
+
+class TextStore:
+    """write_text_store 输出的只读视图，偏移表和文本通过内存映射按需读取"""
+
+    def __init__(self, path: Path, compression: str = "none"):
+        self.path = Path(path)
+        self.offsets = np.load(self.path / OFFSETS_FILE, mmap_mode="r")
+
+        self._texts_file = open(self.path / TEXTS_FILE, "rb")
+        size = (self.path / TEXTS_FILE).stat().st_size
+        self._texts = mmap.mmap(self._texts_file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+        self._decompressor = None
+        if compression == "zstd":
+            if zstandard is None:
+                raise ImportError("读取zstd压缩的索引需要安装zstandard")
+            dict_file = self.path / DICT_FILE
+            dict_data = zstandard.ZstdCompressionDict(dict_file.read_bytes()) if dict_file.exists() else None
+            self._decompressor = zstandard.ZstdDecompressor(dict_data=dict_data)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def close(self):
+        if isinstance(self._texts, mmap.mmap):
+            self._texts.close()
+        self._texts_file.close()
+
+    def get_text(self, i: int) -> str:
+        """解码第 i 条文本"""
+        data = self._texts[int(self.offsets[i]):int(self.offsets[i + 1])]
+        if self._decompressor is not None:
+            data = self._decompressor.decompress(data)
+        return bytes(data).decode("utf-8")
+
+    def get_texts(self, indices: List[int]) -> List[str]:
+        return [self.get_text(i) for i in indices]
+
+
+def write_compact_index(path: Path, vectors: np.ndarray, texts: List[str],
+                        quantization: str = "float16", compression: str = "none",
+                        manifest_extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    以紧凑格式持久化向量和文本
+
+    向量归一化后量化保存为 .npy，文本逐条编码（可选zstd压缩）后拼接为一个二进制文件，
+    另存一张偏移表，读取时可以只解码命中的文本。
+
+    Args:
+        path: 输出目录
+        vectors: (n, d) 的向量矩阵
+        texts: 与向量一一对应的文本
+        quantization: 向量量化方式
+        compression: 文本压缩方式，none 或 zstd
+        manifest_extra: 额外写入清单的信息
+
+    Returns:
+        清单内容
+    """
+    if len(vectors) != len(texts):
+        raise ValueError(f"向量数量({len(vectors)})与文本数量({len(texts)})不一致")
+
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    vectors = _normalize(vectors.reshape(len(texts), -1)) if texts else vectors.reshape(0, 0)
+    quantized, scales = quantize(vectors, quantization)
+    np.save(path / VECTORS_FILE, quantized)
+    if scales is not None:
+        np.save(path / SCALES_FILE, scales)
+
+    compression = write_text_store(path, texts, compression)
+
+    manifest = {
+        "format": "compact",
+        "version": COMPACT_FORMAT_VERSION,
+        "count": len(texts),
+        "dimension": int(vectors.shape[1]) if len(texts) else 0,
+        "quantization": quantization,
+        "compression": compression,
+        "metric": "cosine",
+        **(manifest_extra or {})
+    }
+    dump(manifest, path / MANIFEST_FILE)
+    return manifest
+
+
+class CompactIndex:
+    """
+    紧凑格式索引的只读视图
+
+    向量和偏移表通过内存映射按需读取，文本只在取用时解码，
+    因此打开索引几乎不耗时，多个进程可共享操作系统页缓存。
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.manifest = load(self.path / MANIFEST_FILE)
+        if self.manifest.get("version", 0) > COMPACT_FORMAT_VERSION:
+            raise ValueError(f"不支持的紧凑索引版本: {self.manifest.get('version')}")
+
+        self.vectors = np.load(self.path / VECTORS_FILE, mmap_mode="r")
+        scales_file = self.path / SCALES_FILE
+        self.scales = np.load(scales_file, mmap_mode="r") if scales_file.exists() else None
+        self.texts = TextStore(self.path, self.manifest.get("compression", "none"))
+
+    def __len__(self) -> int:
+        return int(self.manifest["count"])
+
+    @property
+    def dimension(self) -> int:
+        return int(self.manifest["dimension"])
+
+    def close(self):
+        self.texts.close()
+
+    def get_text(self, i: int) -> str:
+        """解码第 i 条文本"""
+        return self.texts.get_text(i)
+
+    def get_texts(self, indices: List[int]) -> List[str]:
+        return self.texts.get_texts(indices)
+
+    def get_vectors(self, start: int, end: int) -> np.ndarray:
+        """反量化 [start, end) 行的向量"""
+        block = np.asarray(self.vectors[start:end], dtype=np.float32)
+        if self.scales is not None:
+            block *= np.asarray(self.scales[start:end], dtype=np.float32)[:, None]
+        return block
+
+    def get_rows(self, ids: np.ndarray) -> np.ndarray:
+        """反量化指定行的向量，只读取这些行"""
+        block = np.asarray(self.vectors[ids], dtype=np.float32)
+        if self.scales is not None:
+            block *= np.asarray(self.scales[ids], dtype=np.float32)[:, None]
+        return block
+
+    def search(self, queries: np.ndarray, top_k: int = 5,
+               mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        精确的余弦相似度搜索
+
+        Args:
+            queries: (d,) 或 (nq, d) 的查询向量
+            top_k: 每个查询返回的结果数
+            mask: 可选的行位图，只在命中的行中搜索
+
+        Returns:
+            (相似度, 行号)，形状均为 (nq, k)，按相似度降序
+        """
+        queries = _normalize(np.atleast_2d(queries))
+        selected = None
+        k = min(top_k, len(self))
+        if mask is not None:
+            mask = np.asarray(mask, dtype=bool)
+            selected = np.flatnonzero(mask)
+            k = min(top_k, len(selected))
+            if len(selected) >= len(self) * DENSE_MASK_RATIO:
+                # 命中的行较多时，随机读取比顺序扫描更慢
+                selected = None
+        n = len(self) if selected is None else len(selected)
+        if k == 0:
+            return np.zeros((len(queries), 0), dtype=np.float32), np.zeros((len(queries), 0), dtype=np.int64)
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_ids = np.zeros((len(queries), 0), dtype=np.int64)
+
+        for start in range(0, n, SEARCH_BLOCK_ROWS):
+            end = min(start + SEARCH_BLOCK_ROWS, n)
+            if selected is None:
+                block_ids = np.arange(start, end)
+                scores = queries @ self.get_vectors(start, end).T
+                if mask is not None:
+                    scores[:, ~mask[start:end]] = -np.inf
+            else:
+                block_ids = selected[start:end]
+                scores = queries @ self.get_rows(block_ids).T
+            ids = np.broadcast_to(block_ids, scores.shape)
+            # 与当前最优结果合并后只保留前 k 个
+            scores = np.concatenate([best_scores, scores], axis=1)
+            ids = np.concatenate([best_ids, ids], axis=1)
+            if scores.shape[1] > k:
+                keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, keep, axis=1)
+                ids = np.take_along_axis(ids, keep, axis=1)
+            best_scores, best_ids = scores, ids
+
+        order = np.argsort(-best_scores, axis=1)
+        return np.take_along_axis(best_scores, order, axis=1), np.take_along_axis(best_ids, order, axis=1)
+
+
+def directory_size(path: Path) -> int:
+    """目录下所有文件的总字节数"""
+    path = Path(path)
+    if path.is_file():
+        return path.stat().st_size
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
@@ -1,7 +1,8 @@
-import json
 import os
 from pathlib import Path
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
+
+from app.services.serialization import dump, load
 
 # 配置文件目录
 DATA_DIR = Path("data")
@@ -10,9 +11,14 @@ DATA_DIR.mkdir(exist_ok=True)
 # 配置文件路径
 CONFIG_FILE = DATA_DIR / "llm_config.json"
 
+# 准入控制配置缓存：(配置文件修改时间, 配置)，每次远程调用和搜索请求都会读取，不能每次解析配置文件
+_resilience_cache: Optional[Tuple[int, Dict[str, Any]]] = None
+
 # 默认配置
 DEFAULT_CONFIG = {
     "llm_type": "siliconflow",
+    # 嵌入模型类型，为空时跟随 llm_type
+    "embedding_type": "",
     "openai": {
         "api_key": "",
         "api_base": "https://api.openai.com/v1",
@@ -30,6 +36,94 @@ DEFAULT_CONFIG = {
         "completion_api_base": "https://api.siliconflow.cn/v1/chat/completions",
         "embedding_model": "BAAI/bge-large-zh-v1.5",
         "completion_model": "Qwen/QwQ-32B"
+    },
+    "openai_compatible": {
+        "api_key": "",
+        "api_base": "http://localhost:8080/v1",
+        "embedding_model": "bge-large-zh-v1.5",
+        "embed_batch_size": 64
+    },
+    "local": {
+        "embedding_model": "hashing-char-ngram",
+        "embedding_dim": 1024,
+        "embed_batch_size": 256
+    },
+    # 索引持久化格式：llamaindex 为原有JSON格式，compact 为量化向量加二进制文本存储，
+    # faiss 为FAISS原生二进制格式，搜索时内存映射打开，多个worker共享一份页缓存
+    "index_storage": {
+        "format": "llamaindex",
+        "quantization": "float16",
+        "compression": "none"
+    },
+    # 建索引前的近似去重：相似度不低于阈值的文本块只嵌入一次
+    "dedup": {
+        "enabled": False,
+        "threshold": 0.9,
+        "num_perm": 64,
+        "shingle_size": 5
+    },
+    # 表格文件解析和清洗结果的缓存：按文件内容哈希以Parquet格式保存，重新处理时只读取文本列
+    "ingest_cache": {
+        "enabled": True,
+        "max_size_mb": 2048
+    },
+    # 回答生成的上下文组装：去除文本块间的重叠，按相关性填充词元预算，排名靠后的片段只保留最相关的句子
+    "context_packing": {
+        "enabled": True,
+        "max_tokens": 3000,
+        "min_overlap_chars": 20,
+        "truncate_sentences": True,
+        "full_chunks": 3,
+        "max_sentences": 3,
+        # 用于估算节省时间的LLM预填充速度（词元/秒）
+        "prefill_tokens_per_second": 1500
+    },
+    # 生成回答的语义缓存：相同索引版本下查询向量的余弦相似度不低于阈值时直接返回缓存的回答
+    "answer_cache": {
+        "enabled": True,
+        "similarity_threshold": 0.95,
+        "ttl_seconds": 86400,
+        "max_entries": 1000
+    },
+    # 远程模型调用的准入控制：请求截止时间、有界并发与排队、熔断；llm_ 和 embedding_ 前缀的配置项分别作用于LLM和嵌入模型
+    "resilience": {
+        "enabled": True,
+        "request_timeout_seconds": 30,
+        "queue_timeout_seconds": 5,
+        "failure_threshold": 5,
+        "reset_seconds": 30,
+        "llm_max_concurrency": 4,
+        "llm_max_queue": 16,
+        "llm_call_timeout_seconds": 20,
+        "llm_slow_call_seconds": 10,
+        "embedding_max_concurrency": 16,
+        "embedding_max_queue": 64,
+        "embedding_call_timeout_seconds": 10,
+        "embedding_slow_call_seconds": 1
+    },
+    # 按需采样分析：默认采样间隔、单次捕获的时间和请求数上限（管理员令牌见环境变量 PROFILER_ADMIN_TOKEN）
+    "profiling": {
+        "interval_ms": 5,
+        "max_seconds": 300,
+        "max_requests": 1000,
+        "top_functions": 30
+    },
+    # 批量上传：并行处理的进程数（0 为CPU核数）、单次最多文件数、压缩包解压后的大小上限
+    "bulk_ingest": {
+        "workers": 0,
+        "max_files": 1000,
+        "max_archive_mb": 2048
+    },
+    # 分片索引：compact 和 faiss 格式建索引时按行拆分为 shards 个分片（1 为不拆分）；workers 为分片服务进程地址，
+    # 第 i 个分片由 workers[i % len(workers)] 搜索，为空时在本进程中依次搜索各分片；
+    # 每个分片的调用超时、部分分片失败时是否返回其余分片的结果、单个服务进程的熔断阈值和熔断时间
+    "sharding": {
+        "shards": 1,
+        "workers": [],
+        "timeout_seconds": 2,
+        "allow_partial": True,
+        "failure_threshold": 3,
+        "reset_seconds": 10
     }
 }
 
@@ -46,8 +140,7 @@ class ConfigService:
             return DEFAULT_CONFIG
         
         try:
-            with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-                config = json.load(f)
+            config = load(CONFIG_FILE)
             return config
         except Exception as e:
             print(f"读取配置文件失败: {str(e)}，使用默认配置")
@@ -56,9 +149,10 @@ class ConfigService:
     @staticmethod
     def save_config(config: Dict[str, Any]) -> bool:
         """保存配置信息"""
+        global _resilience_cache
         try:
-            with open(CONFIG_FILE, "w", encoding="utf-8") as f:
-                json.dump(config, f, ensure_ascii=False, indent=2)
+            _resilience_cache = None
+            dump(config, CONFIG_FILE, indent=True)
             return True
         except Exception as e:
             print(f"保存配置文件失败: {str(e)}")
@@ -95,10 +189,21 @@ class ConfigService:
         return llm_type.lower() != "none"
     
     @staticmethod
-    def get_embedding_config() -> Dict[str, Any]:
+    def get_embedding_type() -> str:
+        """获取当前使用的嵌入模型类型，未单独配置时跟随LLM类型"""
+        config = ConfigService.get_config()
+        return config.get("embedding_type") or config.get("llm_type", "siliconflow")
+    
+    @staticmethod
+    def is_embedding_enabled() -> bool:
+        """检查是否启用了嵌入模型"""
+        return ConfigService.get_embedding_type().lower() != "none"
+    
+    @staticmethod
+    def get_embedding_config(embedding_type: Optional[str] = None) -> Dict[str, Any]:
         """获取嵌入模型配置"""
         config = ConfigService.get_config()
-        llm_type = config.get("llm_type", "siliconflow")
+        llm_type = (embedding_type or ConfigService.get_embedding_type()).lower()
         
         if llm_type == "siliconflow":
             return {
@@ -118,8 +223,92 @@ class ConfigService:
                 "api_base": config["huggingface"]["api_base"],
                 "api_key": config["huggingface"]["api_key"]
             }
+        elif llm_type == "openai_compatible":
+            section = config.get("openai_compatible", DEFAULT_CONFIG["openai_compatible"])
+            return {
+                "model_name": section["embedding_model"],
+                "api_base": section["api_base"],
+                "api_key": section.get("api_key", ""),
+                "embed_batch_size": section.get("embed_batch_size", 64)
+            }
+        elif llm_type == "local":
+            section = config.get("local", DEFAULT_CONFIG["local"])
+            return {
+                "model_name": section.get("embedding_model", "hashing-char-ngram"),
+                "embedding_dim": section.get("embedding_dim", 1024),
+                "embed_batch_size": section.get("embed_batch_size", 256)
+            }
         else:
-            raise ValueError(f"不支持的LLM类型: {llm_type}")
+            # 其他通过注册表扩展的提供方，使用同名配置节
+            section = config.get(llm_type)
+            if isinstance(section, dict):
+                return {"model_name": section.get("embedding_model", llm_type), **section}
+            raise ValueError(f"不支持的嵌入模型类型: {llm_type}")
+    
+    @staticmethod
+    def get_index_storage_config() -> Dict[str, Any]:
+        """获取索引持久化格式配置"""
+        config = ConfigService.get_config()
+        return {**DEFAULT_CONFIG["index_storage"], **config.get("index_storage", {})}
+    
+    @staticmethod
+    def get_dedup_config() -> Dict[str, Any]:
+        """获取近似去重配置"""
+        config = ConfigService.get_config()
+        return {**DEFAULT_CONFIG["dedup"], **config.get("dedup", {})}
+    
+    @staticmethod
+    def get_ingest_cache_config() -> Dict[str, Any]:
+        """获取表格解析缓存配置"""
+        config = ConfigService.get_config()
+        return {**DEFAULT_CONFIG["ingest_cache"], **config.get("ingest_cache", {})}
+    
+    @staticmethod
+    def get_context_packing_config() -> Dict[str, Any]:
+        """获取回答生成的上下文组装配置"""
+        config = ConfigService.get_config()
+        return {**DEFAULT_CONFIG["context_packing"], **config.get("context_packing", {})}
+    
+    @staticmethod
+    def get_answer_cache_config() -> Dict[str, Any]:
+        """获取生成回答的语义缓存配置"""
+        config = ConfigService.get_config()
+        return {**DEFAULT_CONFIG["answer_cache"], **config.get("answer_cache", {})}
+    
+    @staticmethod
+    def get_resilience_config() -> Dict[str, Any]:
+        """获取远程模型调用的准入控制配置，按配置文件的修改时间缓存（其他进程修改配置后也会重新读取）"""
+        global _resilience_cache
+        try:
+            mtime = CONFIG_FILE.stat().st_mtime_ns
+        except OSError:
+            mtime = None
+        cached = _resilience_cache
+        if mtime is not None and cached is not None and cached[0] == mtime:
+            return dict(cached[1])
+        config = ConfigService.get_config()
+        resilience = {**DEFAULT_CONFIG["resilience"], **config.get("resilience", {})}
+        if mtime is not None:
+            _resilience_cache = (mtime, resilience)
+        return dict(resilience)
+    
+    @staticmethod
+    def get_profiling_config() -> Dict[str, Any]:
+        """获取采样分析器配置"""
+        config = ConfigService.get_config()
+        return {**DEFAULT_CONFIG["profiling"], **config.get("profiling", {})}
+    
+    @staticmethod
+    def get_bulk_ingest_config() -> Dict[str, Any]:
+        """获取批量上传配置"""
+        config = ConfigService.get_config()
+        return {**DEFAULT_CONFIG["bulk_ingest"], **config.get("bulk_ingest", {})}
+    
+    @staticmethod
+    def get_sharding_config() -> Dict[str, Any]:
+        """获取分片索引和分片服务进程配置"""
+        config = ConfigService.get_config()
+        return {**DEFAULT_CONFIG["sharding"], **config.get("sharding", {})}
     
     @staticmethod
     def get_completion_config() -> Dict[str, Any]:
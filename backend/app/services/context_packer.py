@@ -0,0 +1,208 @@
+import logging
+import re
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from app.services.config_service import ConfigService
+
+logger = logging.getLogger(__name__)
+
+# 与 split_text 相同的句子边界
+SENTENCE_PATTERN = re.compile(r'(?<=[。！？.!?])')
+
+# 英文按单词、中文按相邻二字组计算与查询的词项重合
+_WORD_PATTERN = re.compile(r"[a-zA-Z0-9]+|[一-鿿]")
+
+_tokenizer: Optional[Callable[[str], List[int]]] = None
+
+
+def _get_tokenizer() -> Callable[[str], List[int]]:
+    """LlamaIndex 自带 cl100k_base 编码缓存，离线可用；加载失败时按字符数估算"""
+    global _tokenizer
+    if _tokenizer is None:
+        try:
+            from llama_index.core.utils import get_tokenizer
+            _tokenizer = get_tokenizer()
+        except Exception as e:
+            logger.warning(f"加载分词器失败，按字符数估算词元数: {str(e)}")
+            _tokenizer = _estimate_tokens
+    return _tokenizer
+
+
+def _estimate_tokens(text: str) -> List[int]:
+    # 中文约每字一个词元，其余约每4个字符一个词元
+    cjk = sum(1 for ch in text if "一" <= ch <= "鿿")
+    return [0] * (cjk + (len(text) - cjk + 3) // 4)
+
+
+def count_tokens(text: str) -> int:
+    """计算文本的词元数"""
+    if not text:
+        return 0
+    return len(_get_tokenizer()(text))
+
+
+def overlap_length(left: str, right: str, min_length: int = 1) -> int:
+    """
+    left 的后缀与 right 的前缀最长的重合长度，短于 min_length 时返回 0
+
+    以 right 的前 min_length 个字符为锚点在 left 中查找（str.find 在C层完成），
+    从最靠前的出现位置开始校验，第一个能对齐到 left 末尾的位置即为最长重合。
+    """
+    if min_length <= 0 or len(left) < min_length or len(right) < min_length:
+        return 0
+    anchor = right[:min_length]
+    start = max(0, len(left) - len(right))
+    position = left.find(anchor, start)
+    while position != -1:
+        if right.startswith(left[position:]):
+            return len(left) - position
+        position = left.find(anchor, position + 1)
+    return 0
+
+
+def _terms(text: str) -> Set[str]:
+    tokens = _WORD_PATTERN.findall(text.lower())
+    terms = {token for token in tokens if len(token) > 1}
+    terms.update(a + b for a, b in zip(tokens, tokens[1:]) if len(a) == 1 and len(b) == 1)
+    return terms
+
+
+def best_sentences(text: str, query: str, max_tokens: int, max_sentences: int) -> str:
+    """
+    截取文本中与查询最相关的句子
+
+    按与查询的词项重合数选择句子，保持原文顺序，总词元数不超过 max_tokens。
+
+    Args:
+        text: 文本
+        query: 查询
+        max_tokens: 词元上限
+        max_sentences: 句子数上限
+
+    Returns:
+        截取后的文本，没有可放入的句子时为空字符串
+    """
+    sentences = [s for s in SENTENCE_PATTERN.split(text) if s.strip()]
+    query_terms = _terms(query)
+    # 重合数相同时靠前的句子优先
+    ranked = sorted(
+        range(len(sentences)),
+        key=lambda i: (-len(_terms(sentences[i]) & query_terms), i)
+    )
+    chosen = []
+    used = 0
+    for i in ranked:
+        if len(chosen) >= max_sentences:
+            break
+        tokens = count_tokens(sentences[i])
+        if used + tokens > max_tokens:
+            continue
+        chosen.append(i)
+        used += tokens
+    return "".join(sentences[i] for i in sorted(chosen)).strip()
+
+
+def format_context(texts: List[str]) -> str:
+    """回答生成提示中的上下文部分"""
+    return "\n\n".join([f"文本片段 {i+1}: {text}" for i, text in enumerate(texts)])
+
+
+def pack_context(query: str, results: List[Dict[str, Any]],
+                 max_tokens: Optional[int] = None) -> Tuple[List[str], Dict[str, Any]]:
+    """
+    在词元预算内按相关性组装回答生成的上下文
+
+    按结果顺序（即相关性顺序）依次加入：去掉与已加入片段首尾重叠的部分（split_text 拆分长句时
+    相邻文本块的重叠），完全被已加入片段包含的直接跳过；排在 full_chunks 之后的片段只保留与查询
+    最相关的句子；放不下的片段截取到剩余预算，仍放不下则跳过。
+
+    Args:
+        query: 查询文本
+        results: 按相关性排序的搜索结果
+        max_tokens: 上下文的词元预算，默认使用配置
+
+    Returns:
+        (上下文片段列表, 统计信息)
+    """
+    config = ConfigService.get_context_packing_config()
+    budget = max_tokens if max_tokens is not None else config["max_tokens"]
+    start = time.perf_counter()
+
+    pieces: List[str] = []
+    sources: List[str] = []
+    used_tokens = 0
+    truncated = 0
+    dropped = 0
+    overlap_removed = 0
+
+    for rank, result in enumerate(results):
+        source = result["text"]
+        text = source
+        if any(text in previous for previous in sources):
+            dropped += 1
+            overlap_removed += len(text)
+            continue
+
+        # 去掉与已加入片段首尾重叠的部分
+        for previous in sources:
+            head = overlap_length(previous, text, config["min_overlap_chars"])
+            if head:
+                text = text[head:]
+                overlap_removed += head
+            tail = overlap_length(text, previous, config["min_overlap_chars"])
+            if tail:
+                text = text[:-tail]
+                overlap_removed += tail
+        text = text.strip()
+
+        remaining = budget - used_tokens
+        tokens = count_tokens(text)
+        is_truncated = False
+        if config["truncate_sentences"] and (rank >= config["full_chunks"] or tokens > remaining):
+            shortened = best_sentences(text, query, remaining, config["max_sentences"])
+            is_truncated = shortened != text
+            text = shortened
+            tokens = count_tokens(text)
+
+        if not text or tokens > remaining:
+            dropped += 1
+            continue
+        pieces.append(text)
+        sources.append(source)
+        used_tokens += tokens
+        truncated += int(is_truncated)
+
+    stats = {
+        "token_budget": budget,
+        "context_tokens": used_tokens,
+        "chunks_total": len(results),
+        "chunks_used": len(pieces),
+        "chunks_truncated": truncated,
+        "chunks_dropped": dropped,
+        "overlap_chars_removed": overlap_removed,
+        "packing_ms": round((time.perf_counter() - start) * 1000, 2)
+    }
+    return pieces, stats
+
+
+def prompt_stats(prompt: str, unpacked_prompt: str, packing: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    对比组装后与未组装（全部结果原文）的提示词元数，并按配置的预填充速度估算节省的时间
+
+    Args:
+        prompt: 实际发送的提示
+        unpacked_prompt: 放入全部结果原文时的提示
+        packing: pack_context 返回的统计信息
+    """
+    config = ConfigService.get_context_packing_config()
+    prompt_tokens = count_tokens(prompt)
+    unpacked_tokens = count_tokens(unpacked_prompt)
+    saved = max(unpacked_tokens - prompt_tokens, 0)
+    return {
+        **packing,
+        "prompt_tokens": prompt_tokens,
+        "unpacked_prompt_tokens": unpacked_tokens,
+        "tokens_saved": saved,
+        "estimated_seconds_saved": round(saved / config["prefill_tokens_per_second"], 3)
+    }
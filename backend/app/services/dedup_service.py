@@ -0,0 +1,257 @@
+import hashlib
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 滚动哈希乘数和混合常数
+_ROLLING_MULTIPLIER = np.uint64(0x100000001B3)
+_MIX_MULTIPLIER = np.uint64(0xFF51AFD7ED558CCD)
+
+# 签名中每个值保留的位数，高位用于打包 (行, 分桶) 以便一次排序求最小值
+_VALUE_BITS = 43
+_VALUE_MASK = np.uint64((1 << _VALUE_BITS) - 1)
+
+# 补齐短文本使用的字符，不会出现在归一化后的文本中
+_PAD_CHAR = "\0"
+
+
+@dataclass
+class DedupResult:
+    """近似去重结果"""
+
+    threshold: float
+    # 每个输入文本对应保留文本的序号（保留文本指向自身）
+    representatives: np.ndarray
+    # 保留文本在输入中的序号，保持原有顺序
+    kept_indices: np.ndarray = field(init=False)
+
+    def __post_init__(self):
+        self.kept_indices = np.flatnonzero(self.representatives == np.arange(len(self.representatives)))
+
+    @property
+    def input_count(self) -> int:
+        return len(self.representatives)
+
+    @property
+    def kept_count(self) -> int:
+        return len(self.kept_indices)
+
+    @property
+    def collapsed_count(self) -> int:
+        return self.input_count - self.kept_count
+
+    def groups(self) -> Iterator[Tuple[int, List[int]]]:
+        """遍历含有被合并文本的组：(保留文本序号, 组内全部文本序号)"""
+        order = np.argsort(self.representatives, kind="stable")
+        sorted_reps = self.representatives[order]
+        starts = np.flatnonzero(np.r_[True, sorted_reps[1:] != sorted_reps[:-1]])
+        ends = np.r_[starts[1:], len(order)]
+        for start, end in zip(starts, ends):
+            if end - start > 1:
+                yield int(sorted_reps[start]), order[start:end].tolist()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "threshold": self.threshold,
+            "input_count": self.input_count,
+            "kept_count": self.kept_count,
+            "collapsed_count": self.collapsed_count
+        }
+
+
+def text_key(text: str) -> str:
+    """
+    文本的短哈希，用于从搜索结果反查被合并的来源
+
+    忽略首尾空白：紧凑、FAISS 和 LlamaIndex 格式的索引保存的是节点解析后去掉首尾空白的文本。
+    """
+    return hashlib.sha1(text.strip().encode("utf-8")).hexdigest()[:16]
+
+
+def _normalize_text(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def _shingle_hashes(texts: List[str], shingle_size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    计算每个文本全部字符 n-gram 的64位哈希
+
+    所有文本拼接后用 numpy 一次性做多项式滚动哈希，不在 Python 中逐个遍历 n-gram。
+
+    Returns:
+        (哈希值, 每个文本在哈希数组中的起止位置 indptr)
+    """
+    normalized = [_normalize_text(text).ljust(shingle_size, _PAD_CHAR) for text in texts]
+    lengths = np.fromiter(map(len, normalized), dtype=np.int64, count=len(normalized))
+    codes = np.frombuffer("".join(normalized).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+
+    total = len(codes) - shingle_size + 1
+    hashes = np.zeros(total, dtype=np.uint64)
+    for offset in range(shingle_size):
+        hashes = hashes * _ROLLING_MULTIPLIER + codes[offset:offset + total]
+    hashes ^= hashes >> np.uint64(33)
+    hashes *= _MIX_MULTIPLIER
+    hashes ^= hashes >> np.uint64(29)
+
+    # 去掉跨越文本边界的 n-gram
+    counts = lengths - shingle_size + 1
+    starts = np.r_[0, np.cumsum(lengths)[:-1]]
+    indptr = np.r_[0, np.cumsum(counts)]
+    positions = np.arange(indptr[-1]) + np.repeat(starts - indptr[:-1], counts)
+    return hashes[positions], indptr
+
+
+def minhash_signatures(texts: List[str], num_perm: int = 64, shingle_size: int = 5) -> np.ndarray:
+    """
+    计算文本的 MinHash 签名
+
+    使用单次置换 MinHash（one permutation hashing）：每个 n-gram 只哈希一次，
+    按哈希高位分到 num_perm 个桶中，每个桶取最小值；空桶从右侧最近的非空桶借值（旋转致密化）。
+    计算量与 n-gram 总数成线性，与签名长度无关。
+
+    Args:
+        texts: 文本列表
+        num_perm: 签名长度，向上取整为2的幂
+        shingle_size: 字符 n-gram 长度
+
+    Returns:
+        (n, num_perm) 的 uint64 签名矩阵
+    """
+    bin_bits = max(1, int(np.ceil(np.log2(num_perm))))
+    num_perm = 1 << bin_bits
+    # (行, 分桶) 打包在值的高位，需要保证不溢出
+    batch_rows = max(1, (1 << (64 - _VALUE_BITS)) // num_perm)
+    columns = np.arange(num_perm)
+
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint64)
+    for start in range(0, len(texts), batch_rows):
+        batch = texts[start:start + batch_rows]
+        hashes, indptr = _shingle_hashes(batch, shingle_size)
+        rows = np.repeat(np.arange(len(batch), dtype=np.uint64), np.diff(indptr))
+
+        bins = hashes >> np.uint64(64 - bin_bits)
+        values = (hashes >> np.uint64(64 - bin_bits - _VALUE_BITS)) & _VALUE_MASK
+        keys = rows * np.uint64(num_perm) + bins
+        packed = np.sort((keys << np.uint64(_VALUE_BITS)) | values)
+        sorted_keys = packed >> np.uint64(_VALUE_BITS)
+        first = np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]
+
+        block = np.full(len(batch) * num_perm, _VALUE_MASK + np.uint64(1), dtype=np.uint64)
+        block[sorted_keys[first].astype(np.int64)] = packed[first] & _VALUE_MASK
+        block = block.reshape(len(batch), num_perm)
+
+        # 旋转致密化：空桶取右侧（循环）最近非空桶的值，并加上距离以区分
+        empty = block > _VALUE_MASK
+        if empty.any():
+            doubled = np.concatenate([block, block], axis=1)
+            candidates = np.where(np.concatenate([~empty, ~empty], axis=1), np.arange(2 * num_perm), 2 * num_perm)
+            nearest = np.minimum.accumulate(candidates[:, ::-1], axis=1)[:, ::-1][:, :num_perm]
+            borrowed = np.take_along_axis(doubled, nearest, axis=1)
+            distance = (nearest - columns).astype(np.uint64)
+            block = np.where(empty, borrowed + distance * _MIX_MULTIPLIER, block)
+
+        signatures[start:start + len(batch)] = block
+    return signatures
+
+
+def _optimal_bands(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """选择 LSH 分段数 b 和每段行数 r，使 (1/b)^(1/r) 接近阈值"""
+    best = (num_perm, 1)
+    best_error = float("inf")
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        if bands == 0:
+            break
+        error = abs((1 / bands) ** (1 / rows) - threshold)
+        if error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+
+def deduplicate(texts: List[str], threshold: float = 0.9, num_perm: int = 64,
+                shingle_size: int = 5) -> DedupResult:
+    """
+    基于 MinHash/LSH 的近似去重
+
+    签名在 LSH 分段中落入同一个桶的文本成为候选，再用签名估计的 Jaccard 相似度校验，
+    相似度不低于阈值的文本合并到同一组，每组保留序号最小的文本。
+
+    Args:
+        texts: 文本列表
+        threshold: Jaccard 相似度阈值，1.0 时只合并完全相同的文本
+        num_perm: MinHash 签名长度
+        shingle_size: 字符 n-gram 长度
+
+    Returns:
+        去重结果
+    """
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    n = len(texts)
+    if n < 2:
+        return DedupResult(threshold, np.arange(n))
+
+    signatures = minhash_signatures(texts, num_perm, shingle_size)
+    bands, rows = _optimal_bands(threshold, num_perm)
+    mixer = np.random.RandomState(0).randint(1, 1 << 62, size=rows).astype(np.uint64)
+
+    sources = []
+    targets = []
+    for band in range(bands):
+        # 把每段签名混合成一个桶键，冲突由后面的相似度校验过滤
+        keys = (signatures[:, band * rows:(band + 1) * rows] * mixer).sum(axis=1)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        same_as_previous = np.r_[False, sorted_keys[1:] == sorted_keys[:-1]]
+        if not same_as_previous.any():
+            continue
+        # 每个桶以序号最小的文本作为比较对象
+        bucket_start = np.maximum.accumulate(np.where(~same_as_previous, np.arange(n), 0))
+        members = order[same_as_previous]
+        heads = order[bucket_start[same_as_previous]]
+        similarity = (signatures[members] == signatures[heads]).mean(axis=1)
+        matched = similarity >= threshold
+        sources.append(members[matched])
+        targets.append(heads[matched])
+
+    if sources:
+        sources = np.concatenate(sources)
+        targets = np.concatenate(targets)
+    else:
+        sources = targets = np.zeros(0, dtype=np.int64)
+
+    graph = coo_matrix((np.ones(len(sources), dtype=np.int8), (sources, targets)), shape=(n, n))
+    _, labels = connected_components(graph, directed=False)
+    # 每个连通分量保留序号最小的文本
+    first_of_label = np.full(labels.max() + 1, n, dtype=np.int64)
+    np.minimum.at(first_of_label, labels, np.arange(n))
+    result = DedupResult(threshold, first_of_label[labels])
+    logger.info(f"近似去重完成: {result.input_count} 个文本块，合并 {result.collapsed_count} 个")
+    return result
+
+
+def build_source_map(result: DedupResult, texts: List[str],
+                     chunk_ids: List[Optional[str]]) -> Dict[str, Dict[str, Any]]:
+    """
+    记录被合并文本的来源，只包含合并了多个文本的组
+
+    Args:
+        result: 去重结果
+        texts: 去重前的文本列表
+        chunk_ids: 与文本对应的文本块ID，直接以原文选择的文本为 None
+
+    Returns:
+        保留文本的短哈希 -> {"chunk_ids": 组内全部来源文本块ID, "count": 组内文本数}
+    """
+    source_map = {}
+    for representative, members in result.groups():
+        source_map[text_key(texts[representative])] = {
+            "chunk_ids": [chunk_ids[i] for i in members if chunk_ids[i] is not None],
+            "count": len(members)
+        }
+    return source_map
@@ -0,0 +1,376 @@
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+import numpy as np
+from pydantic import PrivateAttr
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.embeddings.openai import OpenAIEmbedding
+from llama_index.embeddings.siliconflow import SiliconFlowEmbedding
+
+from app.services.config_service import ConfigService
+from app.services.resilience import get_guard
+
+logger = logging.getLogger(__name__)
+
+# 嵌入模型提供方注册表：名称 -> 工厂函数(嵌入配置) -> 嵌入模型
+EMBEDDING_PROVIDERS: Dict[str, Callable[[Dict[str, Any]], BaseEmbedding]] = {}
+
+# 在进程内计算、不经过准入控制的提供方
+LOCAL_PROVIDERS = set()
+
+# 已探测的向量维度缓存：(模型类, 提供方, 模型名) -> 维度
+_DIMENSION_CACHE: Dict[tuple, int] = {}
+
+
+def register_embedding_provider(name: str, factory: Optional[Callable[[Dict[str, Any]], BaseEmbedding]] = None,
+                                remote: bool = True):
+    """
+    注册嵌入模型提供方，可作为装饰器使用
+
+    Args:
+        name: 提供方名称，对应配置中的 embedding_type
+        factory: 根据嵌入配置创建嵌入模型的函数
+        remote: 是否调用远程服务；远程提供方的调用经过并发限制、截止时间和熔断
+    """
+    def decorator(func):
+        EMBEDDING_PROVIDERS[name.lower()] = func
+        if remote:
+            LOCAL_PROVIDERS.discard(name.lower())
+        else:
+            LOCAL_PROVIDERS.add(name.lower())
+        return func
+
+    if factory is not None:
+        return decorator(factory)
+    return decorator
+
+
+def list_embedding_providers() -> List[str]:
+    """获取所有已注册的嵌入模型提供方"""
+    return sorted(EMBEDDING_PROVIDERS)
+
+
+class OpenAICompatibleEmbedding(BaseEmbedding):
+    """调用兼容OpenAI /embeddings 接口的服务（如本地部署的推理服务），不限制模型名称"""
+
+    model_name: str
+    api_base: str
+    api_key: str = ""
+    timeout: float = 60.0
+
+    _client: httpx.Client = PrivateAttr()
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+        self._client = httpx.Client(base_url=self.api_base.rstrip("/"), headers=headers, timeout=self.timeout)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "OpenAICompatibleEmbedding"
+
+    def _request(self, texts: List[str]) -> List[List[float]]:
+        response = self._client.post("/embeddings", json={"model": self.model_name, "input": texts})
+        response.raise_for_status()
+        data = sorted(response.json()["data"], key=lambda item: item["index"])
+        return [item["embedding"] for item in data]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._request([query])[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._request([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._request(texts)
+
+
+class HuggingFaceInferenceEmbedding(BaseEmbedding):
+    """调用HuggingFace Inference API 的 feature-extraction 接口"""
+
+    model_name: str
+    api_base: str
+    api_key: str = ""
+    timeout: float = 60.0
+
+    _client: httpx.Client = PrivateAttr()
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+        self._client = httpx.Client(headers=headers, timeout=self.timeout)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "HuggingFaceInferenceEmbedding"
+
+    def _request(self, texts: List[str]) -> List[List[float]]:
+        url = f"{self.api_base.rstrip('/')}/{self.model_name}"
+        response = self._client.post(url, json={"inputs": texts, "options": {"wait_for_model": True}})
+        response.raise_for_status()
+        embeddings = []
+        for item in response.json():
+            vector = np.asarray(item, dtype=np.float32)
+            # 非sentence-transformers模型返回词元级向量，取平均池化
+            if vector.ndim > 1:
+                vector = vector.reshape(-1, vector.shape[-1]).mean(axis=0)
+            embeddings.append(vector.tolist())
+        return embeddings
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._request([query])[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._request([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._request(texts)
+
+
+class LocalHashingEmbedding(BaseEmbedding):
+    """
+    进程内CPU嵌入模型，无需下载模型也无需网络
+
+    使用带符号的特征哈希把字符n-gram投影到固定维度（等价于稀疏随机投影），
+    再做L2归一化。适合对隐私或延迟敏感的索引，吞吐只受本机CPU限制。
+    """
+
+    dimension: int = 1024
+    ngram_min: int = 1
+    ngram_max: int = 3
+
+    _vectorizer: Any = PrivateAttr()
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        from sklearn.feature_extraction.text import HashingVectorizer
+        # HashingVectorizer 无状态，不需要训练
+        self._vectorizer = HashingVectorizer(
+            n_features=self.dimension,
+            analyzer="char_wb",
+            ngram_range=(self.ngram_min, self.ngram_max),
+            alternate_sign=True,
+            norm="l2",
+            dtype=np.float32
+        )
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LocalHashingEmbedding"
+
+    def embed_matrix(self, texts: List[str]) -> np.ndarray:
+        """批量嵌入，直接返回 (n, dimension) 的 float32 矩阵"""
+        return self._vectorizer.transform(texts).toarray()
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self.embed_matrix([query])[0].tolist()
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self.embed_matrix([text])[0].tolist()
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_matrix(texts).tolist()
+
+
+class TimeoutSiliconFlowEmbedding(SiliconFlowEmbedding):
+    """SiliconFlowEmbedding 的同步请求没有超时，挂起的上游会一直占用准入控制的线程和并发名额"""
+
+    timeout: float = 60.0
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "TimeoutSiliconFlowEmbedding"
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        response = httpx.post(
+            self.base_url,
+            json={"model": self.model, "input": texts, "encoding_format": self.encoding_format},
+            headers=self._headers,
+            timeout=self.timeout
+        ).json()
+        if "data" not in response:
+            raise RuntimeError(response)
+        return self._data_formatting(response)
+
+
+def _transport_timeout() -> float:
+    """远程嵌入请求的传输超时，与准入控制的单次调用超时一致"""
+    return float(ConfigService.get_resilience_config()["embedding_call_timeout_seconds"])
+
+
+class GuardedEmbedding(BaseEmbedding):
+    """
+    远程嵌入模型的包装，每次请求经过该提供方的准入控制（app.services.resilience）
+
+    批量大小、模型名和维度与被包装的模型一致。
+    """
+
+    provider: str
+    dimension: Optional[int] = None
+
+    _inner: BaseEmbedding = PrivateAttr()
+
+    def __init__(self, inner: BaseEmbedding, provider: str, **kwargs: Any):
+        super().__init__(
+            model_name=inner.model_name,
+            embed_batch_size=inner.embed_batch_size,
+            provider=provider,
+            dimension=getattr(inner, "dimension", None),
+            **kwargs
+        )
+        self._inner = inner
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "GuardedEmbedding"
+
+    def _call(self, func: Callable[..., Any], *args: Any) -> Any:
+        return get_guard("embedding", f"embedding:{self.provider}").call(func, *args)
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._call(self._inner._get_query_embedding, query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._call(self._inner._get_text_embedding, text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._call(self._inner._get_text_embeddings, texts)
+
+
+@register_embedding_provider("siliconflow")
+def _create_siliconflow(embed_config: Dict[str, Any]) -> BaseEmbedding:
+    # 重试由准入控制和熔断代替，失败时尽快走降级路径
+    return TimeoutSiliconFlowEmbedding(
+        model=embed_config["model_name"],
+        model_name=embed_config["model_name"],
+        base_url=embed_config["api_base"],
+        api_key=embed_config["api_key"],
+        max_retries=0,
+        timeout=_transport_timeout()
+    )
+
+
+@register_embedding_provider("openai")
+def _create_openai(embed_config: Dict[str, Any]) -> BaseEmbedding:
+    return OpenAIEmbedding(
+        model=embed_config["model_name"],
+        api_base=embed_config["api_base"],
+        api_key=embed_config["api_key"],
+        timeout=_transport_timeout()
+    )
+
+
+@register_embedding_provider("openai_compatible")
+def _create_openai_compatible(embed_config: Dict[str, Any]) -> BaseEmbedding:
+    return OpenAICompatibleEmbedding(
+        model_name=embed_config["model_name"],
+        api_base=embed_config["api_base"],
+        api_key=embed_config.get("api_key", ""),
+        embed_batch_size=embed_config.get("embed_batch_size", 64),
+        timeout=_transport_timeout()
+    )
+
+
+@register_embedding_provider("huggingface")
+def _create_huggingface(embed_config: Dict[str, Any]) -> BaseEmbedding:
+    return HuggingFaceInferenceEmbedding(
+        model_name=embed_config["model_name"],
+        api_base=embed_config["api_base"],
+        api_key=embed_config.get("api_key", ""),
+        embed_batch_size=embed_config.get("embed_batch_size", 32),
+        timeout=_transport_timeout()
+    )
+
+
+@register_embedding_provider("local", remote=False)
+def _create_local(embed_config: Dict[str, Any]) -> BaseEmbedding:
+    return LocalHashingEmbedding(
+        model_name=embed_config["model_name"],
+        dimension=embed_config.get("embedding_dim", 1024),
+        embed_batch_size=embed_config.get("embed_batch_size", 256)
+    )
+
+
+def get_embedding_model(provider: Optional[str] = None, model_name: Optional[str] = None,
+                        dimension: Optional[int] = None) -> BaseEmbedding:
+    """
+    获取嵌入模型
+
+    Args:
+        provider: 嵌入模型提供方，默认使用配置中的 embedding_type
+        model_name: 模型名称，默认使用配置中的模型；加载已有索引时应传入建索引时的模型
+        dimension: 向量维度，默认使用配置中的 embedding_dim；只对维度可配置的本地提供方生效，
+            加载已有索引时应传入建索引时的维度
+
+    Returns:
+        嵌入模型
+    """
+    provider = (provider or ConfigService.get_embedding_type()).lower()
+    if provider == "none":
+        raise ValueError("嵌入模型未启用，请在配置中启用")
+
+    factory = EMBEDDING_PROVIDERS.get(provider)
+    if factory is None:
+        raise ValueError(f"不支持的嵌入模型类型: {provider}")
+
+    embed_config = dict(ConfigService.get_embedding_config(provider))
+    if model_name:
+        embed_config["model_name"] = model_name
+    if dimension:
+        embed_config["embedding_dim"] = int(dimension)
+    embed_model = factory(embed_config)
+    if provider in LOCAL_PROVIDERS:
+        return embed_model
+    return GuardedEmbedding(embed_model, provider)
+
+
+def get_embedding_dimension(embed_model: BaseEmbedding) -> int:
+    """
+    获取嵌入模型输出的向量维度
+
+    优先读取模型声明的维度，否则嵌入一段探测文本得到维度，并按模型缓存结果。
+    """
+    dimension = getattr(embed_model, "dimension", None)
+    if isinstance(dimension, int) and dimension > 0:
+        return dimension
+
+    key = (embed_model.class_name(), getattr(embed_model, "provider", None), embed_model.model_name)
+    if key not in _DIMENSION_CACHE:
+        probe = embed_model.get_text_embedding("维度检测 dimension probe")
+        _DIMENSION_CACHE[key] = len(probe)
+        logger.info(f"检测到嵌入模型 {key[2]} 的向量维度: {len(probe)}")
+    return _DIMENSION_CACHE[key]
+
+
+def embed_texts(texts: List[str], embed_model: Optional[BaseEmbedding] = None) -> np.ndarray:
+    """
+    批量嵌入文本，返回 (n, dimension) 的 float32 矩阵
+
+    Args:
+        texts: 文本列表
+        embed_model: 嵌入模型，默认按配置创建
+
+    Returns:
+        嵌入矩阵
+    """
+    embed_model = embed_model or get_embedding_model()
+    if not texts:
+        return np.zeros((0, get_embedding_dimension(embed_model)), dtype=np.float32)
+    if isinstance(embed_model, LocalHashingEmbedding):
+        return embed_model.embed_matrix(texts)
+    # 按模型的 embed_batch_size 分批请求
+    embeddings = embed_model.get_text_embedding_batch(texts)
+    return np.asarray(embeddings, dtype=np.float32)
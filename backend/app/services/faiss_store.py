@@ -0,0 +1,138 @@
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.compact_store import MANIFEST_FILE, TextStore, write_text_store, _normalize
+from app.services.serialization import dump, load
+
+logger = logging.getLogger(__name__)
+
+# 原生FAISS格式版本号，格式变化时递增
+FAISS_FORMAT_VERSION = 1
+
+INDEX_FILE = "index.faiss"
+
+
+def _mmap_flags(faiss) -> int:
+    """
+    只读内存映射打开索引的标志
+
+    IO_FLAG_MMAP_IFC 直接映射扁平索引的向量数据，多个进程共享同一份页缓存；
+    旧版本FAISS只有 IO_FLAG_MMAP，扁平索引会被复制到进程私有内存。
+    """
+    flag = getattr(faiss, "IO_FLAG_MMAP_IFC", None)
+    if flag is None:
+        logger.warning("当前FAISS版本不支持 IO_FLAG_MMAP_IFC，扁平索引无法在进程间共享")
+        flag = faiss.IO_FLAG_MMAP
+    return flag | faiss.IO_FLAG_READ_ONLY
+
+
+def write_faiss_index(path: Path, vectors: np.ndarray, texts: List[str], compression: str = "none",
+                      manifest_extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    以FAISS原生二进制格式持久化向量，文本保存为带偏移表的二进制文件
+
+    向量归一化后写入内积扁平索引，相似度即余弦相似度。
+
+    Args:
+        path: 输出目录
+        vectors: (n, d) 的向量矩阵
+        texts: 与向量一一对应的文本
+        compression: 文本压缩方式，none 或 zstd
+        manifest_extra: 额外写入清单的信息
+
+    Returns:
+        清单内容
+    """
+    import faiss
+
+    if len(vectors) != len(texts):
+        raise ValueError(f"向量数量({len(vectors)})与文本数量({len(texts)})不一致")
+
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+
+    vectors = _normalize(np.asarray(vectors, dtype=np.float32).reshape(len(texts), -1))
+    index = faiss.IndexFlatIP(vectors.shape[1])
+    if len(texts):
+        index.add(np.ascontiguousarray(vectors))
+    faiss.write_index(index, str(path / INDEX_FILE))
+
+    compression = write_text_store(path, texts, compression)
+
+    manifest = {
+        "format": "faiss",
+        "version": FAISS_FORMAT_VERSION,
+        "count": len(texts),
+        "dimension": int(vectors.shape[1]),
+        "compression": compression,
+        "metric": "cosine",
+        **(manifest_extra or {})
+    }
+    dump(manifest, path / MANIFEST_FILE)
+    return manifest
+
+
+class FaissMmapIndex:
+    """
+    内存映射打开的FAISS原生索引
+
+    索引和文本都以只读方式映射，多个 uvicorn worker 打开同一索引时共享操作系统页缓存，
+    内存占用不随 worker 数量增长。
+    """
+
+    def __init__(self, path: Path):
+        import faiss
+
+        self.path = Path(path)
+        self.manifest = load(self.path / MANIFEST_FILE)
+        if self.manifest.get("version", 0) > FAISS_FORMAT_VERSION:
+            raise ValueError(f"不支持的FAISS索引版本: {self.manifest.get('version')}")
+
+        self.index = faiss.read_index(str(self.path / INDEX_FILE), _mmap_flags(faiss))
+        self.texts = TextStore(self.path, self.manifest.get("compression", "none"))
+
+    def __len__(self) -> int:
+        return int(self.index.ntotal)
+
+    @property
+    def dimension(self) -> int:
+        return int(self.index.d)
+
+    def close(self):
+        self.texts.close()
+
+    def get_text(self, i: int) -> str:
+        return self.texts.get_text(i)
+
+    def get_texts(self, indices: List[int]) -> List[str]:
+        return self.texts.get_texts(indices)
+
+    def search(self, queries: np.ndarray, top_k: int = 5,
+               mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        余弦相似度搜索
+
+        Args:
+            queries: (d,) 或 (nq, d) 的查询向量
+            top_k: 每个查询返回的结果数
+            mask: 可选的行位图，通过 IDSelectorBitmap 在FAISS搜索内部过滤，返回的 top_k 仍然精确
+
+        Returns:
+            (相似度, 行号)，形状均为 (nq, k)，按相似度降序
+        """
+        import faiss
+
+        queries = np.ascontiguousarray(_normalize(np.atleast_2d(queries)))
+        k = min(top_k, len(self) if mask is None else int(np.count_nonzero(mask)))
+        if k == 0:
+            return np.zeros((len(queries), 0), dtype=np.float32), np.zeros((len(queries), 0), dtype=np.int64)
+        if mask is None:
+            return self.index.search(queries, k)
+
+        # 位图在搜索期间必须保持引用
+        bitmap = np.packbits(np.asarray(mask, dtype=bool), bitorder="little")
+        selector = faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bitmap))
+        return self.index.search(queries, k, params=faiss.SearchParameters(sel=selector))
@@ -0,0 +1,266 @@
+import logging
+import os
+import shutil
+import threading
+import uuid
+import weakref
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.services.serialization import dump
+
+try:
+    import fcntl
+except ImportError:  # Windows 下只能使用进程内引用计数
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# 索引存储目录
+INDEX_STORE_DIR = Path("index_store")
+INDEX_STORE_DIR.mkdir(exist_ok=True)
+
+# 版本目录和构建中临时目录的前缀
+VERSION_PREFIX = "v"
+BUILD_PREFIX = ".build-"
+
+# 读者在版本目录下持有共享锁的文件
+READERS_LOCK_FILE = ".readers.lock"
+
+# 发布新版本时在索引目录下持有排他锁的文件
+PUBLISH_LOCK_FILE = ".publish.lock"
+
+# 进程内每个版本目录的读者数量，无 fcntl 时用于判断能否回收
+_local_readers: Dict[str, int] = {}
+_local_readers_lock = threading.Lock()
+
+_publish_thread_lock = threading.Lock()
+
+
+def index_dir(index_id: str) -> Path:
+    return INDEX_STORE_DIR / index_id
+
+
+def begin_version(index_id: str) -> Path:
+    """
+    创建新版本的临时构建目录
+
+    构建目录以点号开头，不会被读者看到，也不会被回收；构建失败时调用 abort_version 删除。
+    """
+    build_path = index_dir(index_id) / f"{BUILD_PREFIX}{uuid.uuid4().hex[:8]}"
+    build_path.mkdir(parents=True)
+    return build_path
+
+
+def publish_version(index_id: str, build_path: Path, metadata_file: Path,
+                    metadata: Dict[str, Any]) -> Path:
+    """
+    发布构建完成的版本
+
+    先将构建目录原子重命名为版本目录，再原子替换元数据文件使其指向新版本；
+    在元数据替换之前，搜索一直使用旧版本。同一索引的发布串行执行，
+    保证名称最新的版本就是元数据指向的当前版本。
+
+    Args:
+        index_id: 索引ID
+        build_path: begin_version 创建的构建目录
+        metadata_file: 索引元数据文件
+        metadata: 索引元数据，会写入 index_store_path 和 version
+
+    Returns:
+        版本目录
+    """
+    with _publish_lock(index_id):
+        version = f"{VERSION_PREFIX}{datetime.now().strftime('%Y%m%d%H%M%S%f')}-{uuid.uuid4().hex[:6]}"
+        version_path = Path(build_path).parent / version
+        os.rename(build_path, version_path)
+        metadata["index_store_path"] = str(version_path)
+        metadata["version"] = version
+        write_json_atomic(metadata_file, metadata)
+    reclaim_versions(index_id, version_path)
+    return version_path
+
+
+@contextmanager
+def _publish_lock(index_id: str):
+    """跨线程、跨进程的发布锁"""
+    with _publish_thread_lock:
+        with open(index_dir(index_id) / PUBLISH_LOCK_FILE, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            yield
+
+
+def abort_version(build_path: Path):
+    shutil.rmtree(build_path, ignore_errors=True)
+
+
+def write_json_atomic(path: Path, data: Dict[str, Any]):
+    """先写临时文件再原子替换，读者要么读到旧内容，要么读到完整的新内容"""
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        dump(data, tmp_path, fsync=True)
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+class ReaderLease:
+    """
+    读者对一个版本目录的引用
+
+    持有期间在版本目录的锁文件上保持共享锁（跨进程），并计入进程内读者数量，
+    回收时无法获得排他锁的版本会被跳过。
+    """
+
+    def __init__(self, version_path: Path):
+        self.path = Path(version_path)
+        self._key = str(self.path.resolve())
+        self._file = None
+        with _local_readers_lock:
+            # 版本已被回收时抛出 FileNotFoundError，调用方应重新读取元数据
+            if not self.path.is_dir():
+                raise FileNotFoundError(f"索引版本已被回收: {self.path}")
+            _local_readers[self._key] = _local_readers.get(self._key, 0) + 1
+        self._released = False
+        if fcntl is not None:
+            try:
+                self._file = open(self.path / READERS_LOCK_FILE, "a")
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_SH)
+                if not self.path.is_dir():
+                    raise FileNotFoundError(f"索引版本已被回收: {self.path}")
+            except Exception:
+                self.release()
+                raise
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        with _local_readers_lock:
+            _local_readers[self._key] -= 1
+            if _local_readers[self._key] == 0:
+                del _local_readers[self._key]
+        if self._file is not None:
+            # 关闭文件即释放锁
+            self._file.close()
+        # 最后一个读者离开已被替换的版本时立即回收
+        if self.path.name.startswith(VERSION_PREFIX) and _is_superseded(self.path):
+            try:
+                with _local_readers_lock:
+                    removed = _try_remove(self.path)
+                if removed:
+                    logger.info(f"已回收索引旧版本: {self.path}")
+            except OSError as e:
+                logger.warning(f"回收索引旧版本失败: {self.path}，{str(e)}")
+
+    def bind(self, owner: Any) -> Any:
+        """owner 被回收时释放引用，用于长期缓存的内存映射索引"""
+        weakref.finalize(owner, self.release)
+        return owner
+
+
+@contextmanager
+def read_version(version_path: Path) -> Iterator[Path]:
+    """在读取版本目录期间持有引用，防止被回收"""
+    lease = ReaderLease(version_path)
+    try:
+        yield lease.path
+    finally:
+        lease.release()
+
+
+def list_versions(index_id: str) -> List[Path]:
+    """已发布的版本目录，按发布时间排序"""
+    root = index_dir(index_id)
+    if not root.exists():
+        return []
+    return sorted(p for p in root.iterdir() if p.is_dir() and p.name.startswith(VERSION_PREFIX))
+
+
+def _is_superseded(version_path: Path) -> bool:
+    """是否已有更新的版本发布"""
+    versions = list_versions(version_path.parent.name)
+    return bool(versions) and versions[-1].name > version_path.name
+
+
+def _try_remove(version_path: Path) -> bool:
+    """没有读者时删除版本目录"""
+    if _local_readers.get(str(version_path.resolve()), 0) > 0:
+        return False
+    if fcntl is None:
+        shutil.rmtree(version_path, ignore_errors=True)
+        return True
+    with open(version_path / READERS_LOCK_FILE, "a") as lock_file:
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        # 持有排他锁期间删除，新读者只会打开当前版本
+        shutil.rmtree(version_path, ignore_errors=True)
+        return True
+
+
+def _reclaim_legacy(index_id: str) -> int:
+    """删除引入版本目录之前直接写在索引目录下的文件"""
+    root = index_dir(index_id)
+    legacy = [
+        p for p in root.iterdir()
+        if not p.name.startswith((VERSION_PREFIX, BUILD_PREFIX))
+        and p.name not in (READERS_LOCK_FILE, PUBLISH_LOCK_FILE)
+    ]
+    if not legacy:
+        return 0
+    with _local_readers_lock:
+        if _local_readers.get(str(root.resolve()), 0) > 0:
+            return 0
+        if fcntl is not None:
+            lock_file = open(root / READERS_LOCK_FILE, "a")
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                return 0
+        try:
+            for path in legacy:
+                if path.is_dir():
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    path.unlink()
+        finally:
+            if fcntl is not None:
+                lock_file.close()
+    logger.info(f"已回收索引旧版本: {root}")
+    return 1
+
+
+def reclaim_versions(index_id: str, current: Optional[Path]) -> int:
+    """
+    回收除当前版本外没有读者引用的旧版本
+
+    仍被引用的版本保留，下次发布或读者切换版本后再尝试回收。
+
+    Args:
+        index_id: 索引ID
+        current: 当前版本目录，为 None 时回收全部版本
+
+    Returns:
+        回收的版本数量
+    """
+    current_key = str(Path(current).resolve()) if current is not None else None
+    reclaimed = 0
+    if current is not None and Path(current).parent.resolve() == index_dir(index_id).resolve():
+        reclaimed += _reclaim_legacy(index_id)
+    for version_path in list_versions(index_id):
+        if str(version_path.resolve()) == current_key:
+            continue
+        with _local_readers_lock:
+            removed = _try_remove(version_path)
+        if removed:
+            reclaimed += 1
+            logger.info(f"已回收索引旧版本: {version_path}")
+    return reclaimed
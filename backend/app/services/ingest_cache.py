@@ -0,0 +1,246 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+except ImportError:  # 未安装pyarrow时不缓存解析结果
+    pyarrow = None
+
+from app.services.config_service import ConfigService
+from app.services.file_processor import clean_data
+from app.services.serialization import dump, load
+
+logger = logging.getLogger(__name__)
+
+# 解析和清洗后的表格缓存目录
+INGEST_CACHE_DIR = Path("ingest_cache")
+INGEST_CACHE_DIR.mkdir(exist_ok=True)
+
+# 缓存格式版本号，解析或清洗逻辑变化时递增，旧缓存不再命中
+INGEST_CACHE_VERSION = 1
+
+TABLE_SUFFIX = ".parquet"
+INFO_SUFFIX = ".json"
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# lz4 的压缩和解压都比 zstd 快，读取文本列的耗时主要在于转换为Python字符串
+CACHE_COMPRESSION = "lz4"
+
+# 缓存在后台线程写入，不增加首次上传的响应时间：缓存键 -> 写入任务
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-cache")
+_pending_writes: Dict[str, Future] = {}
+_pending_lock = threading.Lock()
+
+
+def content_hash(path: Path) -> str:
+    """按文件内容计算缓存键，同一内容以不同文件名上传时共用缓存"""
+    digest = hashlib.sha256(f"v{INGEST_CACHE_VERSION}".encode("ascii"))
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()[:32]
+
+
+def excel_engine() -> Optional[str]:
+    """
+    读取Excel使用的引擎
+
+    已安装 python-calamine 时使用基于Rust的 calamine 引擎，比默认的 openpyxl 快一个数量级；
+    否则返回 None，由 pandas 按扩展名选择默认引擎。
+    """
+    try:
+        import python_calamine  # noqa: F401
+    except ImportError:
+        return None
+    return "calamine"
+
+
+def read_table(path: Path, file_type: str) -> pd.DataFrame:
+    """解析表格文件"""
+    if file_type == "csv":
+        return pd.read_csv(path)
+    engine = excel_engine()
+    return pd.read_excel(path, engine=engine) if engine else pd.read_excel(path)
+
+
+def text_columns(df: pd.DataFrame) -> List[str]:
+    """可拆分的文本列，与上传时选择文本列的规则一致"""
+    return [str(col) for col in df.columns if df[col].dtype == 'object']
+
+
+def _entry_paths(key: str) -> Tuple[Path, Path]:
+    return INGEST_CACHE_DIR / f"{key}{TABLE_SUFFIX}", INGEST_CACHE_DIR / f"{key}{INFO_SUFFIX}"
+
+
+def cache_info(key: str) -> Optional[Dict[str, Any]]:
+    """缓存条目的说明（列名、文本列、行数），不存在时返回 None"""
+    table_path, info_path = _entry_paths(key)
+    if not table_path.exists() or not info_path.exists():
+        return None
+    try:
+        return load(info_path)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def read_cached_column(key: str, column: str) -> pd.Series:
+    """
+    只读取缓存表格中的一列，行索引与清洗后的表格一致
+
+    Raises:
+        FileNotFoundError: 缓存不存在
+    """
+    table_path, _ = _entry_paths(key)
+    df = pd.read_parquet(table_path, columns=[column])
+    # 更新修改时间，淘汰时按最近使用排序
+    os.utime(table_path)
+    return df[column]
+
+
+def _write_entry(key: str, df: pd.DataFrame, info: Dict[str, Any]) -> bool:
+    """先写临时文件再原子替换，写入失败（如列中混有无法转换的类型）时不缓存"""
+    table_path, info_path = _entry_paths(key)
+    suffix = uuid.uuid4().hex[:8]
+    tmp_table = table_path.with_name(f".{table_path.name}.{suffix}.tmp")
+    tmp_info = info_path.with_name(f".{info_path.name}.{suffix}.tmp")
+    try:
+        # 列名统一为字符串，Parquet 不支持非字符串列名
+        frame = df.copy(deep=False)
+        frame.columns = [str(col) for col in frame.columns]
+        frame.to_parquet(tmp_table, engine="pyarrow", compression=CACHE_COMPRESSION)
+        dump(info, tmp_info)
+        os.replace(tmp_table, table_path)
+        os.replace(tmp_info, info_path)
+        return True
+    except Exception as e:
+        logger.warning(f"写入解析缓存失败，本次不缓存: {str(e)}")
+        return False
+    finally:
+        tmp_table.unlink(missing_ok=True)
+        tmp_info.unlink(missing_ok=True)
+
+
+def _write_and_evict(key: str, df: pd.DataFrame, info: Dict[str, Any], max_bytes: int):
+    try:
+        if _write_entry(key, df, info):
+            _evict(max_bytes)
+    finally:
+        with _pending_lock:
+            _pending_writes.pop(key, None)
+
+
+def wait_for_writes():
+    """等待后台写入完成"""
+    with _pending_lock:
+        pending = list(_pending_writes.values())
+    for future in pending:
+        future.result()
+
+
+def _evict(max_bytes: int):
+    """缓存总大小超过上限时，从最久未使用的条目开始删除"""
+    tables = sorted(INGEST_CACHE_DIR.glob(f"*{TABLE_SUFFIX}"), key=lambda p: p.stat().st_mtime)
+    total = sum(p.stat().st_size for p in tables)
+    for table_path in tables:
+        if total <= max_bytes:
+            break
+        total -= table_path.stat().st_size
+        table_path.unlink(missing_ok=True)
+        table_path.with_suffix(INFO_SUFFIX).unlink(missing_ok=True)
+        logger.info(f"淘汰解析缓存: {table_path.name}")
+
+
+def load_cleaned_table(path: Path, file_type: str, key: Optional[str] = None,
+                       refresh: bool = False) -> Tuple[str, Dict[str, Any], Optional[pd.DataFrame]]:
+    """
+    获取表格文件解析和清洗后的结果，相同内容只解析一次
+
+    缓存命中时不读取表格内容，调用方通过 read_cached_column 只读取需要的文本列；
+    未命中时解析并清洗后返回完整表格，同时在后台以Parquet格式写入缓存。
+
+    Args:
+        path: 上传的文件
+        file_type: 文件类型，csv、xlsx 或 xls
+        key: 已知的内容哈希（如处理结果摘要中记录的），为空时读取文件计算
+        refresh: 不查找缓存，重新解析并重写缓存（缓存条目无法读取时）
+
+    Returns:
+        (缓存键, 缓存说明, 清洗后的表格)，命中时表格为 None
+    """
+    cache_config = ConfigService.get_ingest_cache_config()
+    key = key or content_hash(path)
+    if cache_config["enabled"] and pyarrow is not None and not refresh:
+        # 同一内容的缓存正在写入时等待写完，而不是重新解析
+        with _pending_lock:
+            pending = _pending_writes.get(key)
+        if pending is not None:
+            pending.result()
+        info = cache_info(key)
+        if info is not None:
+            logger.info(f"解析缓存命中: {path.name} -> {key}")
+            return key, info, None
+
+    df = clean_data(read_table(path, file_type))
+    info = {
+        "version": INGEST_CACHE_VERSION,
+        "file_type": file_type,
+        "columns": [str(col) for col in df.columns],
+        "text_columns": text_columns(df),
+        "row_count": len(df)
+    }
+    if cache_config["enabled"]:
+        if pyarrow is None:
+            logger.warning("未安装pyarrow，不缓存解析结果")
+        else:
+            with _pending_lock:
+                if key not in _pending_writes:
+                    _pending_writes[key] = _writer.submit(
+                        _write_and_evict, key, df, info, int(cache_config["max_size_mb"] * 1024 * 1024)
+                    )
+    return key, info, df
+
+
+def load_text_column(path: Path, file_type: str, column: Optional[str] = None,
+                     key: Optional[str] = None) -> Tuple[str, Dict[str, Any], Optional[pd.Series]]:
+    """
+    获取表格文件中用于拆分的文本列
+
+    Args:
+        path: 上传的文件
+        file_type: 文件类型
+        column: 文本列名，为空时使用第一个文本列
+        key: 已知的内容哈希，为空时读取文件计算
+
+    Returns:
+        (缓存键, 缓存说明, 文本列)，表格中没有文本列时文本列为 None
+
+    Raises:
+        ValueError: 指定的列不是文本列
+    """
+    key, info, df = load_cleaned_table(path, file_type, key)
+    if column is None:
+        if not info["text_columns"]:
+            return key, info, None
+        column = info["text_columns"][0]
+    elif column not in info["text_columns"]:
+        raise ValueError(f"不是可拆分的文本列: {column}")
+
+    if df is None:
+        try:
+            return key, info, read_cached_column(key, column)
+        except (OSError, ValueError, KeyError) as e:
+            # 后台写入后的淘汰可能在读取说明和读取列之间删除了条目，或条目已损坏：与未命中一样重新解析
+            logger.warning(f"读取解析缓存失败，重新解析: {path.name} -> {key}: {str(e)}")
+            key, info, df = load_cleaned_table(path, file_type, key, refresh=True)
+    position = info["columns"].index(column)
+    return key, info, df.iloc[:, position]
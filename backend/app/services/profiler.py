@@ -0,0 +1,400 @@
+import logging
+import os
+import re
+import statistics
+import sys
+import sysconfig
+import threading
+import time
+import uuid
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.services.config_service import ConfigService
+from app.services.serialization import dump, load
+
+logger = logging.getLogger(__name__)
+
+# 分析结果目录，每次捕获保存折叠栈文件（<id>.collapsed）和摘要（<id>.json）
+PROFILE_DIR = Path("profiles")
+PROFILE_DIR.mkdir(exist_ok=True)
+
+# 管理员令牌只从环境变量读取，不放在可以通过 /api/config 读写的配置文件中
+ADMIN_TOKEN_ENV = "PROFILER_ADMIN_TOKEN"
+
+# 客户端可以通过该请求头给请求打标签，只分析带有指定标签的请求
+TAG_HEADER = "X-Profile-Tag"
+
+# 分析接口自身的请求不计入捕获
+PROFILING_PATH = "/api/profiling"
+
+# 调用栈中至少有一帧位于应用代码中的线程才会被采样，空闲的工作线程和服务器线程不计入
+_BACKEND_DIR = Path(__file__).resolve().parents[2]
+_APP_DIR = str(_BACKEND_DIR / "app")
+_STDLIB_DIR = sysconfig.get_paths()["stdlib"]
+
+_MAX_DEPTH = 256
+
+# 在内存中保留的最近捕获数量，更早的捕获从磁盘读取
+_MAX_SESSIONS = 20
+
+_SESSION_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+
+@lru_cache(maxsize=4096)
+def _short_path(filename: str) -> str:
+    """应用代码显示相对 backend 的路径，第三方库显示 site-packages 之后的路径，标准库显示相对标准库目录的路径"""
+    if filename.startswith(str(_BACKEND_DIR)):
+        return os.path.relpath(filename, _BACKEND_DIR)
+    marker = "site-packages" + os.sep
+    if marker in filename:
+        return filename.split(marker, 1)[1]
+    if filename.startswith(_STDLIB_DIR):
+        return os.path.relpath(filename, _STDLIB_DIR)
+    return os.path.basename(filename)
+
+
+def _frame_label(code) -> str:
+    # 使用函数定义所在行，同一函数的不同采样点合并为一帧
+    return f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+
+
+class ProfileSession:
+    """
+    一次采样分析捕获
+
+    后台线程每隔 interval 秒通过 sys._current_frames() 读取所有线程的调用栈，只在有匹配的请求
+    正在处理时采样。请求处理可能在事件循环线程或线程池中进行，采样按线程进行而不是按请求，
+    因此同时在处理的其他请求也可能被采到，这些采样次数记为 contended_samples。
+    """
+
+    def __init__(self, max_requests: Optional[int], seconds: float, path_prefix: Optional[str],
+                 tag: Optional[str], interval: float):
+        self.session_id = uuid.uuid4().hex
+        self.max_requests = max_requests
+        self.seconds = seconds
+        self.path_prefix = path_prefix
+        self.tag = tag
+        self.interval = interval
+        self.status = "running"
+        self.stop_reason: Optional[str] = None
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.contended_samples = 0
+        self.requests_started = 0
+        self.request_seconds: List[float] = []
+        self._matched_in_flight = 0
+        self._other_in_flight = 0
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"profiler-{self.session_id[:8]}", daemon=True)
+
+    def matches(self, path: str, tag: Optional[str]) -> bool:
+        if path.startswith(PROFILING_PATH):
+            return False
+        if self.path_prefix and not path.startswith(self.path_prefix):
+            return False
+        return not self.tag or tag == self.tag
+
+    def request_started(self, matched: bool) -> bool:
+        """
+        记录开始处理的请求
+
+        Returns:
+            是否计入本次捕获，已达到请求数上限时不再计入
+        """
+        with self._lock:
+            if matched and self.status == "running" and (
+                    self.max_requests is None or self.requests_started < self.max_requests):
+                self.requests_started += 1
+                self._matched_in_flight += 1
+                return True
+            self._other_in_flight += 1
+            return False
+
+    def request_finished(self, counted: bool, elapsed: float):
+        with self._lock:
+            if not counted:
+                self._other_in_flight -= 1
+                return
+            self._matched_in_flight -= 1
+            self.request_seconds.append(elapsed)
+            done = self.max_requests is not None and len(self.request_seconds) >= self.max_requests
+        if done:
+            self.stop("requests")
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            if time.monotonic() - self._start >= self.seconds:
+                self.stop("time")
+                break
+            if self._matched_in_flight:
+                self._sample()
+        # 结果在采样线程中保存，请求结束时触发的 stop() 不在事件循环中写文件
+        self._save()
+
+    def _sample(self):
+        own = threading.get_ident()
+        stacks = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            labels = []
+            in_app = False
+            while frame is not None and len(labels) < _MAX_DEPTH:
+                code = frame.f_code
+                in_app = in_app or code.co_filename.startswith(_APP_DIR)
+                labels.append(_frame_label(code))
+                frame = frame.f_back
+            if in_app:
+                stacks.append(";".join(reversed(labels)))
+        if not stacks:
+            return
+        with self._lock:
+            self.stacks.update(stacks)
+            self.samples += 1
+            if self._other_in_flight:
+                self.contended_samples += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, reason: str):
+        """结束捕获，结果由采样线程在后台保存，可以重复调用"""
+        with self._lock:
+            if self.status != "running":
+                return
+            self.status = "done"
+            self.stop_reason = reason
+            self.finished_at = time.time()
+        self._stopped.set()
+        _release(self)
+        logger.info(f"采样分析 {self.session_id} 结束（{reason}）: "
+                    f"{len(self.request_seconds)} 个请求, {self.samples} 次采样")
+
+    def _save(self):
+        try:
+            with open(PROFILE_DIR / f"{self.session_id}.collapsed", "w", encoding="utf-8") as f:
+                f.write(self.collapsed())
+            dump(self.summary(), PROFILE_DIR / f"{self.session_id}.json", indent=True)
+        except OSError as e:
+            logger.warning(f"保存分析结果失败: {str(e)}")
+
+    def collapsed(self) -> str:
+        """折叠栈格式（每行“帧;帧;帧 次数”），可以直接交给 flamegraph.pl、speedscope 等工具"""
+        with self._lock:
+            stacks = self.stacks.most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def summary(self, top_n: Optional[int] = None) -> Dict[str, Any]:
+        """
+        捕获的摘要
+
+        top_self 按函数自身（位于栈顶）的采样数排序，top_total 按包含子调用的采样数排序，
+        估算耗时为采样数乘以采样间隔。
+        """
+        top_n = top_n or ConfigService.get_profiling_config()["top_functions"]
+        with self._lock:
+            stacks = dict(self.stacks)
+            request_seconds = list(self.request_seconds)
+        self_counts: Counter = Counter()
+        total_counts: Counter = Counter()
+        for stack, count in stacks.items():
+            frames = stack.split(";")
+            self_counts[frames[-1]] += count
+            for frame in set(frames):
+                total_counts[frame] += count
+        stack_samples = sum(stacks.values())
+
+        def _top(counts: Counter) -> List[Dict[str, Any]]:
+            return [{
+                "function": function,
+                "samples": count,
+                "percent": round(100 * count / stack_samples, 2),
+                "estimated_ms": round(count * self.interval * 1000, 1)
+            } for function, count in counts.most_common(top_n)]
+
+        end = self.finished_at or time.time()
+        return {
+            "session_id": self.session_id,
+            "status": self.status,
+            "stop_reason": self.stop_reason,
+            "filters": {"path": self.path_prefix, "tag": self.tag},
+            "max_requests": self.max_requests,
+            "max_seconds": self.seconds,
+            "interval_ms": round(self.interval * 1000, 3),
+            "started_at": self.started_at,
+            "duration_seconds": round(end - self.started_at, 3),
+            "requests": {
+                "profiled": len(request_seconds),
+                "p50_ms": round(statistics.median(request_seconds) * 1000, 1) if request_seconds else None,
+                "max_ms": round(max(request_seconds) * 1000, 1) if request_seconds else None
+            },
+            "samples": self.samples,
+            "contended_samples": self.contended_samples,
+            "stack_samples": stack_samples,
+            "top_self": _top(self_counts) if stack_samples else [],
+            "top_total": _top(total_counts) if stack_samples else []
+        }
+
+
+_lock = threading.Lock()
+# 当前进行中的捕获，没有时为 None；请求中间件只读取这一个变量，关闭时几乎没有开销
+_active: Optional[ProfileSession] = None
+_sessions: Dict[str, ProfileSession] = {}
+
+
+def _release(session: ProfileSession):
+    global _active
+    with _lock:
+        if _active is session:
+            _active = None
+
+
+def active_session() -> Optional[ProfileSession]:
+    return _active
+
+
+class ProfileMiddleware:
+    """
+    采样分析进行中时记录匹配的请求
+
+    直接实现ASGI接口：没有进行中的分析时原样转发，不包装请求和响应；
+    进行中时在响应体发送完毕时记录请求结束，流式响应也计入整个发送过程。
+    """
+
+    _header = TAG_HEADER.lower().encode("latin-1")
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        session = _active
+        if session is None or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        tag = None
+        for name, value in scope["headers"]:
+            if name == self._header:
+                tag = value.decode("latin-1")
+                break
+        counted = session.request_started(session.matches(scope["path"], tag))
+        start = time.perf_counter()
+        finished = False
+
+        def finish():
+            nonlocal finished
+            if not finished:
+                finished = True
+                session.request_finished(counted, time.perf_counter() - start)
+
+        async def send_and_record(message):
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finish()
+
+        try:
+            await self.app(scope, receive, send_and_record)
+        finally:
+            # 出错或客户端断开时没有发送完响应体，也只记录一次
+            finish()
+
+
+def start(max_requests: Optional[int] = None, seconds: Optional[float] = None,
+          path_prefix: Optional[str] = None, tag: Optional[str] = None,
+          interval_ms: Optional[float] = None) -> ProfileSession:
+    """
+    开始捕获，在处理完 max_requests 个匹配的请求或经过 seconds 秒后结束（先到者为准）
+
+    Args:
+        max_requests: 捕获的请求数，不超过配置的 max_requests
+        seconds: 捕获的时间窗口，默认且不超过配置的 max_seconds
+        path_prefix: 只捕获路径以此开头的请求，如 /api/search
+        tag: 只捕获 X-Profile-Tag 请求头等于此值的请求
+        interval_ms: 采样间隔（毫秒），默认使用配置
+
+    Raises:
+        ValueError: 参数不合法，或已有进行中的捕获
+    """
+    global _active
+    config = ConfigService.get_profiling_config()
+    if max_requests is not None and max_requests <= 0:
+        raise ValueError("requests 必须为正整数")
+    if seconds is not None and seconds <= 0:
+        raise ValueError("seconds 必须为正数")
+    interval_ms = interval_ms or config["interval_ms"]
+    if interval_ms < 1:
+        raise ValueError("interval_ms 不能小于 1")
+    session = ProfileSession(
+        min(max_requests, config["max_requests"]) if max_requests is not None else None,
+        min(seconds or config["max_seconds"], config["max_seconds"]),
+        path_prefix or None,
+        tag or None,
+        interval_ms / 1000
+    )
+    with _lock:
+        if _active is not None:
+            raise ValueError(f"已有进行中的采样分析: {_active.session_id}")
+        _active = session
+        _sessions[session.session_id] = session
+        for session_id in list(_sessions)[:-_MAX_SESSIONS]:
+            _sessions.pop(session_id)
+    session.start()
+    logger.info(f"开始采样分析 {session.session_id}: 请求数 {session.max_requests}, 时间 {session.seconds} 秒, "
+                f"路径 {session.path_prefix}, 标签 {session.tag}")
+    return session
+
+
+def stop() -> Optional[ProfileSession]:
+    """结束进行中的捕获，没有时返回 None"""
+    session = _active
+    if session is not None:
+        session.stop("manual")
+    return session
+
+
+def _checked_id(session_id: str) -> Optional[str]:
+    return session_id if _SESSION_ID_PATTERN.fullmatch(session_id) else None
+
+
+def get_summary(session_id: str) -> Optional[Dict[str, Any]]:
+    """捕获的摘要，找不到时返回 None"""
+    session = _sessions.get(session_id)
+    if session is not None:
+        return session.summary()
+    if _checked_id(session_id) is None:
+        return None
+    path = PROFILE_DIR / f"{session_id}.json"
+    if not path.exists():
+        return None
+    return load(path)
+
+
+def get_collapsed(session_id: str) -> Optional[str]:
+    """捕获的折叠栈，进行中的捕获返回目前为止的结果，找不到时返回 None"""
+    session = _sessions.get(session_id)
+    if session is not None:
+        return session.collapsed()
+    if _checked_id(session_id) is None:
+        return None
+    path = PROFILE_DIR / f"{session_id}.collapsed"
+    if not path.exists():
+        return None
+    return path.read_text(encoding="utf-8")
+
+
+def list_sessions() -> List[Dict[str, Any]]:
+    """本进程最近的捕获，按开始时间倒序"""
+    sessions = sorted(_sessions.values(), key=lambda s: s.started_at, reverse=True)
+    return [{
+        "session_id": session.session_id,
+        "status": session.status,
+        "started_at": session.started_at,
+        "requests": len(session.request_seconds),
+        "samples": session.samples
+    } for session in sessions]
@@ -0,0 +1,387 @@
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Set, Tuple
+
+from app.services.config_service import ConfigService
+
+logger = logging.getLogger(__name__)
+
+# 客户端可以通过该请求头为单个请求指定截止时间（秒）
+DEADLINE_HEADER = "X-Request-Timeout"
+
+# 默认设置截止时间的接口；建索引、批量搜索等长耗时接口只受单次调用超时限制
+DEADLINE_PATHS = ("/api/search", "/api/semantic-search-multi")
+
+# 当前请求的截止时间（time.monotonic），在请求处理的各个阶段之间传递
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_deadline", default=None)
+
+# 当前请求中已经超时的服务，同一请求中不再等待它们（如回答缓存查找时嵌入超时，搜索时不再重新嵌入）
+_timed_out: contextvars.ContextVar[Optional[Set[str]]] = contextvars.ContextVar("request_timed_out", default=None)
+
+
+class RemoteCallRejected(Exception):
+    """远程模型调用未执行或被放弃，调用方应走降级路径"""
+
+
+class DeadlineExceeded(RemoteCallRejected):
+    """请求的截止时间已到"""
+
+
+class CircuitOpenError(RemoteCallRejected):
+    """服务提供方不健康，熔断期间直接拒绝调用"""
+
+
+class Overloaded(RemoteCallRejected):
+    """并发已满且排队已满或排队超时，请求被丢弃"""
+
+
+@contextmanager
+def deadline(seconds: Optional[float]) -> Iterator[None]:
+    """
+    在上下文中设置截止时间，已有更早的截止时间时保留更早的
+
+    Args:
+        seconds: 从现在起的秒数，为 None 时不设置
+    """
+    if seconds is None:
+        yield
+        return
+    current = _deadline.get()
+    target = time.monotonic() + seconds
+    token = _deadline.set(target if current is None else min(current, target))
+    # 嵌套的截止时间共用外层请求的超时记录
+    timed_out_token = _timed_out.set(set()) if _timed_out.get() is None else None
+    try:
+        yield
+    finally:
+        if timed_out_token is not None:
+            _timed_out.reset(timed_out_token)
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """距截止时间的剩余秒数，没有截止时间时为 None"""
+    target = _deadline.get()
+    return None if target is None else target - time.monotonic()
+
+
+def request_timeout(path: str, header_value: Optional[str]) -> Optional[float]:
+    """
+    请求的截止时间（秒）
+
+    请求头指定时使用请求头的值（不超过配置的 request_timeout_seconds），
+    否则只对 DEADLINE_PATHS 中的接口使用配置的默认值。
+    """
+    if not header_value and path not in DEADLINE_PATHS:
+        return None
+    config = ConfigService.get_resilience_config()
+    if not config["enabled"]:
+        return None
+    default = config["request_timeout_seconds"]
+    if header_value:
+        try:
+            return max(0.0, min(float(header_value), default))
+        except ValueError:
+            logger.warning(f"忽略无效的 {DEADLINE_HEADER} 请求头: {header_value}")
+    return default if path in DEADLINE_PATHS else None
+
+
+class RequestDeadlineMiddleware:
+    """
+    为搜索请求设置截止时间，处理过程中的远程模型调用在截止时间内没有完成时走降级路径
+
+    直接实现ASGI接口：不需要截止时间的请求原样转发，不读取配置也不包装请求和响应。
+    截止时间保存在上下文变量中，同步路由在线程池中运行时会复制当前上下文，同样能读取到。
+    """
+
+    _header = DEADLINE_HEADER.lower().encode("latin-1")
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        header_value = None
+        for name, value in scope["headers"]:
+            if name == self._header:
+                header_value = value.decode("latin-1")
+                break
+        path = scope["path"]
+        if not header_value and path not in DEADLINE_PATHS:
+            await self.app(scope, receive, send)
+            return
+        with deadline(request_timeout(path, header_value)):
+            await self.app(scope, receive, send)
+
+
+class ConcurrencyLimiter:
+    """
+    有界并发限制：最多 max_concurrency 个调用同时进行，最多 max_queue 个调用排队等待，
+    排队已满时立即丢弃，排队超时同样丢弃
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.queued = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, timeout: Optional[float]):
+        """
+        获取一个并发名额
+
+        Raises:
+            Overloaded: 排队已满或等待超时
+        """
+        with self._condition:
+            if self.in_flight < self.max_concurrency:
+                self.in_flight += 1
+                return
+            if self.queued >= self.max_queue:
+                raise Overloaded(f"并发已满（{self.in_flight}）且排队已满（{self.queued}）")
+            self.queued += 1
+            try:
+                end = None if timeout is None else time.monotonic() + timeout
+                while self.in_flight >= self.max_concurrency:
+                    wait = None if end is None else end - time.monotonic()
+                    if wait is not None and wait <= 0:
+                        raise Overloaded(f"排队等待超时（{timeout:.2f}秒）")
+                    self._condition.wait(wait)
+                self.in_flight += 1
+            finally:
+                self.queued -= 1
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    连续失败 failure_threshold 次后断开，reset_seconds 内直接拒绝调用；
+    之后进入半开状态，只放行一个探测调用，成功则闭合，失败则重新断开。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """
+        调用前检查是否放行
+
+        Raises:
+            CircuitOpenError: 熔断中，或半开状态下已有探测调用
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_seconds:
+                    raise CircuitOpenError(f"{self.name} 熔断中，直接走降级路径")
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN:
+                if self._probing:
+                    raise CircuitOpenError(f"{self.name} 正在探测恢复，直接走降级路径")
+                self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"{self.name} 探测成功，熔断器闭合")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"{self.name} 连续失败 {self.failures} 次，熔断 {self.reset_seconds} 秒")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+    def cancel_probe(self):
+        """探测调用未真正发出（如排队被丢弃）时归还探测名额"""
+        with self._lock:
+            self._probing = False
+
+
+class RemoteGuard:
+    """
+    一个远程模型服务（LLM 或某个嵌入模型提供方）的准入控制
+
+    调用依次经过截止时间检查、熔断器和并发限制，在独立线程中执行，
+    等待时间不超过单次调用超时和请求剩余时间中较小的一个。放弃等待的调用在后台执行完毕后
+    才归还并发名额，保证同时发往服务提供方的请求数不超过 max_concurrency，因此客户端自身的
+    传输超时应与 call_timeout_seconds 一致。
+
+    超时计入熔断失败的条件：等满单次调用超时，或因请求截止时间放弃时已等待不少于 slow_call_seconds；
+    客户端设置的截止时间很短时提前放弃的调用不计入。同一请求中超时过的服务不再等待。
+    """
+
+    def __init__(self, name: str, settings: Dict[str, Any]):
+        self.name = name
+        self.settings = settings
+        self.limiter = ConcurrencyLimiter(settings["max_concurrency"], settings["max_queue"])
+        self.breaker = CircuitBreaker(name, settings["failure_threshold"], settings["reset_seconds"])
+        self._executor = ThreadPoolExecutor(max_workers=settings["max_concurrency"],
+                                            thread_name_prefix=f"remote-{name}")
+        self.counters = {"calls": 0, "succeeded": 0, "failed": 0, "timed_out": 0,
+                         "shed": 0, "short_circuited": 0, "deadline_exceeded": 0}
+        self._counter_lock = threading.Lock()
+
+    def _count(self, key: str):
+        with self._counter_lock:
+            self.counters[key] += 1
+
+    def call(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        在准入控制下调用远程服务
+
+        Raises:
+            DeadlineExceeded: 截止时间已到，或在截止时间内没有返回
+            CircuitOpenError: 熔断中
+            Overloaded: 并发和排队已满
+            Exception: 远程调用本身抛出的异常
+        """
+        self._count("calls")
+        budget = remaining()
+        if budget is not None and budget <= 0:
+            self._count("deadline_exceeded")
+            raise DeadlineExceeded(f"{self.name}: 请求已超过截止时间")
+        timed_out = _timed_out.get()
+        if timed_out is not None and self.name in timed_out:
+            self._count("deadline_exceeded")
+            raise DeadlineExceeded(f"{self.name}: 本次请求中已超时，不再等待")
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            self._count("short_circuited")
+            raise
+
+        queue_timeout = self.settings["queue_timeout_seconds"]
+        try:
+            self.limiter.acquire(queue_timeout if budget is None else min(queue_timeout, budget))
+        except Overloaded:
+            self.breaker.cancel_probe()
+            self._count("shed")
+            raise
+
+        try:
+            future = self._executor.submit(func, *args, **kwargs)
+        except Exception:
+            self.limiter.release()
+            self.breaker.cancel_probe()
+            raise
+        future.add_done_callback(lambda _: self.limiter.release())
+
+        call_timeout = self.settings["call_timeout_seconds"]
+        budget = remaining()
+        wait = call_timeout if budget is None else max(0.0, min(call_timeout, budget))
+        try:
+            result = future.result(timeout=wait)
+        except FutureTimeoutError:
+            if wait >= min(call_timeout, self.settings["slow_call_seconds"]):
+                # 等待了足够长的时间仍未返回，计为服务提供方的失败；请求自身的截止时间太短不算
+                self._count("timed_out")
+                self.breaker.record_failure()
+            else:
+                self._count("deadline_exceeded")
+                self.breaker.cancel_probe()
+            if timed_out is not None:
+                timed_out.add(self.name)
+            raise DeadlineExceeded(f"{self.name}: 调用在 {wait:.2f} 秒内没有返回")
+        except Exception:
+            self._count("failed")
+            self.breaker.record_failure()
+            raise
+        self._count("succeeded")
+        self.breaker.record_success()
+        return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._counter_lock:
+            counters = dict(self.counters)
+        return {
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "in_flight": self.limiter.in_flight,
+            "queued": self.limiter.queued,
+            **counters,
+            "settings": self.settings
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+class _DirectGuard:
+    """关闭准入控制时直接调用"""
+
+    def call(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        return func(*args, **kwargs)
+
+
+_guards: Dict[str, Tuple[Dict[str, Any], RemoteGuard]] = {}
+_guards_lock = threading.Lock()
+
+
+def _guard_settings(kind: str, config: Dict[str, Any]) -> Dict[str, Any]:
+    """按服务类型（llm 或 embedding）取出带前缀的配置项，与共用配置项合并"""
+    prefix = f"{kind}_"
+    settings = {key: value for key, value in config.items()
+                if not key.startswith(("llm_", "embedding_")) and key not in ("enabled", "request_timeout_seconds")}
+    settings.update({key[len(prefix):]: value for key, value in config.items() if key.startswith(prefix)})
+    return settings
+
+
+def get_guard(kind: str, name: Optional[str] = None):
+    """
+    获取远程服务的准入控制，配置变化后重新创建
+
+    Args:
+        kind: 服务类型，llm 或 embedding，决定使用哪组配置
+        name: 服务名称，默认与类型相同；嵌入模型按提供方区分，各自熔断
+    """
+    config = ConfigService.get_resilience_config()
+    if not config["enabled"]:
+        return _DirectGuard()
+    name = name or kind
+    settings = _guard_settings(kind, config)
+    with _guards_lock:
+        existing = _guards.get(name)
+        if existing is not None and existing[0] == settings:
+            return existing[1]
+        guard = RemoteGuard(name, settings)
+        _guards[name] = (settings, guard)
+    if existing is not None:
+        existing[1].shutdown()
+    return guard
+
+
+def guard_stats() -> Dict[str, Any]:
+    """所有远程服务的熔断状态、并发和计数"""
+    with _guards_lock:
+        guards = [guard for _, guard in _guards.values()]
+    return {guard.name: guard.snapshot() for guard in guards}
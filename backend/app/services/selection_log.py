@@ -0,0 +1,284 @@
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows 下只能使用进程内锁
+    fcntl = None
+
+from app.services.chunk_store import open_chunk_store, processed_exists, processed_mtime
+from app.services.serialization import dumps_line, load, loads
+
+logger = logging.getLogger(__name__)
+
+# 上传目录
+UPLOAD_DIR = Path("uploads")
+UPLOAD_DIR.mkdir(exist_ok=True)
+
+# 日志超过该大小且较上次压缩增长一倍时进行压缩
+COMPACT_MIN_BYTES = 256 * 1024
+
+# 压缩后每行写入的文本块ID数量
+COMPACT_IDS_PER_LINE = 1000
+
+_thread_lock = threading.Lock()
+
+# 文本 -> 文本块ID 的映射缓存：file_id -> (处理结果修改时间, 映射)
+_text_id_cache: Dict[str, Tuple[float, Dict[str, str]]] = {}
+
+
+def selection_log_path(file_id: str) -> Path:
+    return UPLOAD_DIR / f"selected_{file_id}.jsonl"
+
+
+def legacy_selection_path(file_id: str) -> Path:
+    """旧版本使用的整体JSON选择文件"""
+    return UPLOAD_DIR / f"selected_{file_id}.json"
+
+
+def _text_to_id_map(file_id: str) -> Dict[str, str]:
+    """文本到文本块ID的映射，按处理结果的修改时间缓存"""
+    store = open_chunk_store(file_id)
+    mtime = processed_mtime(file_id)
+    cached = _text_id_cache.get(file_id)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    mapping = {}
+    for chunk_id, text in store.iter_chunk_texts():
+        mapping.setdefault(text, chunk_id)
+    _text_id_cache[file_id] = (mtime, mapping)
+    return mapping
+
+
+@contextmanager
+def _locked(file_id: str):
+    """跨线程、跨进程的写锁"""
+    lock_path = UPLOAD_DIR / f".selected_{file_id}.lock"
+    with _thread_lock:
+        with open(lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def _runs(entries: Iterable[Tuple[str, str]], max_len: Optional[int] = None) -> List[Dict[str, Any]]:
+    """把 (ids 或 texts, 值) 序列中相邻的同类条目合并为一条记录，保持原有顺序"""
+    records: List[Dict[str, Any]] = []
+    for key, value in entries:
+        if not records or key not in records[-1] or (max_len is not None and len(records[-1][key]) >= max_len):
+            records.append({key: []})
+        records[-1][key].append(value)
+    return records
+
+
+def _to_records(file_id: str, chunk_ids: List[str], texts: List[str]) -> List[Dict[str, Any]]:
+    """将文本转换为文本块ID引用，找不到对应ID的文本原样保存，保持选择的顺序"""
+    entries = [("ids", chunk_id) for chunk_id in chunk_ids]
+    if texts:
+        mapping = _text_to_id_map(file_id) if processed_exists(file_id) else {}
+        for text in texts:
+            chunk_id = mapping.get(text)
+            entries.append(("texts", text) if chunk_id is None else ("ids", chunk_id))
+    return _runs(entries)
+
+
+def _append_records(path: Path, records: List[Dict[str, Any]]):
+    data = b"".join(dumps_line(record) for record in records)
+    # 一次 O_APPEND 写入，读者不会看到交错的行
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
+
+
+def _read_header(path: Path) -> Dict[str, Any]:
+    """读取日志首行的压缩信息"""
+    try:
+        with open(path, "rb") as f:
+            record = loads(f.readline() or b"{}")
+        return record.get("header", {})
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _migrate_legacy(file_id: str):
+    """将旧版JSON选择文件转换为日志，调用方需持有锁"""
+    legacy = legacy_selection_path(file_id)
+    if not legacy.exists():
+        return
+    existing_data = load(legacy)
+    if not isinstance(existing_data, list):
+        existing_data = [existing_data]
+    records = _to_records(file_id, [], [str(text) for text in existing_data])
+    if records:
+        _append_records(selection_log_path(file_id), records)
+    legacy.unlink()
+    logger.info(f"已将旧版选择文件转换为日志: {file_id}")
+
+
+def append_selection(file_id: str, chunk_ids: Optional[List[str]] = None,
+                     texts: Optional[List[str]] = None) -> int:
+    """
+    向选择日志追加文本块
+
+    Args:
+        file_id: 文件ID
+        chunk_ids: 文本块ID列表
+        texts: 文本块内容列表，会尽量转换为文本块ID
+
+    Returns:
+        本次追加的文本块数量
+    """
+    records = _to_records(file_id, chunk_ids or [], texts or [])
+    if not records:
+        return 0
+
+    path = selection_log_path(file_id)
+    with _locked(file_id):
+        _migrate_legacy(file_id)
+        _append_records(path, records)
+
+        # 日志较上次压缩增长一倍后再压缩，摊还成本为线性
+        size = path.stat().st_size
+        compacted_bytes = _read_header(path).get("compacted_bytes", 0)
+        if size > COMPACT_MIN_BYTES and size > 2 * compacted_bytes:
+            _compact(file_id)
+
+    return sum(len(record.get("ids", record.get("texts", []))) for record in records)
+
+
+def iter_selection(file_id: str) -> Iterator[Dict[str, str]]:
+    """
+    流式读取选择日志，按首次选择的顺序去重
+
+    Yields:
+        {"id": 文本块ID} 或 {"text": 文本}
+    """
+    path = selection_log_path(file_id)
+    legacy = legacy_selection_path(file_id)
+    if not path.exists() and legacy.exists():
+        existing_data = load(legacy)
+        records = [{"texts": existing_data if isinstance(existing_data, list) else [existing_data]}]
+    elif path.exists():
+        records = _iter_records(path)
+    else:
+        return
+
+    seen_ids = set()
+    seen_texts = set()
+    for record in records:
+        for chunk_id in record.get("ids", []):
+            if chunk_id not in seen_ids:
+                seen_ids.add(chunk_id)
+                yield {"id": chunk_id}
+        for text in record.get("texts", []):
+            if text not in seen_texts:
+                seen_texts.add(text)
+                yield {"text": text}
+
+
+def _iter_records(path: Path) -> Iterator[Dict[str, Any]]:
+    with open(path, "rb") as f:
+        for line in f:
+            # 跳过正在写入的不完整行
+            if not line.endswith(b"\n"):
+                break
+            try:
+                yield loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"跳过无法解析的选择记录: {path}")
+
+
+def iter_selected_chunks(file_id: str, unique_texts: bool = True) -> Iterator[Tuple[Optional[str], str]]:
+    """
+    流式读取去重后的选中文本块，文本块ID通过处理结果随机访问解析为文本
+
+    Args:
+        file_id: 文件ID
+        unique_texts: 是否跳过文本相同的文本块；近似去重时保留它们以记录全部来源
+
+    Yields:
+        (文本块ID, 文本)，直接以原文保存的选择没有ID，为 None
+    """
+    store = None
+    seen = set()
+    for entry in iter_selection(file_id):
+        chunk_id = entry.get("id")
+        if chunk_id is not None:
+            try:
+                if store is None:
+                    store = open_chunk_store(file_id)
+                text = store.get_text(store.index_of(chunk_id))
+            except (FileNotFoundError, KeyError, ValueError):
+                logger.warning(f"找不到文本块: {file_id} {chunk_id}")
+                continue
+        else:
+            text = entry["text"]
+        if not unique_texts:
+            yield chunk_id, text
+        # 同一文本既以ID又以原文出现时也只保留一次
+        elif text not in seen:
+            seen.add(text)
+            yield chunk_id, text
+
+
+def iter_selected_texts(file_id: str) -> Iterator[str]:
+    """流式读取去重后的选中文本"""
+    for _, text in iter_selected_chunks(file_id):
+        yield text
+
+
+def selection_exists(file_id: str) -> bool:
+    return selection_log_path(file_id).exists() or legacy_selection_path(file_id).exists()
+
+
+def _compact(file_id: str):
+    """将日志重写为去重后的形式，调用方需持有锁"""
+    path = selection_log_path(file_id)
+    tmp_path = path.with_suffix(".jsonl.tmp")
+    # 保持首次选择的顺序：只把相邻的同类条目合并为一行
+    records = _runs(
+        (("ids", entry["id"]) if "id" in entry else ("texts", entry["text"]) for entry in iter_selection(file_id)),
+        COMPACT_IDS_PER_LINE
+    )
+    lines = [dumps_line(record) for record in records]
+    # 首行记录压缩后的大小，用于判断下次何时压缩
+    header = dumps_line({"header": {"compacted_bytes": sum(len(line) for line in lines)}})
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.writelines(lines)
+        f.flush()
+        os.fsync(f.fileno())
+
+    # 原子替换，正在读取的读者继续读取旧文件
+    os.replace(tmp_path, path)
+    logger.info(f"选择日志已压缩: {file_id}，{sum(len(values) for record in records for values in record.values())} 个文本块")
+
+
+def clear_selection(file_id: str):
+    """
+    清空文件的选择日志
+
+    文本块ID是拆分结果中的位置，处理结果被重写后旧ID会指向新的文本块，必须清空。
+    """
+    with _locked(file_id):
+        selection_log_path(file_id).unlink(missing_ok=True)
+        legacy_selection_path(file_id).unlink(missing_ok=True)
+
+
+def compact_selection(file_id: str):
+    """手动压缩选择日志"""
+    if not selection_log_path(file_id).exists():
+        return
+    with _locked(file_id):
+        _compact(file_id)
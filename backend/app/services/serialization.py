@@ -0,0 +1,149 @@
+import json
+import math
+import os
+from pathlib import Path, PurePath
+from typing import Any, Iterable, Iterator, Union
+
+import numpy as np
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # 未安装orjson时使用标准库，输出的JSON相同
+    orjson = None
+
+# 磁盘文件和接口响应统一使用紧凑的UTF-8 JSON：不转义非ASCII字符，分隔符后没有空格。
+# 旧版本以 json.dump（可能带 indent=2）写入的文件同样是合法JSON，可以直接读取。
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj: Any) -> Any:
+    """orjson 和标准库都不能直接序列化的类型"""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, PurePath):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"无法序列化为JSON的类型: {type(obj).__name__}")
+
+
+def _replace_non_finite(obj: Any) -> Any:
+    """把 NaN 和 Infinity 替换为 None，与 orjson 的输出一致；只在标准库编码遇到它们时调用"""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {key: _replace_non_finite(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return [_replace_non_finite(value) for value in obj]
+    if isinstance(obj, (np.ndarray, np.generic)):
+        return _replace_non_finite(obj.tolist())
+    return obj
+
+
+def _std_dumps(obj: Any, indent: bool) -> str:
+    if indent:
+        return json.dumps(obj, ensure_ascii=False, default=_default, indent=2, allow_nan=False)
+    return json.dumps(obj, ensure_ascii=False, default=_default, separators=(",", ":"), allow_nan=False)
+
+
+def dumps(obj: Any, indent: bool = False) -> bytes:
+    """
+    编码为UTF-8 JSON
+
+    NaN 和 Infinity 编码为 null（标准库默认输出的 NaN 不是合法JSON），未安装 orjson 时同样如此。
+
+    Args:
+        obj: 要编码的对象，可以包含 numpy 数组和标量
+        indent: 是否缩进两格，只用于需要手工编辑的文件（如配置文件）
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=_OPTIONS | (orjson.OPT_INDENT_2 if indent else 0))
+    try:
+        return _std_dumps(obj, indent).encode("utf-8")
+    except ValueError:
+        # 含有 NaN 或 Infinity，替换后重新编码
+        return _std_dumps(_replace_non_finite(obj), indent).encode("utf-8")
+
+
+def loads(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+    """
+    解码JSON
+
+    旧版本文件中可能有标准库写入的 NaN、Infinity，orjson 无法解析时交给标准库。
+
+    Raises:
+        json.JSONDecodeError: 不是合法的JSON
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = bytes(data).decode("utf-8")
+    return json.loads(data)
+
+
+def dumps_line(obj: Any) -> bytes:
+    """编码为一行NDJSON（以换行结尾）"""
+    return dumps(obj) + b"\n"
+
+
+def iter_dumps_array(items: Iterable[Any]) -> Iterator[bytes]:
+    """
+    流式编码JSON数组，每次只编码一个元素，适合逐块写入文件或作为流式响应返回
+    """
+    yield b"["
+    first = True
+    for item in items:
+        if first:
+            first = False
+            yield dumps(item)
+        else:
+            yield b"," + dumps(item)
+    yield b"]"
+
+
+def dump(obj: Any, path: Union[str, Path], indent: bool = False, fsync: bool = False):
+    """
+    写入JSON文件
+
+    Args:
+        obj: 要写入的对象
+        path: 文件路径
+        indent: 是否缩进两格
+        fsync: 是否在返回前刷新到磁盘
+    """
+    with open(path, "wb") as f:
+        f.write(dumps(obj, indent))
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def load(path: Union[str, Path]) -> Any:
+    """
+    读取JSON文件，兼容旧版本以 json.dump 写入的文件
+
+    Raises:
+        FileNotFoundError: 文件不存在
+        json.JSONDecodeError: 不是合法的JSON
+    """
+    with open(path, "rb") as f:
+        return loads(f.read())
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    使用 dumps 编码的JSON响应
+
+    作为应用的默认响应类；大结果的接口直接返回该响应，还能跳过 FastAPI 的 jsonable_encoder。
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
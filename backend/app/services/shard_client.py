@@ -0,0 +1,218 @@
+import base64
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+
+from app.services.config_service import ConfigService
+from app.services.resilience import CircuitBreaker, CircuitOpenError, DeadlineExceeded, remaining
+from app.services.serialization import dumps, loads
+from app.services.shard_store import merge_top_k
+from app.services.shard_worker import HEALTH_PATH, SEARCH_PATH
+
+logger = logging.getLogger(__name__)
+
+# 同时进行的分片调用数量上限，超出的调用排队，排队时间计入分片超时
+SCATTER_THREADS = 64
+
+_client: Optional[httpx.Client] = None
+_executor = ThreadPoolExecutor(max_workers=SCATTER_THREADS, thread_name_prefix="shard-scatter")
+_lock = threading.Lock()
+# 分片服务进程地址 -> (熔断配置, 熔断器)，配置变化后重新创建
+_breakers: Dict[str, Tuple[Tuple[int, float], CircuitBreaker]] = {}
+_counters: Dict[str, Dict[str, int]] = {}
+
+
+class ShardUnavailable(Exception):
+    """分片全部不可用，或不允许部分结果时有分片不可用"""
+
+
+def remote_enabled(index_data: Dict[str, Any]) -> bool:
+    """索引是否为分片索引且配置了分片服务进程"""
+    return bool(index_data.get("shards")) and bool(ConfigService.get_sharding_config()["workers"])
+
+
+def worker_for(shard: int, workers: List[str]) -> str:
+    """第 shard 个分片所在的服务进程地址"""
+    return workers[shard % len(workers)].rstrip("/")
+
+
+def _get_client() -> httpx.Client:
+    global _client
+    with _lock:
+        if _client is None:
+            _client = httpx.Client(limits=httpx.Limits(max_connections=SCATTER_THREADS * 2,
+                                                       max_keepalive_connections=SCATTER_THREADS))
+        return _client
+
+
+def _breaker(worker: str, config: Dict[str, Any]) -> CircuitBreaker:
+    settings = (config["failure_threshold"], config["reset_seconds"])
+    with _lock:
+        existing = _breakers.get(worker)
+        if existing is not None and existing[0] == settings:
+            return existing[1]
+        breaker = CircuitBreaker(f"shard {worker}", *settings)
+        _breakers[worker] = (settings, breaker)
+        _counters.setdefault(worker, {"calls": 0, "succeeded": 0, "failed": 0, "timed_out": 0,
+                                      "short_circuited": 0})
+        return breaker
+
+
+def _count(worker: str, key: str):
+    with _lock:
+        _counters[worker][key] += 1
+
+
+def _encode_mask(mask: np.ndarray) -> str:
+    """行位图按位打包（little 位序）后以 base64 编码，与 shard_worker 解码方式一致"""
+    return base64.b64encode(np.packbits(np.asarray(mask, dtype=bool), bitorder="little")).decode("ascii")
+
+
+def _call_shard(worker: str, payload: bytes, timeout: float) -> Dict[str, Any]:
+    response = _get_client().post(f"{worker}{SEARCH_PATH}", content=payload, timeout=timeout,
+                                  headers={"Content-Type": "application/json"})
+    response.raise_for_status()
+    return loads(response.content)
+
+
+def scatter_search(index_data: Dict[str, Any], query_vectors: np.ndarray, top_k: int,
+                   mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, List[List[Optional[str]]], List[int]]:
+    """
+    把查询并行发往各分片的服务进程，合并各分片的前 top_k 个结果
+
+    每个分片的调用不超过配置的 timeout_seconds 和请求剩余时间中较小的一个；超时、出错或熔断中的分片
+    计入缺失分片，allow_partial 时用其余分片的结果返回。过滤时只调用位图中有命中行的分片。
+
+    Args:
+        index_data: 分片索引的元数据
+        query_vectors: (d,) 或 (nq, d) 的查询向量
+        top_k: 每个查询返回的结果数
+        mask: 可选的全局行位图
+
+    Returns:
+        (相似度, 全局行号, 文本, 缺失的分片序号)，前三项均为 nq 行，行号为 -1 处文本为 None
+
+    Raises:
+        DeadlineExceeded: 请求已超过截止时间
+        ShardUnavailable: 没有分片返回结果，或不允许部分结果时有分片缺失
+    """
+    config = ConfigService.get_sharding_config()
+    workers = config["workers"]
+    offsets = index_data["shard_offsets"]
+    version = Path(index_data["index_store_path"]).name
+    queries = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+
+    budget = remaining()
+    timeout = config["timeout_seconds"] if budget is None else min(config["timeout_seconds"], budget)
+    if timeout <= 0:
+        raise DeadlineExceeded("分片搜索: 请求已超过截止时间")
+
+    start = time.monotonic()
+    missing = []
+    # 按服务进程分组：熔断器属于服务进程，每次分散搜索对每个进程只检查和记录一次，
+    # 半开状态下的探测放行该进程上的全部分片
+    by_worker: Dict[str, List[Tuple[int, Optional[np.ndarray]]]] = {}
+    for shard in range(int(index_data["shards"])):
+        shard_mask = None
+        if mask is not None:
+            shard_mask = mask[offsets[shard]:offsets[shard + 1]]
+            if not shard_mask.any():
+                continue
+        by_worker.setdefault(worker_for(shard, workers), []).append((shard, shard_mask))
+
+    futures = {}
+    breakers = {}
+    for worker, shards in by_worker.items():
+        breaker = _breaker(worker, config)
+        try:
+            breaker.before_call()
+        except CircuitOpenError:
+            for shard, _ in shards:
+                _count(worker, "calls")
+                _count(worker, "short_circuited")
+                missing.append(shard)
+            continue
+        breakers[worker] = breaker
+        for shard, shard_mask in shards:
+            _count(worker, "calls")
+            payload = dumps({
+                "index_id": index_data["index_id"],
+                "version": version,
+                "shard": shard,
+                "queries": queries,
+                "top_k": top_k,
+                "mask": _encode_mask(shard_mask) if shard_mask is not None else None
+            })
+            futures[_executor.submit(_call_shard, worker, payload, timeout)] = (shard, worker)
+
+    done, not_done = wait(futures, timeout=timeout)
+    failed_workers = set()
+    scores = [np.zeros((len(queries), 0), dtype=np.float32)]
+    ids = [np.zeros((len(queries), 0), dtype=np.int64)]
+    texts: List[Dict[int, str]] = [{} for _ in queries]
+    for future in not_done:
+        # 未完成的调用在超时后自行结束，结果被丢弃
+        shard, worker = futures[future]
+        _count(worker, "timed_out")
+        failed_workers.add(worker)
+        missing.append(shard)
+        logger.warning(f"分片 {shard}（{worker}）在 {timeout:.2f} 秒内没有返回")
+    # 按分片序号合并，相似度相同时的顺序与不分片时一致
+    for future in sorted(done, key=lambda f: futures[f][0]):
+        shard, worker = futures[future]
+        try:
+            result = future.result()
+            shard_scores = np.asarray(result["scores"], dtype=np.float32).reshape(len(queries), -1)
+            shard_ids = np.asarray(result["ids"], dtype=np.int64).reshape(len(queries), -1)
+        except Exception as e:
+            _count(worker, "timed_out" if isinstance(e, httpx.TimeoutException) else "failed")
+            failed_workers.add(worker)
+            missing.append(shard)
+            logger.warning(f"分片 {shard}（{worker}）搜索失败: {str(e)}")
+            continue
+        _count(worker, "succeeded")
+        scores.append(shard_scores)
+        ids.append(shard_ids)
+        for row, row_ids, row_texts in zip(texts, shard_ids, result["texts"]):
+            row.update((int(i), text) for i, text in zip(row_ids, row_texts) if i >= 0)
+    # 一次分散搜索中同一进程的多个分片失败只计一次
+    for worker, breaker in breakers.items():
+        if worker in failed_workers:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+    missing.sort()
+    if missing and (len(scores) == 1 or not config["allow_partial"]):
+        raise ShardUnavailable(f"分片不可用: {missing}，{len(scores) - 1} 个分片返回结果")
+    merged_scores, merged_ids = merge_top_k(scores, ids, top_k)
+    merged_texts = [[row.get(int(i)) for i in row_ids] for row, row_ids in zip(texts, merged_ids)]
+    logger.debug(f"分片搜索 {index_data['index_id']}: {len(futures)} 个分片，"
+                 f"{(time.monotonic() - start) * 1000:.1f}ms，缺失 {missing}")
+    return merged_scores, merged_ids, merged_texts, missing
+
+
+def shard_stats() -> Dict[str, Any]:
+    """各分片服务进程的熔断状态和调用计数"""
+    with _lock:
+        return {worker: {"state": breaker.state, "consecutive_failures": breaker.failures, **_counters[worker]}
+                for worker, (_, breaker) in _breakers.items()}
+
+
+def worker_health(timeout: float = 1.0) -> Dict[str, Any]:
+    """逐个读取配置的分片服务进程的健康状态"""
+    health = {}
+    for worker in dict.fromkeys(url.rstrip("/") for url in ConfigService.get_sharding_config()["workers"]):
+        try:
+            response = _get_client().get(f"{worker}{HEALTH_PATH}", timeout=timeout)
+            response.raise_for_status()
+            health[worker] = loads(response.content)
+        except Exception as e:
+            health[worker] = {"status": "unavailable", "error": str(e)}
+    return health
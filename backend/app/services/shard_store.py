@@ -0,0 +1,185 @@
+import logging
+from bisect import bisect_right
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from app.services.compact_store import MANIFEST_FILE, CompactIndex, write_compact_index
+from app.services.faiss_store import FaissMmapIndex, write_faiss_index
+from app.services.serialization import dump, load
+
+logger = logging.getLogger(__name__)
+
+# 分片格式版本号，格式变化时递增
+SHARD_FORMAT_VERSION = 1
+
+# 分片索引存储在索引版本目录下的子目录，每个分片一个以序号命名的目录
+SHARD_DIR = "shards"
+
+SHARD_STORAGE_FORMATS = ("compact", "faiss")
+
+
+def shard_offsets(count: int, shards: int) -> List[int]:
+    """
+    按行均匀划分的分片边界，第 i 个分片为 [offsets[i], offsets[i + 1]) 行
+
+    分片数不超过行数，每个分片至少一行（没有行时为一个空分片）。
+    """
+    shards = max(1, min(shards, count))
+    return [count * i // shards for i in range(shards + 1)]
+
+
+def write_sharded_index(path: Path, vectors: np.ndarray, texts: List[str], shards: int,
+                        storage_format: str = "faiss", quantization: str = "float16",
+                        compression: str = "none",
+                        manifest_extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    按行拆分为多个分片持久化，每个分片是一个独立的紧凑格式或FAISS原生格式索引
+
+    分片内的行号加上分片的起始行即为全局行号，与文本块元数据表的行一一对应。
+
+    Args:
+        path: 输出目录
+        vectors: (n, d) 的向量矩阵
+        texts: 与向量一一对应的文本
+        shards: 分片数，超过行数时按行数
+        storage_format: 每个分片的格式，compact 或 faiss
+        quantization: compact 格式的向量量化方式
+        compression: 文本压缩方式，none 或 zstd
+        manifest_extra: 额外写入每个分片和分片清单的信息
+
+    Returns:
+        分片清单内容
+    """
+    if storage_format not in SHARD_STORAGE_FORMATS:
+        raise ValueError(f"不支持分片的存储格式: {storage_format}")
+    if len(vectors) != len(texts):
+        raise ValueError(f"向量数量({len(vectors)})与文本数量({len(texts)})不一致")
+
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    vectors = np.asarray(vectors, dtype=np.float32).reshape(len(texts), -1)
+    offsets = shard_offsets(len(texts), shards)
+    for shard, (start, end) in enumerate(zip(offsets, offsets[1:])):
+        shard_extra = {**(manifest_extra or {}), "shard": shard, "offset": start}
+        if storage_format == "compact":
+            write_compact_index(path / str(shard), vectors[start:end], texts[start:end],
+                                quantization=quantization, compression=compression, manifest_extra=shard_extra)
+        else:
+            write_faiss_index(path / str(shard), vectors[start:end], texts[start:end],
+                              compression=compression, manifest_extra=shard_extra)
+
+    manifest = {
+        "format": "sharded",
+        "version": SHARD_FORMAT_VERSION,
+        "storage_format": storage_format,
+        "shards": len(offsets) - 1,
+        "offsets": offsets,
+        "count": len(texts),
+        "dimension": int(vectors.shape[1]) if len(texts) else 0,
+        **(manifest_extra or {})
+    }
+    dump(manifest, path / MANIFEST_FILE)
+    return manifest
+
+
+def load_shard_manifest(path: Path) -> Dict[str, Any]:
+    manifest = load(Path(path) / MANIFEST_FILE)
+    if manifest.get("version", 0) > SHARD_FORMAT_VERSION:
+        raise ValueError(f"不支持的分片索引版本: {manifest.get('version')}")
+    return manifest
+
+
+def open_shard(path: Path, shard: int) -> Union[CompactIndex, FaissMmapIndex]:
+    """打开分片目录下的第 shard 个分片"""
+    shard_path = Path(path) / str(shard)
+    manifest = load(shard_path / MANIFEST_FILE)
+    if manifest.get("format") == "faiss":
+        return FaissMmapIndex(shard_path)
+    return CompactIndex(shard_path)
+
+
+def merge_top_k(scores: List[np.ndarray], ids: List[np.ndarray], top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    合并各分片的前 k 个结果
+
+    Args:
+        scores: 各分片 (nq, k_i) 的相似度
+        ids: 各分片 (nq, k_i) 的全局行号
+        top_k: 合并后保留的结果数
+
+    Returns:
+        (相似度, 全局行号)，形状均为 (nq, k)，按相似度降序
+    """
+    all_scores = np.concatenate(scores, axis=1)
+    all_ids = np.concatenate(ids, axis=1)
+    # 稳定排序，相似度相同时序号小的分片在前，与不分片时的顺序一致
+    order = np.argsort(-all_scores, axis=1, kind="stable")[:, :top_k]
+    return np.take_along_axis(all_scores, order, axis=1), np.take_along_axis(all_ids, order, axis=1)
+
+
+class ShardedIndex:
+    """
+    在本进程中打开的分片索引
+
+    与 CompactIndex、FaissMmapIndex 接口相同：依次搜索每个分片再合并结果，按全局行号读取文本。
+    没有配置分片服务进程时用于搜索，远程分片全部不可用时用于词法降级搜索读取文本。
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.manifest = load_shard_manifest(self.path)
+        self.offsets = [int(offset) for offset in self.manifest["offsets"]]
+        self.shards = [open_shard(self.path, shard) for shard in range(self.manifest["shards"])]
+
+    def __len__(self) -> int:
+        return int(self.manifest["count"])
+
+    @property
+    def dimension(self) -> int:
+        return int(self.manifest["dimension"])
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+
+    def locate(self, i: int) -> Tuple[int, int]:
+        """全局行号对应的 (分片序号, 分片内行号)"""
+        if not 0 <= i < len(self):
+            raise IndexError(f"行号超出范围: {i}")
+        shard = bisect_right(self.offsets, i) - 1
+        return shard, i - self.offsets[shard]
+
+    def get_text(self, i: int) -> str:
+        shard, local = self.locate(i)
+        return self.shards[shard].get_text(local)
+
+    def get_texts(self, indices: List[int]) -> List[str]:
+        return [self.get_text(i) for i in indices]
+
+    def search(self, queries: np.ndarray, top_k: int = 5,
+               mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        余弦相似度搜索
+
+        Args:
+            queries: (d,) 或 (nq, d) 的查询向量
+            top_k: 每个查询返回的结果数
+            mask: 可选的全局行位图，按分片切分后在各分片内部过滤
+
+        Returns:
+            (相似度, 全局行号)，形状均为 (nq, k)，按相似度降序
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        scores = [np.zeros((len(queries), 0), dtype=np.float32)]
+        ids = [np.zeros((len(queries), 0), dtype=np.int64)]
+        for shard, index in enumerate(self.shards):
+            start, end = self.offsets[shard], self.offsets[shard + 1]
+            shard_mask = None if mask is None else np.asarray(mask[start:end], dtype=bool)
+            if shard_mask is not None and not shard_mask.any():
+                continue
+            shard_scores, shard_ids = index.search(queries, top_k, mask=shard_mask)
+            scores.append(np.asarray(shard_scores, dtype=np.float32))
+            ids.append(np.where(shard_ids >= 0, shard_ids + start, -1).astype(np.int64))
+        return merge_top_k(scores, ids, top_k)
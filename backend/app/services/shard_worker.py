@@ -0,0 +1,163 @@
+import base64
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Tuple, Union
+
+import numpy as np
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+
+from app.services.compact_store import CompactIndex
+from app.services.faiss_store import FaissMmapIndex
+from app.services.index_versions import INDEX_STORE_DIR, VERSION_PREFIX, ReaderLease, index_dir
+from app.services.serialization import FastJSONResponse, loads
+from app.services.shard_store import SHARD_DIR, load_shard_manifest, open_shard
+
+logger = logging.getLogger(__name__)
+
+# 分片服务进程的搜索接口，请求体和响应均为JSON
+SEARCH_PATH = "/shards/search"
+HEALTH_PATH = "/health"
+
+# 已打开的分片：(索引ID, 分片序号) -> (版本名, 起始行, 分片)，版本变化后打开新版本
+_shards: Dict[Tuple[str, int], Tuple[str, int, Union[CompactIndex, FaissMmapIndex]]] = {}
+_shards_lock = threading.Lock()
+_stats = {"searches": 0, "queries": 0, "errors": 0}
+
+
+def _version_path(index_id: str, version: str) -> Path:
+    """
+    由索引ID和版本名得到版本目录，只允许索引存储目录下的已发布版本
+
+    Raises:
+        ValueError: 索引ID或版本名不合法
+    """
+    if not index_id or not version.startswith(VERSION_PREFIX) or any(sep in version for sep in ("/", "\\")):
+        raise ValueError(f"无效的索引版本: {index_id}/{version}")
+    root = index_dir(index_id)
+    if root.resolve().parent != INDEX_STORE_DIR.resolve():
+        raise ValueError(f"无效的索引ID: {index_id}")
+    return root / version
+
+
+def load_shard(index_id: str, version: str, shard: int) -> Tuple[int, Union[CompactIndex, FaissMmapIndex]]:
+    """
+    打开索引版本的一个分片，同一分片在请求间复用
+
+    与主进程的内存映射索引一样，分片对象持有版本目录的引用，被替换后回收时释放。
+
+    Returns:
+        (分片起始行, 分片)
+
+    Raises:
+        ValueError: 参数不合法
+        FileNotFoundError: 版本或分片不存在
+    """
+    key = (index_id, shard)
+    cached = _shards.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1], cached[2]
+
+    version_path = _version_path(index_id, version)
+    lease = ReaderLease(version_path)
+    try:
+        manifest = load_shard_manifest(version_path / SHARD_DIR)
+        if not 0 <= shard < manifest["shards"]:
+            raise FileNotFoundError(f"分片不存在: {index_id}/{version}/{shard}")
+        index = open_shard(version_path / SHARD_DIR, shard)
+    except Exception:
+        lease.release()
+        raise
+    lease.bind(index)
+    offset = int(manifest["offsets"][shard])
+    with _shards_lock:
+        _shards[key] = (version, offset, index)
+    logger.info(f"已打开分片 {index_id}/{version}/{shard}: {len(index)} 行")
+    return offset, index
+
+
+def _decode_mask(encoded: str, length: int) -> np.ndarray:
+    """解码按位打包（little 位序）并以 base64 编码的行位图"""
+    bits = np.frombuffer(base64.b64decode(encoded), dtype=np.uint8)
+    return np.unpackbits(bits, count=length, bitorder="little").astype(bool)
+
+
+def search_shard(request: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    在一个分片中搜索
+
+    Args:
+        request: {"index_id", "version", "shard", "queries": (nq, d) 查询向量, "top_k",
+            "mask": 可选的分片行位图}
+
+    Returns:
+        {"scores", "ids": 全局行号, "texts": 命中的文本}，每项为 nq 行
+
+    Raises:
+        ValueError: 参数不合法
+        FileNotFoundError: 版本或分片不存在
+    """
+    try:
+        index_id = str(request["index_id"])
+        version = str(request["version"])
+        shard = int(request["shard"])
+        top_k = int(request["top_k"])
+        queries = np.asarray(request["queries"], dtype=np.float32)
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"无效的分片搜索请求: {str(e)}")
+    if top_k < 1 or queries.ndim != 2:
+        raise ValueError("top_k 必须为正整数，queries 必须为二维向量列表")
+
+    offset, index = load_shard(index_id, version, shard)
+    if queries.shape[1] != index.dimension:
+        raise ValueError(f"查询向量维度({queries.shape[1]})与分片维度({index.dimension})不一致")
+    mask = _decode_mask(request["mask"], len(index)) if request.get("mask") else None
+    scores, ids = index.search(queries, top_k, mask=mask)
+    texts = [[index.get_text(int(i)) if i >= 0 else None for i in row] for row in ids]
+    with _shards_lock:
+        _stats["searches"] += 1
+        _stats["queries"] += len(queries)
+    return {
+        "scores": np.asarray(scores, dtype=np.float32),
+        "ids": np.where(ids >= 0, ids + offset, -1).astype(np.int64),
+        "texts": texts
+    }
+
+
+def create_app() -> FastAPI:
+    """分片服务进程的应用，只提供分片搜索和健康检查"""
+    app = FastAPI(title="分片搜索服务", default_response_class=FastJSONResponse)
+    started_at = time.time()
+
+    @app.post(SEARCH_PATH)
+    async def search(request: Request):
+        try:
+            body = loads(await request.body())
+            return FastJSONResponse(await run_in_threadpool(search_shard, body))
+        except ValueError as e:
+            _stats["errors"] += 1
+            raise HTTPException(status_code=400, detail=str(e))
+        except FileNotFoundError as e:
+            _stats["errors"] += 1
+            raise HTTPException(status_code=404, detail=str(e))
+        except Exception as e:
+            _stats["errors"] += 1
+            raise HTTPException(status_code=500, detail=f"分片搜索失败: {str(e)}")
+
+    @app.get(HEALTH_PATH)
+    async def health():
+        with _shards_lock:
+            shards = [{"index_id": index_id, "shard": shard, "version": version, "rows": len(index)}
+                      for (index_id, shard), (version, _, index) in _shards.items()]
+        return {
+            "status": "ok",
+            "pid": os.getpid(),
+            "uptime_seconds": round(time.time() - started_at, 1),
+            "open_shards": shards,
+            **_stats
+        }
+
+    return app
@@ -1,18 +1,16 @@
 import numpy as np
-import json
 import os
 import uuid
-import shutil
 import logging
+import time
 from pathlib import Path
 from datetime import datetime
-from typing import List, Dict, Any, Optional, Union, Tuple
+from typing import List, Dict, Any, Optional, Union, Tuple, Iterator
 
 # LlamaIndex 相关导入
-from llama_index.core import Document, VectorStoreIndex, load_index_from_storage
+from llama_index.core import Document, VectorStoreIndex, QueryBundle, load_index_from_storage
 from llama_index.core.node_parser import SimpleNodeParser
 from llama_index.core.storage.storage_context import StorageContext
-from llama_index.embeddings.siliconflow import SiliconFlowEmbedding
 from llama_index.llms.siliconflow import SiliconFlow
 from llama_index.vector_stores.faiss import FaissVectorStore
 
@@ -26,32 +24,54 @@ INDEX_STORE_DIR.mkdir(exist_ok=True)
 
 # 导入配置服务
 from app.services.config_service import ConfigService
+from app.services.serialization import dump, load
+from app.services.embedding_service import get_embedding_model, get_embedding_dimension, embed_texts
+from app.services.compact_store import CompactIndex, write_compact_index
+from app.services.faiss_store import FaissMmapIndex, write_faiss_index
+from app.services.shard_store import SHARD_DIR, ShardedIndex, write_sharded_index
+from app.services import shard_client
+from app.services.dedup_service import text_key
+from app.services.context_packer import format_context, pack_context, prompt_stats
+from app.services import answer_cache
+from app.services.resilience import RemoteCallRejected, deadline, get_guard, remaining
+from app.services.chunk_metadata import METADATA_DIR, MetadataTable, write_metadata
+from app.services.index_versions import (
+    ReaderLease, abort_version, begin_version, index_dir, publish_version, read_version
+)
+
+# 紧凑格式和FAISS原生格式存储在索引目录下的子目录
+COMPACT_DIR = "compact"
+FAISS_DIR = "faiss"
+
+# 已打开的内存映射索引：索引ID -> (版本目录, 索引)，打开后可在请求间复用
+_mmap_indices: Dict[str, Tuple[Path, Union[CompactIndex, FaissMmapIndex, ShardedIndex]]] = {}
+
+# 批量搜索时每次嵌入和矩阵搜索的查询数量，流式返回时每处理完一批输出一批
+BATCH_SEARCH_SIZE = 256
+
+# 回答缓存查找时计算查询向量最多使用请求剩余时间的比例，嵌入模型无响应时为搜索和生成回答留出时间
+CACHE_LOOKUP_BUDGET_SHARE = 0.5
+
+# 近似去重的来源映射文件，保存在索引目录下
+DEDUP_MAP_FILE = "dedup_map.json"
+
+# 已打开的元数据表：索引ID -> (版本目录, 元数据表)
+_metadata_tables: Dict[str, Tuple[Path, MetadataTable]] = {}
+
+# 降级词法搜索的TF-IDF矩阵缓存：索引ID -> (版本目录, 向量化器, 稀疏矩阵)
+_lexical_indices: Dict[str, Tuple[Optional[str], Any, Any]] = {}
+
+# 已读取的来源映射：版本目录 -> 映射
+_dedup_maps: Dict[str, Dict[str, Any]] = {}
 
 # 日志配置
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def get_embedding_model():
-    """获取嵌入模型"""
-    if not ConfigService.is_llm_enabled():
-        raise ValueError("LLM未启用，请在配置中启用LLM")
-    
-    llm_type = ConfigService.get_llm_type().lower()
-    
-    if llm_type == "siliconflow":
-        # 使用SiliconFlow嵌入模型
-        embed_config = ConfigService.get_embedding_config()
-        
-        embed_model = SiliconFlowEmbedding(
-            model_name=embed_config["model_name"],
-            api_base=embed_config["api_base"],
-            api_key=embed_config["api_key"]
-        )
-        return embed_model
-    
-    # 可以根据需要添加其他类型的嵌入模型
-    else:
-        raise ValueError(f"不支持的LLM类型: {llm_type}")
+def get_index_embedding_model(index_data: Dict[str, Any]):
+    """获取与索引创建时一致的嵌入模型（提供方、模型和维度），旧索引没有记录提供方时使用其 llm_type"""
+    provider = index_data.get("embedding_provider") or index_data.get("llm_type")
+    return get_embedding_model(provider, index_data.get("model"), index_data.get("dimension"))
 
 def get_llm_model():
     """获取LLM模型"""
@@ -64,12 +84,16 @@ def get_llm_model():
         # 使用SiliconFlow LLM模型
         completion_config = ConfigService.get_completion_config()
         
+        # 重试由准入控制和熔断代替（见 call_llm），失败时尽快走降级路径
         llm = SiliconFlow(
-            model_name=completion_config["model_name"],
-            api_base=completion_config["api_base"],
+            model=completion_config["model_name"],
+            base_url=completion_config["api_base"],
             api_key=completion_config["api_key"],
             temperature=0.7,
-            max_tokens=512
+            max_tokens=512,
+            max_retries=0,
+            # 与准入控制的单次调用超时一致，放弃等待的调用不会一直占用并发名额
+            timeout=ConfigService.get_resilience_config()["llm_call_timeout_seconds"]
         )
         return llm
     
@@ -77,26 +101,37 @@ def get_llm_model():
     else:
         raise ValueError(f"不支持的LLM类型: {llm_type}")
 
-def create_vector_index(texts: List[str], file_id: str, use_llm: bool = False) -> str:
+def call_llm(func, *args, **kwargs):
+    """在LLM的准入控制（截止时间、并发限制、熔断）下调用，如 call_llm(llm.complete, prompt)"""
+    return get_guard("llm").call(func, *args, **kwargs)
+
+def create_vector_index(texts: List[str], file_id: str, use_llm: bool = False,
+                        dedup: Optional[Dict[str, Any]] = None, index_id: Optional[str] = None,
+                        metadata: Optional[List[Dict[str, Any]]] = None) -> str:
     """
     为文本创建向量索引
     
+    索引先写入临时构建目录，完成后作为新版本原子发布；重建已有索引时，
+    搜索在新版本发布之前一直使用旧版本，旧版本在没有读者引用后回收。
+    
     Args:
         texts: 文本列表
         file_id: 原始文件ID
         use_llm: 是否使用LLM生成嵌入向量，默认为False
+        dedup: 近似去重信息 {"stats": 统计, "source_map": 来源映射}，texts 应为去重后的文本
+        index_id: 要重建的索引ID，为空时创建新索引
+        metadata: 与 texts 一一对应的文本块元数据（row_id、column、group、chunk、tags 等），
+            保存后可在搜索时按元数据过滤；为空时只记录 file_id
         
     Returns:
         索引ID
     """
     # 生成唯一的索引ID
-    index_id = f"{file_id}_{uuid.uuid4().hex[:8]}_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    if index_id is None:
+        index_id = f"{file_id}_{uuid.uuid4().hex[:8]}_{datetime.now().strftime('%Y%m%d%H%M%S')}"
     
-    # 为当前索引创建专用目录
-    index_store_path = INDEX_STORE_DIR / index_id
-    if index_store_path.exists():
-        shutil.rmtree(index_store_path)
-    index_store_path.mkdir(exist_ok=True)
+    # 在索引目录下创建新版本的构建目录
+    index_store_path = begin_version(index_id)
     
     # 索引元数据
     index_metadata = {
@@ -107,8 +142,16 @@ def create_vector_index(texts: List[str], file_id: str, use_llm: bool = False) -
         "embedding_type": "llm" if use_llm else "tfidf"
     }
     
+    if dedup:
+        # 保存被合并文本块的来源，搜索结果可以反查全部来源
+        dump(dedup["source_map"], index_store_path / DEDUP_MAP_FILE)
+        index_metadata["dedup"] = dedup["stats"]
+    
+    if metadata is None:
+        metadata = [{"file_id": file_id} for _ in texts]
+    
     try:
-        if use_llm and ConfigService.is_llm_enabled():
+        if use_llm and ConfigService.is_embedding_enabled():
             # 使用LlamaIndex创建文档对象
             documents = [Document(text=text) for text in texts]
             
@@ -118,29 +161,80 @@ def create_vector_index(texts: List[str], file_id: str, use_llm: bool = False) -
             # 获取嵌入模型
             embed_model = get_embedding_model()
             
-            # 创建FAISS向量存储
-            import faiss
-            dimension = 1024  # BGE-large-zh-v1.5的向量维度是1024
-            faiss_index = faiss.IndexFlatL2(dimension)
-            vector_store = FaissVectorStore(faiss_index=faiss_index)
-            storage_context = StorageContext.from_defaults(vector_store=vector_store)
-            
-            # 创建向量索引
-            index = VectorStoreIndex.from_documents(
-                documents=documents,
-                storage_context=storage_context,
-                embed_model=embed_model,
-                use_gpu=False
-            )
-            
-            # 持久化索引
-            index.storage_context.persist(persist_dir=str(index_store_path))
+            storage_config = ConfigService.get_index_storage_config()
+            if storage_config["format"] in ("compact", "faiss"):
+                # 切分节点后批量嵌入，每个节点继承其来源文本的元数据
+                nodes = parser.get_nodes_from_documents(documents)
+                node_texts = [node.get_content() for node in nodes]
+                document_positions = {document.doc_id: i for i, document in enumerate(documents)}
+                node_metadata = [metadata[document_positions[node.ref_doc_id]] for node in nodes]
+                vectors = embed_texts(node_texts, embed_model)
+                dimension = int(vectors.shape[1])
+                shards = ConfigService.get_sharding_config()["shards"]
+                if shards > 1:
+                    # 分片索引：按行拆分为多个同格式的索引，可以由多个分片服务进程分别搜索
+                    manifest = write_sharded_index(
+                        index_store_path / SHARD_DIR,
+                        vectors,
+                        node_texts,
+                        shards,
+                        storage_format=storage_config["format"],
+                        quantization=storage_config["quantization"],
+                        compression=storage_config["compression"],
+                        manifest_extra={"model": embed_model.model_name}
+                    )
+                    index_metadata["shards"] = manifest["shards"]
+                    index_metadata["shard_offsets"] = manifest["offsets"]
+                elif storage_config["format"] == "compact":
+                    # 紧凑格式：量化向量并以二进制保存文本
+                    write_compact_index(
+                        index_store_path / COMPACT_DIR,
+                        vectors,
+                        node_texts,
+                        quantization=storage_config["quantization"],
+                        compression=storage_config["compression"],
+                        manifest_extra={"model": embed_model.model_name}
+                    )
+                else:
+                    # FAISS原生格式：搜索时以只读内存映射打开，多个worker共享页缓存
+                    write_faiss_index(
+                        index_store_path / FAISS_DIR,
+                        vectors,
+                        node_texts,
+                        compression=storage_config["compression"],
+                        manifest_extra={"model": embed_model.model_name}
+                    )
+                write_metadata(index_store_path / METADATA_DIR, node_metadata)
+                index_metadata["storage_format"] = storage_config["format"]
+                index_metadata["chunk_count"] = len(node_texts)
+                index_metadata["filterable"] = True
+                # 文本已保存在索引存储中，元数据中不再重复
+                del index_metadata["texts"]
+            else:
+                # 创建FAISS向量存储，维度从嵌入模型探测
+                import faiss
+                dimension = get_embedding_dimension(embed_model)
+                faiss_index = faiss.IndexFlatL2(dimension)
+                vector_store = FaissVectorStore(faiss_index=faiss_index)
+                storage_context = StorageContext.from_defaults(vector_store=vector_store)
+                
+                # 创建向量索引
+                index = VectorStoreIndex.from_documents(
+                    documents=documents,
+                    storage_context=storage_context,
+                    embed_model=embed_model,
+                    use_gpu=False
+                )
+                
+                # 持久化索引
+                index.storage_context.persist(persist_dir=str(index_store_path))
+                index_metadata["storage_format"] = "llamaindex"
             
             # 更新元数据
             index_metadata["llm_type"] = ConfigService.get_llm_type().lower()
-            embed_config = ConfigService.get_embedding_config()
-            index_metadata["model"] = embed_config["model_name"]
-            index_metadata["index_store_path"] = str(index_store_path)
+            index_metadata["embedding_provider"] = ConfigService.get_embedding_type().lower()
+            index_metadata["model"] = embed_model.model_name
+            index_metadata["dimension"] = dimension
             
             logger.info(f"使用LlamaIndex创建向量索引: {index_id}")
         else:
@@ -159,26 +253,52 @@ def create_vector_index(texts: List[str], file_id: str, use_llm: bool = False) -
             index_metadata["vocabulary"] = vectorizer.vocabulary_
             index_metadata["idf"] = vectorizer.idf_.tolist()
             index_metadata["embedding_type"] = "tfidf"
+            write_metadata(index_store_path / METADATA_DIR, metadata)
+            index_metadata["filterable"] = True
             logger.info(f"使用TF-IDF创建向量索引: {index_id}")
     except Exception as e:
         logger.error(f"创建向量索引失败: {str(e)}")
+        abort_version(index_store_path)
         # 如果使用LLM失败，回退到TF-IDF
         if use_llm:
             logger.warning(f"LLM嵌入失败，回退到TF-IDF: {str(e)}")
             # 递归调用，但不使用LLM
-            return create_vector_index(texts, file_id, use_llm=False)
+            return create_vector_index(texts, file_id, use_llm=False, dedup=dedup, index_id=index_id,
+                                       metadata=metadata)
         else:
             # 如果TF-IDF也失败，则抛出异常
             raise ValueError(f"创建向量索引失败: {str(e)}")
     
-    # 保存元数据到文件
-    index_file = VECTOR_DIR / f"{index_id}.json"
-    with open(index_file, "w", encoding="utf-8") as f:
-        json.dump(index_metadata, f, ensure_ascii=False)
+    # 发布新版本并原子替换元数据文件
+    publish_version(index_id, index_store_path, VECTOR_DIR / f"{index_id}.json", index_metadata)
+    # 重建后旧版本生成的回答不再有效
+    answer_cache.invalidate_index(index_id)
     
     return index_id
 
-def search_vector_index(query: str, index_id: str, top_k: int = 5, rerank: bool = False) -> List[Dict[str, Any]]:
+def load_index_version(index_id: str) -> Tuple[Dict[str, Any], Optional[ReaderLease]]:
+    """
+    读取索引元数据，并持有其当前版本的引用
+    
+    读取元数据和持有引用之间版本可能恰好被替换并回收，此时重新读取元数据。
+    
+    Returns:
+        (索引元数据, 版本引用)，没有版本目录的索引引用为 None，使用完毕后需调用 release
+    """
+    index_file = VECTOR_DIR / f"{index_id}.json"
+    for _ in range(3):
+        index_data = load(index_file)
+        if "index_store_path" not in index_data:
+            return index_data, None
+        try:
+            return index_data, ReaderLease(Path(index_data["index_store_path"]))
+        except FileNotFoundError:
+            continue
+    raise FileNotFoundError(f"索引版本不可用: {index_id}")
+
+def search_vector_index(query: str, index_id: str, top_k: int = 5, rerank: bool = False,
+                        filters: Optional[Dict[str, Any]] = None,
+                        query_vector: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
     """
     在向量索引中搜索相似内容
     
@@ -187,23 +307,50 @@ def search_vector_index(query: str, index_id: str, top_k: int = 5, rerank: bool
         index_id: 索引ID
         top_k: 返回的最相似结果数量
         rerank: 是否使用LLM重排序结果，仅当LLM启用时有效
+        filters: 元数据过滤表达式，在向量搜索内部过滤，返回的结果仍是满足条件的前 top_k 个
+        query_vector: 已用该索引的嵌入模型计算好的查询向量，为空时在搜索时计算
         
     Returns:
         相似度最高的文本列表
+        
+    Raises:
+        ValueError: 过滤表达式不合法，或索引不支持过滤
     """
-    # 读取索引文件
-    index_file = VECTOR_DIR / f"{index_id}.json"
-    with open(index_file, "r", encoding="utf-8") as f:
-        index_data = json.load(f)
-    
+    # 读取索引文件，搜索期间持有当前版本的引用，重建不会影响正在进行的搜索
+    index_data, lease = load_index_version(index_id)
+    try:
+        return _search_index_data(query, index_data, top_k, rerank, filters, query_vector)
+    finally:
+        if lease is not None:
+            lease.release()
+
+def _search_index_data(query: str, index_data: Dict[str, Any], top_k: int, rerank: bool,
+                       filters: Optional[Dict[str, Any]] = None,
+                       query_vector: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+    """在已读取元数据的索引版本中搜索"""
     embedding_type = index_data.get("embedding_type", "tfidf")
     results = []
     
-    if embedding_type == "llm" and "index_store_path" in index_data:
+    # 按过滤表达式计算命中的行位图
+    metadata_table = load_metadata_table(index_data) if index_data.get("filterable") else None
+    mask = None
+    if filters:
+        if metadata_table is None:
+            raise ValueError("该索引没有保存文本块元数据，不支持过滤，请以 faiss 或 compact 格式重建")
+        mask = metadata_table.evaluate(filters)
+    
+    if embedding_type == "llm" and index_data.get("storage_format") in ("compact", "faiss"):
+        try:
+            results = search_mmap_index(query, index_data, top_k, mask, query_vector)
+            logger.info(f"使用{index_data['storage_format']}索引搜索完成，找到{len(results)}个结果")
+        except Exception as e:
+            logger.warning(f"{index_data['storage_format']}索引搜索失败，回退到词法搜索: {str(e)}")
+            embedding_type = "lexical"
+    elif embedding_type == "llm" and "index_store_path" in index_data:
         try:
             # 使用LlamaIndex加载索引
             index_store_path = index_data["index_store_path"]
-            embed_model = get_embedding_model()
+            embed_model = get_index_embedding_model(index_data)
             
             # 从持久化存储加载索引
             storage_context = StorageContext.from_defaults(
@@ -218,7 +365,10 @@ def search_vector_index(query: str, index_id: str, top_k: int = 5, rerank: bool
             
             # 创建检索器
             retriever = loaded_index.as_retriever(similarity_top_k=top_k)
-            retrieved_nodes = retriever.retrieve(query)
+            if query_vector is not None:
+                retrieved_nodes = retriever.retrieve(QueryBundle(query_str=query, embedding=query_vector.tolist()))
+            else:
+                retrieved_nodes = retriever.retrieve(query)
             
             # 转换为结果格式
             for node in retrieved_nodes:
@@ -230,9 +380,13 @@ def search_vector_index(query: str, index_id: str, top_k: int = 5, rerank: bool
             logger.info(f"使用LlamaIndex搜索完成，找到{len(results)}个结果")
             
         except Exception as e:
-            logger.warning(f"LlamaIndex搜索失败，回退到TF-IDF: {str(e)}")
-            # 回退到TF-IDF搜索
-            embedding_type = "tfidf"
+            logger.warning(f"LlamaIndex搜索失败，回退到词法搜索: {str(e)}")
+            # 嵌入模型不可用时回退到不需要嵌入模型的词法搜索
+            embedding_type = "lexical"
+    
+    if embedding_type == "lexical":
+        results = lexical_search(query, index_data, top_k, mask, metadata_table)
+        logger.info(f"使用词法搜索完成，找到{len(results)}个结果")
     
     if embedding_type == "tfidf":
         # 使用原有的TF-IDF方法
@@ -250,18 +404,28 @@ def search_vector_index(query: str, index_id: str, top_k: int = 5, rerank: bool
         # 计算相似度
         similarities = cosine_similarity(query_vector, np.array(index_data["vectors"]))[0]
         
-        # 获取相似度最高的结果
-        top_indices = np.argsort(similarities)[::-1][:top_k]
+        # 获取相似度最高的结果，过滤时只在命中的行中选取
+        if mask is not None:
+            top_indices = np.flatnonzero(mask)
+            top_indices = top_indices[np.argsort(similarities[top_indices])[::-1][:top_k]]
+        else:
+            top_indices = np.argsort(similarities)[::-1][:top_k]
         
         results = []
         for idx in top_indices:
-            results.append({
+            result = {
                 "text": index_data["texts"][idx],
                 "similarity": float(similarities[idx])
-            })
+            }
+            if metadata_table is not None:
+                result["metadata"] = metadata_table.get(int(idx))
+            results.append(result)
         
         logger.info(f"使用TF-IDF搜索完成，找到{len(results)}个结果")
     
+    if index_data.get("dedup"):
+        attach_dedup_sources(results, index_data)
+    
     # 使用LLM重排序结果
     if rerank and results and ConfigService.is_llm_enabled():
         try:
@@ -273,6 +437,404 @@ def search_vector_index(query: str, index_id: str, top_k: int = 5, rerank: bool
     
     return results
 
+def lexical_search(query: str, index_data: Dict[str, Any], top_k: int = 5,
+                   mask: Optional[np.ndarray] = None,
+                   metadata_table: Optional[MetadataTable] = None) -> List[Dict[str, Any]]:
+    """
+    不调用嵌入模型的词法搜索，嵌入模型超时、出错或熔断时作为向量索引的降级路径
+    
+    对索引文本按字符 1~2-gram 建立 TF-IDF 矩阵（中文没有空格分词），每个索引版本只建立一次。
+    结果带有 degraded 标记。
+    
+    Args:
+        query: 查询文本
+        index_data: 索引元数据
+        top_k: 返回的结果数量
+        mask: 元数据过滤得到的行位图
+        metadata_table: 文本块元数据表
+        
+    Returns:
+        相似度最高的文本列表
+    """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    
+    index_id = index_data["index_id"]
+    version_path = index_data.get("index_store_path")
+    mmap_index = load_mmap_index(index_data) if index_data.get("storage_format") in ("compact", "faiss") else None
+    cached = _lexical_indices.get(index_id)
+    if cached is None or cached[0] != version_path:
+        if mmap_index is not None:
+            texts = [mmap_index.get_text(i) for i in range(len(mmap_index))]
+        else:
+            texts = index_data["texts"]
+        vectorizer = TfidfVectorizer(analyzer="char_wb", ngram_range=(1, 2))
+        cached = (version_path, vectorizer, vectorizer.fit_transform(texts))
+        _lexical_indices[index_id] = cached
+    _, vectorizer, matrix = cached
+    
+    # 行向量已做L2归一化，点积即余弦相似度
+    similarities = (matrix @ vectorizer.transform([query]).T).toarray().ravel()
+    candidates = np.flatnonzero(mask) if mask is not None else np.arange(len(similarities))
+    top_indices = candidates[np.argsort(-similarities[candidates], kind="stable")[:top_k]]
+    
+    results = []
+    for idx in top_indices:
+        idx = int(idx)
+        result = {
+            "text": mmap_index.get_text(idx) if mmap_index is not None else index_data["texts"][idx],
+            "similarity": float(similarities[idx]),
+            "degraded": True
+        }
+        if metadata_table is not None:
+            result["metadata"] = metadata_table.get(idx)
+        results.append(result)
+    return results
+
+def load_metadata_table(index_data: Dict[str, Any]) -> MetadataTable:
+    """打开索引当前版本的文本块元数据表，版本变化后重新打开"""
+    index_id = index_data["index_id"]
+    version_path = Path(index_data["index_store_path"])
+    cached = _metadata_tables.get(index_id)
+    if cached is None or cached[0] != version_path:
+        cached = (version_path, MetadataTable(version_path / METADATA_DIR))
+        _metadata_tables[index_id] = cached
+    return cached[1]
+
+def load_dedup_map(index_data: Dict[str, Any]) -> Dict[str, Any]:
+    """读取索引版本的近似去重来源映射，同一版本只读取一次"""
+    key = index_data.get("index_store_path") or str(index_dir(index_data["index_id"]))
+    if key not in _dedup_maps:
+        map_file = Path(key) / DEDUP_MAP_FILE
+        if map_file.exists():
+            _dedup_maps[key] = load(map_file)
+        else:
+            _dedup_maps[key] = {}
+    return _dedup_maps[key]
+
+def attach_dedup_sources(results: List[Dict[str, Any]], index_data: Dict[str, Any]):
+    """为命中去重后保留文本的结果补充被合并文本块的来源"""
+    try:
+        dedup_map = load_dedup_map(index_data)
+    except Exception as e:
+        logger.warning(f"读取去重来源映射失败: {str(e)}")
+        return
+    for result in results:
+        sources = dedup_map.get(text_key(result["text"]))
+        if sources:
+            result["source_chunk_ids"] = sources["chunk_ids"]
+            result["duplicate_count"] = sources["count"] - 1
+
+def load_mmap_index(index_data: Dict[str, Any]) -> Union[CompactIndex, FaissMmapIndex, ShardedIndex]:
+    """
+    按索引的持久化格式打开紧凑索引、FAISS原生索引或分片索引
+    
+    每个索引缓存当前版本打开的对象，版本变化后打开新版本；旧对象在最后一个
+    正在使用它的请求结束后被回收，同时释放对旧版本的引用。
+    """
+    index_id = index_data["index_id"]
+    version_path = Path(index_data["index_store_path"])
+    cached = _mmap_indices.get(index_id)
+    if cached is not None and cached[0] == version_path:
+        return cached[1]
+    
+    lease = ReaderLease(version_path)
+    try:
+        if index_data.get("shards"):
+            mmap_index = ShardedIndex(version_path / SHARD_DIR)
+        elif index_data.get("storage_format") == "faiss":
+            mmap_index = FaissMmapIndex(version_path / FAISS_DIR)
+        else:
+            mmap_index = CompactIndex(version_path / COMPACT_DIR)
+    except Exception:
+        lease.release()
+        raise
+    lease.bind(mmap_index)
+    _mmap_indices[index_id] = (version_path, mmap_index)
+    return mmap_index
+
+def search_vectors(index_data: Dict[str, Any], query_vectors: np.ndarray, top_k: int,
+                   mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, List[List[Optional[str]]], List[int]]:
+    """
+    在紧凑格式、FAISS原生格式或分片索引中搜索，只解码命中结果的文本
+    
+    分片索引配置了分片服务进程时，查询并行发往各分片再合并结果，否则在本进程中搜索。
+    
+    Returns:
+        (相似度, 行号, 文本, 缺失的分片序号)，前三项均为 nq 行，行号为 -1 处文本为 None
+    
+    Raises:
+        RemoteCallRejected: 请求已超过截止时间
+        ShardUnavailable: 分片服务进程不可用
+    """
+    if shard_client.remote_enabled(index_data):
+        return shard_client.scatter_search(index_data, query_vectors, top_k, mask)
+    mmap_index = load_mmap_index(index_data)
+    scores, ids = mmap_index.search(query_vectors, top_k, mask=mask)
+    texts = [[mmap_index.get_text(int(i)) if i >= 0 else None for i in row] for row in ids]
+    return scores, ids, texts, []
+
+def _mark_partial(results: List[Dict[str, Any]], missing: List[int]):
+    """部分分片缺失时的结果与降级结果一样标记 degraded，并记录缺失的分片"""
+    for result in results:
+        result["degraded"] = True
+        result["missing_shards"] = missing
+
+def search_mmap_index(query: str, index_data: Dict[str, Any], top_k: int = 5,
+                      mask: Optional[np.ndarray] = None,
+                      query_vector: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+    """
+    在内存映射打开的索引（紧凑格式或FAISS原生格式）中搜索，只解码命中结果的文本
+    
+    Args:
+        query: 查询文本
+        index_data: 索引元数据
+        top_k: 返回的最相似结果数量
+        mask: 元数据过滤得到的行位图
+        query_vector: 已计算好的查询向量，为空时使用索引的嵌入模型计算
+        
+    Returns:
+        相似度最高的文本列表
+    """
+    metadata_table = load_metadata_table(index_data) if index_data.get("filterable") else None
+    if query_vector is None:
+        embed_model = get_index_embedding_model(index_data)
+        query_vector = embed_model.get_query_embedding(query)
+    query_vector = np.asarray(query_vector, dtype=np.float32)
+    scores, ids, texts, missing = search_vectors(index_data, query_vector, top_k, mask)
+    results = []
+    for score, idx, text in zip(scores[0], ids[0], texts[0]):
+        if idx < 0:
+            continue
+        result = {"text": text, "similarity": float(score)}
+        if metadata_table is not None:
+            result["metadata"] = metadata_table.get(int(idx))
+        results.append(result)
+    if missing:
+        _mark_partial(results, missing)
+    return results
+
+def embedding_key(index_data: Dict[str, Any]) -> Optional[Tuple[str, str, Optional[int]]]:
+    """索引使用的嵌入模型的标识（提供方、模型、维度），TF-IDF 索引为 None"""
+    if index_data.get("embedding_type", "tfidf") != "llm":
+        return None
+    return (index_data.get("embedding_provider") or index_data.get("llm_type"), index_data.get("model"),
+            index_data.get("dimension"))
+
+class _BatchSearcher:
+    """
+    批量搜索时持有一个索引版本的引用和已加载的数据
+
+    整个批次只读取一次索引元数据、打开一次索引、计算一次过滤位图；
+    TF-IDF 索引的向量矩阵和 LlamaIndex 索引也只加载一次。
+    """
+
+    def __init__(self, index_id: str, filters: Optional[Dict[str, Any]] = None):
+        self.index_id = index_id
+        self.index_data, self.lease = load_index_version(index_id)
+        try:
+            self.metadata_table = load_metadata_table(self.index_data) if self.index_data.get("filterable") else None
+            self.mask = None
+            if filters:
+                if self.metadata_table is None:
+                    raise ValueError(f"索引 {index_id} 没有保存文本块元数据，不支持过滤，请以 faiss 或 compact 格式重建")
+                self.mask = self.metadata_table.evaluate(filters)
+        except Exception:
+            self.close()
+            raise
+        self._tfidf = None
+        self._retriever = None
+
+    @property
+    def embedding_key(self) -> Optional[Tuple[str, str, Optional[int]]]:
+        """嵌入模型的标识，相同模型的索引共用一次查询嵌入；TF-IDF 索引为 None"""
+        return embedding_key(self.index_data)
+
+    def close(self):
+        if self.lease is not None:
+            self.lease.release()
+            self.lease = None
+
+    def search(self, queries: List[str], query_vectors: Optional[np.ndarray], top_k: int) -> List[List[Dict[str, Any]]]:
+        """
+        搜索一批查询
+
+        Args:
+            queries: 查询文本
+            query_vectors: (nq, d) 的查询向量，TF-IDF 索引为 None
+            top_k: 每个查询返回的结果数量
+
+        Returns:
+            与 queries 一一对应的结果列表
+        """
+        storage_format = self.index_data.get("storage_format")
+        missing = []
+        if query_vectors is None:
+            scores, ids = self._search_tfidf(queries, top_k)
+            texts = [[self._get_text(int(i)) for i in row] for row in ids]
+        elif storage_format in ("compact", "faiss"):
+            scores, ids, texts, missing = search_vectors(self.index_data, query_vectors, top_k, self.mask)
+        else:
+            return self._search_llamaindex(queries, query_vectors, top_k)
+
+        batch_results = []
+        for row_scores, row_ids, row_texts in zip(scores, ids, texts):
+            results = []
+            for score, idx, text in zip(row_scores, row_ids, row_texts):
+                if idx < 0:
+                    continue
+                result = {"text": text, "similarity": float(score)}
+                if self.metadata_table is not None:
+                    result["metadata"] = self.metadata_table.get(int(idx))
+                results.append(result)
+            if missing:
+                _mark_partial(results, missing)
+            if self.index_data.get("dedup"):
+                attach_dedup_sources(results, self.index_data)
+            batch_results.append(results)
+        return batch_results
+
+    def _get_text(self, i: int) -> str:
+        return self.index_data["texts"][i]
+
+    def _search_tfidf(self, queries: List[str], top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """稀疏的查询矩阵与索引向量矩阵相乘，一次得到所有查询的相似度"""
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.preprocessing import normalize
+
+        if self._tfidf is None:
+            vectorizer = TfidfVectorizer(vocabulary=self.index_data["vocabulary"])
+            vectorizer.idf_ = np.array(self.index_data["idf"])
+            vectors = normalize(np.asarray(self.index_data["vectors"], dtype=np.float32))
+            self._tfidf = (vectorizer, vectors)
+        vectorizer, vectors = self._tfidf
+
+        query_matrix = normalize(vectorizer.transform(queries))
+        similarities = np.asarray(query_matrix @ vectors.T, dtype=np.float32)
+        if self.mask is not None:
+            similarities[:, ~self.mask] = -np.inf
+        k = min(top_k, len(vectors) if self.mask is None else int(np.count_nonzero(self.mask)))
+        if k == 0:
+            return np.zeros((len(queries), 0), dtype=np.float32), np.zeros((len(queries), 0), dtype=np.int64)
+        ids = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(similarities, ids, axis=1)
+        order = np.argsort(-scores, axis=1)
+        return np.take_along_axis(scores, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+    def _search_llamaindex(self, queries: List[str], query_vectors: np.ndarray,
+                           top_k: int) -> List[List[Dict[str, Any]]]:
+        """LlamaIndex 格式只加载一次索引，使用预先批量计算的查询向量逐个检索"""
+        if self._retriever is None:
+            index_store_path = self.index_data["index_store_path"]
+            storage_context = StorageContext.from_defaults(
+                vector_store=FaissVectorStore.from_persist_dir(index_store_path),
+                persist_dir=index_store_path
+            )
+            loaded_index = load_index_from_storage(
+                storage_context=storage_context,
+                embed_model=get_index_embedding_model(self.index_data)
+            )
+            self._retriever = loaded_index.as_retriever(similarity_top_k=top_k)
+
+        batch_results = []
+        for query, query_vector in zip(queries, query_vectors):
+            nodes = self._retriever.retrieve(QueryBundle(query_str=query, embedding=query_vector.tolist()))
+            results = [
+                {"text": node.node.text, "similarity": float(node.score) if hasattr(node, 'score') else 0.0}
+                for node in nodes
+            ]
+            if self.index_data.get("dedup"):
+                attach_dedup_sources(results, self.index_data)
+            batch_results.append(results)
+        return batch_results
+
+def iter_batch_search(queries: List[str], index_ids: List[str], top_k: int = 5,
+                      filters: Optional[Dict[str, Any]] = None) -> Iterator[List[Dict[str, Any]]]:
+    """
+    在一个或多个向量索引中批量搜索，按查询顺序逐个产出结果
+
+    每 BATCH_SEARCH_SIZE 个查询为一批：每种嵌入模型只调用一次批量嵌入，
+    每个索引只做一次 (nq, d) 的矩阵搜索。多个索引的结果按相似度合并，
+    每个结果附带 index_id。批量搜索只返回向量搜索结果，不进行LLM重排序或生成回答。
+    
+    Args:
+        queries: 查询文本列表
+        index_ids: 索引ID列表
+        top_k: 每个查询返回的最相似结果数量
+        filters: 元数据过滤表达式，应用于每个索引
+        
+    Returns:
+        与 queries 一一对应的结果列表的迭代器
+        
+    Raises:
+        ValueError: 过滤表达式不合法，或某个索引不支持过滤；在开始搜索前立即抛出
+    """
+    # 先打开全部索引，过滤表达式等错误在返回迭代器之前抛出
+    searchers = []
+    try:
+        for index_id in index_ids:
+            searchers.append(_BatchSearcher(index_id, filters))
+    except Exception:
+        for searcher in searchers:
+            searcher.close()
+        raise
+    return _iter_batches(queries, searchers, top_k)
+
+def _iter_batches(queries: List[str], searchers: List[_BatchSearcher],
+                  top_k: int) -> Iterator[List[Dict[str, Any]]]:
+    """逐批嵌入和搜索，整个批次期间持有各索引当前版本的引用"""
+    try:
+        for start in range(0, len(queries), BATCH_SEARCH_SIZE):
+            batch = queries[start:start + BATCH_SEARCH_SIZE]
+            # 相同嵌入模型的索引共用一次批量嵌入
+            query_vectors = {}
+            for searcher in searchers:
+                key = searcher.embedding_key
+                if key is not None and key not in query_vectors:
+                    embed_model = get_index_embedding_model(searcher.index_data)
+                    # 已注册的嵌入模型对查询和文本使用同一模型，可以走批量文本嵌入接口
+                    try:
+                        query_vectors[key] = embed_texts(batch, embed_model)
+                    except Exception as e:
+                        logger.warning(f"批量嵌入失败，本批使用词法搜索: {str(e)}")
+                        query_vectors[key] = None
+            
+            merged = [[] for _ in batch]
+            for searcher in searchers:
+                key = searcher.embedding_key
+                batch_results = None
+                if key is None or query_vectors[key] is not None:
+                    try:
+                        batch_results = searcher.search(batch, query_vectors.get(key), top_k)
+                    except (RemoteCallRejected, shard_client.ShardUnavailable) as e:
+                        logger.warning(f"索引 {searcher.index_id} 的分片不可用，本批使用词法搜索: {str(e)}")
+                if batch_results is None:
+                    batch_results = [
+                        lexical_search(query, searcher.index_data, top_k, searcher.mask, searcher.metadata_table)
+                        for query in batch
+                    ]
+                    if searcher.index_data.get("dedup"):
+                        for results in batch_results:
+                            attach_dedup_sources(results, searcher.index_data)
+                for results, index_results in zip(merged, batch_results):
+                    for result in index_results:
+                        result["index_id"] = searcher.index_id
+                    results.extend(index_results)
+            
+            for results in merged:
+                if len(searchers) > 1:
+                    results.sort(key=lambda x: x["similarity"], reverse=True)
+                yield results[:top_k]
+        
+        logger.info(f"批量搜索完成: {len(queries)}个查询，{len(searchers)}个索引")
+    finally:
+        for searcher in searchers:
+            searcher.close()
+
+def batch_search(queries: List[str], index_ids: List[str], top_k: int = 5,
+                 filters: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+    """批量搜索并返回全部结果，参数同 iter_batch_search"""
+    return list(iter_batch_search(queries, index_ids, top_k, filters))
+
 def rerank_results(query: str, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
     使用LLM重排序搜索结果
@@ -293,12 +855,12 @@ def rerank_results(query: str, results: List[Dict[str, Any]]) -> List[Dict[str,
         
         # 构建提示
         prompt = f"请评估以下文本片段与查询的相关性，并按照相关性从高到低排序。\n\n查询: {query}\n\n"
-        print(prompt)
+        logger.debug(prompt)
         for i, result in enumerate(results):
             prompt += f"[{i}] {result['text']}\n"
         
         # 使用LLM进行重排序
-        response = llm.complete(prompt)
+        response = call_llm(llm.complete, prompt)
         reply = response.text
         
         # 尝试从回复中提取索引
@@ -321,7 +883,125 @@ def rerank_results(query: str, results: List[Dict[str, Any]]) -> List[Dict[str,
     # 如果重排序失败，返回原始结果
     return results
 
-def semantic_search(query: str, index_id: str, top_k: int = 5) -> List[Dict[str, Any]]:
+def _answer_prompt(context: str, query: str) -> str:
+    """构建更明确的提示，引导LLM生成直接回答"""
+    return f"""基于以下文本片段，直接回答用户的问题。
+
+            {context}
+
+            用户问题: {query}
+
+            请提供一个完整、准确的回答。回答应该直接针对用户问题，而不是简单列出相关文本。如果文本片段中没有足够信息回答问题，请明确指出。
+
+            回答:"""
+
+def generate_answer(query: str, results: List[Dict[str, Any]]) -> Tuple[str, Dict[str, Any]]:
+    """
+    基于搜索结果生成直接回答
+    
+    启用上下文组装时在词元预算内组装上下文（去除重叠、按相关性填充、截取低排名片段），
+    否则放入全部结果的原文。
+    
+    Args:
+        query: 查询文本
+        results: 按相关性排序的搜索结果
+        
+    Returns:
+        (回答, 上下文统计)，统计中包含实际和未组装时的提示词元数及估算节省的时间
+    """
+    llm = get_llm_model()
+    unpacked_prompt = _answer_prompt(format_context([result["text"] for result in results]), query)
+    if ConfigService.get_context_packing_config()["enabled"]:
+        pieces, packing = pack_context(query, results)
+        prompt = _answer_prompt(format_context(pieces), query)
+    else:
+        prompt = unpacked_prompt
+        packing = {}
+    
+    start = time.perf_counter()
+    response = call_llm(llm.complete, prompt)
+    context_stats = prompt_stats(prompt, unpacked_prompt, packing)
+    context_stats["llm_seconds"] = round(time.perf_counter() - start, 3)
+    logger.info(f"回答生成: 提示 {context_stats['prompt_tokens']} 词元，"
+                f"未组装 {context_stats['unpacked_prompt_tokens']} 词元")
+    return response.text, context_stats
+
+def _lookup_answer_cache(query: str, index_ids: List[str],
+                         params: Dict[str, Any]) -> Tuple[Optional[str], Dict[str, np.ndarray], Optional[Dict[str, Any]]]:
+    """
+    在生成回答的语义缓存中查找
+    
+    缓存范围由各索引的当前版本、搜索参数、嵌入模型和LLM配置决定；查询向量使用第一个非 TF-IDF 索引的
+    嵌入模型计算，未命中时传给使用同一嵌入模型的索引搜索，不重复计算。
+    
+    Args:
+        query: 查询文本
+        index_ids: 索引ID列表
+        params: 影响结果的搜索参数
+        
+    Returns:
+        (缓存范围, 索引ID -> 查询向量, 命中的缓存)，未启用缓存时范围为 None
+    """
+    if not ConfigService.is_llm_enabled() or not ConfigService.get_answer_cache_config()["enabled"]:
+        return None, {}, None
+    try:
+        versions = []
+        index_datas = {}
+        for index_id in index_ids:
+            index_file = VECTOR_DIR / f"{index_id}.json"
+            if not index_file.exists():
+                continue
+            index_datas[index_id] = load(index_file)
+            versions.append((index_id, index_datas[index_id].get("version") or str(index_file.stat().st_mtime_ns)))
+        if not versions:
+            return None, {}, None
+        
+        key = next((embedding_key(data) for data in index_datas.values() if embedding_key(data)), None)
+        query_vectors = {}
+        if key is not None:
+            embed_data = next(data for data in index_datas.values() if embedding_key(data) == key)
+            # 超时后同一请求中的搜索不再等待该嵌入模型，直接走降级路径
+            budget = remaining()
+            with deadline(None if budget is None else budget * CACHE_LOOKUP_BUDGET_SHARE):
+                query_vector = np.asarray(get_index_embedding_model(embed_data).get_query_embedding(query),
+                                          dtype=np.float32)
+            query_vectors = {index_id: query_vector for index_id, data in index_datas.items()
+                             if embedding_key(data) == key}
+        
+        config = ConfigService.get_config()
+        llm_type = ConfigService.get_llm_type()
+        scope = answer_cache.scope_key(versions, {
+            **params,
+            "embedding": key,
+            "llm": [llm_type, config.get(llm_type, {}).get("completion_model")],
+            "context_packing": ConfigService.get_context_packing_config()
+        })
+        query_vector = next(iter(query_vectors.values()), None)
+        return scope, query_vectors, answer_cache.lookup(scope, query, query_vector)
+    except Exception as e:
+        logger.warning(f"查找回答缓存失败，直接生成回答: {str(e)}")
+        return None, {}, None
+
+def _cached_answer(cached: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """命中缓存的结果，直接回答中附带命中信息"""
+    results = cached["result"]
+    results[0]["cache"] = {
+        "hit": True,
+        "similarity": cached["similarity"],
+        "cached_query": cached["cached_query"],
+        "age_seconds": cached["age_seconds"]
+    }
+    return results
+
+def _store_answer(scope: Optional[str], index_ids: List[str], query: str,
+                  query_vectors: Dict[str, np.ndarray], results: List[Dict[str, Any]]):
+    """缓存新生成的回答，基于降级搜索结果的回答不缓存"""
+    if scope is not None and not results[0].get("degraded"):
+        answer_cache.store(scope, index_ids, query, next(iter(query_vectors.values()), None), results)
+        results[0]["cache"] = {"hit": False}
+
+def semantic_search(query: str, index_id: str, top_k: int = 5,
+                    filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
     """
     使用LLM进行语义搜索，直接回答用户问题
     
@@ -329,12 +1009,21 @@ def semantic_search(query: str, index_id: str, top_k: int = 5) -> List[Dict[str,
         query: 查询文本
         index_id: 索引ID
         top_k: 返回的最相似结果数量
+        filters: 元数据过滤表达式
         
     Returns:
         包含直接回答和相关文本片段的结果列表
     """
+    # 语义相近的问题已经回答过时直接返回缓存的回答
+    scope, query_vectors, cached = _lookup_answer_cache(
+        query, [index_id], {"mode": "semantic_search", "top_k": top_k, "filters": filters}
+    )
+    if cached is not None:
+        return _cached_answer(cached)
+    
     # 首先使用向量搜索找到相关内容
-    results = search_vector_index(query, index_id, top_k=top_k*2, rerank=True)
+    results = search_vector_index(query, index_id, top_k=top_k*2, rerank=True, filters=filters,
+                                  query_vector=query_vectors.get(index_id))
     
     if not results or not ConfigService.is_llm_enabled():
         return results[:top_k]
@@ -342,25 +1031,28 @@ def semantic_search(query: str, index_id: str, top_k: int = 5) -> List[Dict[str,
     try:
         # 读取索引文件获取索引存储路径
         index_file = VECTOR_DIR / f"{index_id}.json"
-        with open(index_file, "r", encoding="utf-8") as f:
-            index_data = json.load(f)
+        index_data = load(index_file)
         
-        if index_data.get("embedding_type") == "llm" and "index_store_path" in index_data:
+        # 启用上下文组装时所有格式都用已检索到的结果生成回答，不再由查询引擎重新加载索引和检索
+        if (index_data.get("embedding_type") == "llm" and "index_store_path" in index_data
+                and index_data.get("storage_format", "llamaindex") == "llamaindex"
+                and not ConfigService.get_context_packing_config()["enabled"]):
             # 使用LlamaIndex的查询引擎
             index_store_path = index_data["index_store_path"]
-            embed_model = get_embedding_model()
+            embed_model = get_index_embedding_model(index_data)
             llm = get_llm_model()
             
-            # 从持久化存储加载索引
-            storage_context = StorageContext.from_defaults(
-                vector_store=FaissVectorStore.from_persist_dir(index_store_path),
-                persist_dir=index_store_path
-            )
-            
-            loaded_index = load_index_from_storage(
-                storage_context=storage_context,
-                embed_model=embed_model
-            )
+            # 从持久化存储加载索引，加载期间持有版本引用防止被回收
+            with read_version(Path(index_store_path)):
+                storage_context = StorageContext.from_defaults(
+                    vector_store=FaissVectorStore.from_persist_dir(index_store_path),
+                    persist_dir=index_store_path
+                )
+                
+                loaded_index = load_index_from_storage(
+                    storage_context=storage_context,
+                    embed_model=embed_model
+                )
             
             # 创建查询引擎，配置更详细的响应模式
             query_engine = loaded_index.as_query_engine(
@@ -370,9 +1062,9 @@ def semantic_search(query: str, index_id: str, top_k: int = 5) -> List[Dict[str,
                 verbose=True              # 启用详细日志
             )
             
-            print("执行语义查询：", query)
+            logger.debug(f"执行语义查询：{query}")
             # 执行查询
-            response = query_engine.query(query)
+            response = call_llm(query_engine.query, query)
             
             # 创建包含直接回答的结果
             direct_answer = {
@@ -390,36 +1082,23 @@ def semantic_search(query: str, index_id: str, top_k: int = 5) -> List[Dict[str,
                     "text": result["text"],
                     "similarity": result["similarity"]
                 })
-            print("语义查询结果：", semantic_results)
+            logger.debug(f"语义查询结果：{semantic_results}")
+            _store_answer(scope, [index_id], query, query_vectors, semantic_results)
             return semantic_results
         else:
             # 如果不是LlamaIndex索引，使用原有方法
-            llm = get_llm_model()
-            
-            # 构建上下文
-            context = "\n\n".join([f"文本片段 {i+1}: {result['text']}" for i, result in enumerate(results[:top_k])])
-            
-            # 构建更明确的提示，引导LLM生成直接回答
-            prompt = f"""基于以下文本片段，直接回答用户的问题。
-
-            {context}
-
-            用户问题: {query}
-
-            请提供一个完整、准确的回答。回答应该直接针对用户问题，而不是简单列出相关文本。如果文本片段中没有足够信息回答问题，请明确指出。
-
-            回答:"""
-            
-            # 使用LLM生成回答
-            response = llm.complete(prompt)
-            reply = response.text
+            reply, context_stats = generate_answer(query, results[:top_k])
             
             # 创建包含直接回答的结果
             direct_answer = {
                 "answer": reply,
                 "is_direct_answer": True,
-                "source_texts": []
+                "source_texts": [],
+                "context_stats": context_stats
             }
+            if any(result.get("degraded") for result in results[:top_k]):
+                # 嵌入模型不可用时来源为词法搜索结果
+                direct_answer["degraded"] = True
             
             # 添加相关文本作为来源
             semantic_results = [direct_answer]
@@ -431,13 +1110,15 @@ def semantic_search(query: str, index_id: str, top_k: int = 5) -> List[Dict[str,
                     "similarity": result["similarity"]
                 })
             
+            _store_answer(scope, [index_id], query, query_vectors, semantic_results)
             return semantic_results
     except Exception as e:
         logger.error(f"语义搜索请求失败: {str(e)}")
     
     # 如果语义搜索失败，返回原始结果
     return results[:top_k]
-def semantic_search_multi(query: str, index_ids: List[str], top_k: int = 5) -> List[Dict[str, Any]]:
+def semantic_search_multi(query: str, index_ids: List[str], top_k: int = 5,
+                          filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
     """
     在多个向量索引中进行语义搜索，直接回答用户问题
     
@@ -445,13 +1126,24 @@ def semantic_search_multi(query: str, index_ids: List[str], top_k: int = 5) -> L
         query: 查询文本
         index_ids: 索引ID列表
         top_k: 每个索引返回的最相似结果数量
+        filters: 元数据过滤表达式，应用于每个索引
         
     Returns:
         包含直接回答和相关文本片段的结果列表
+        
+    Raises:
+        ValueError: 过滤表达式不合法，或某个索引不支持过滤
     """
     if not index_ids:
         return []
     
+    # 语义相近的问题已经回答过时直接返回缓存的回答
+    scope, query_vectors, cached = _lookup_answer_cache(
+        query, index_ids, {"mode": "semantic_search_multi", "top_k": top_k, "filters": filters}
+    )
+    if cached is not None:
+        return _cached_answer(cached)
+    
     # 收集所有索引的搜索结果
     all_results = []
     for index_id in index_ids:
@@ -463,13 +1155,17 @@ def semantic_search_multi(query: str, index_ids: List[str], top_k: int = 5) -> L
                 continue
             
             # 搜索单个索引
-            results = search_vector_index(query, index_id, top_k=top_k, rerank=False)
+            results = search_vector_index(query, index_id, top_k=top_k, rerank=False, filters=filters,
+                                          query_vector=query_vectors.get(index_id))
             
             # 添加索引ID到结果中
             for result in results:
                 result["index_id"] = index_id
             
             all_results.extend(results)
+        except ValueError:
+            # 过滤表达式错误需要返回给调用方，而不是当作单个索引失败忽略
+            raise
         except Exception as e:
             logger.error(f"搜索索引 {index_id} 失败: {str(e)}")
     
@@ -485,33 +1181,18 @@ def semantic_search_multi(query: str, index_ids: List[str], top_k: int = 5) -> L
     # 如果启用了LLM，使用它生成直接回答
     if ConfigService.is_llm_enabled():
         try:
-            # 获取LLM模型
-            llm = get_llm_model()
-            
-            # 构建上下文
-            context = "\n\n".join([f"文本片段 {i+1}: {result['text']}" for i, result in enumerate(top_results)])
-            
-            # 构建提示
-            prompt = f"""基于以下文本片段，直接回答用户的问题。
-
-            {context}
-
-            用户问题: {query}
-
-            请提供一个完整、准确的回答。回答应该直接针对用户问题，而不是简单列出相关文本。如果文本片段中没有足够信息回答问题，请明确指出。
-
-            回答:"""
-            
             # 使用LLM生成回答
-            response = llm.complete(prompt)
-            reply = response.text
+            reply, context_stats = generate_answer(query, top_results)
             
             # 创建包含直接回答的结果
             direct_answer = {
                 "answer": reply,
                 "is_direct_answer": True,
-                "source_texts": []
+                "source_texts": [],
+                "context_stats": context_stats
             }
+            if any(result.get("degraded") for result in top_results):
+                direct_answer["degraded"] = True
             
             # 添加相关文本作为来源
             semantic_results = [direct_answer]
@@ -524,6 +1205,7 @@ def semantic_search_multi(query: str, index_ids: List[str], top_k: int = 5) -> L
                     "index_id": result.get("index_id", "")
                 })
             
+            _store_answer(scope, index_ids, query, query_vectors, semantic_results)
             return semantic_results
         except Exception as e:
             logger.error(f"多索引语义搜索请求失败: {str(e)}")
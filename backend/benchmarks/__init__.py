@@ -0,0 +1 @@
+# 离线基准测试包：合成语料、伪造模型与计时工具
@@ -0,0 +1,121 @@
+"""
+生成回答的语义缓存
+
+从一组基础问题中按 Zipf 分布抽取查询，并随机加入不影响语义的改写（空白、标点、语气词），
+分别在关闭和开启回答缓存时调用 /api/search，比较平均延迟和命中率。
+LLM 使用伪造模型，--llm-latency 模拟生成回答的耗时。
+
+用法（在 backend 目录下执行）:
+    python -m benchmarks.answer_cache --size 5000 --queries 300 --llm-latency 0.5
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+from benchmarks.corpus import generate_chunks, generate_queries
+from benchmarks.run import RESULTS_DIR, _git_commit
+
+PARAPHRASES = ["{}", " {} ", "{}？", "请问{}", "{}呢"]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="生成回答的语义缓存")
+    parser.add_argument("--size", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--distinct", type=int, default=50, help="基础问题数量")
+    parser.add_argument("--threshold", type=float, default=0.9)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--embed-dim", type=int, default=256)
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="模拟生成回答的延迟（秒）")
+    parser.add_argument("--out", type=Path, default=None, help="结果JSON路径")
+    args = parser.parse_args(argv)
+
+    out = (args.out or RESULTS_DIR / f"answer_cache_{datetime.now().strftime('%Y%m%d%H%M%S')}.json").resolve()
+    workdir = Path(tempfile.mkdtemp(prefix="dataset_bench_"))
+    cwd = os.getcwd()
+    records = []
+    try:
+        # 应用模块在导入时会按相对路径创建目录，必须先切换到临时目录
+        os.chdir(workdir)
+        from fastapi.testclient import TestClient
+        from app.main import app
+        from app.services import answer_cache, vector_service
+        from app.services.config_service import ConfigService
+        from app.services.embedding_service import register_embedding_provider
+        from benchmarks.fakes import FakeEmbedding, FakeLLM
+
+        register_embedding_provider("fake", lambda embed_config: FakeEmbedding(
+            model_name="fake", dimension=args.embed_dim
+        ))
+        ConfigService.update_config({
+            "embedding_type": "fake",
+            "fake": {"embedding_model": "fake"},
+            "index_storage": {"format": "faiss"},
+            "answer_cache": {"similarity_threshold": args.threshold},
+        })
+        vector_service.get_llm_model = lambda: FakeLLM(latency=args.llm_latency)
+        client = TestClient(app)
+        index_id = vector_service.create_vector_index(
+            generate_chunks(args.size, "zh", args.seed), "answer_cache", use_llm=True
+        )
+
+        rng = random.Random(args.seed)
+        base = generate_queries(args.distinct, "zh", args.seed)
+        weights = [1 / (rank + 1) for rank in range(len(base))]
+        queries = [rng.choice(PARAPHRASES).format(rng.choices(base, weights)[0]) for _ in range(args.queries)]
+
+        for enabled in (False, True):
+            ConfigService.update_config({"answer_cache": {"enabled": enabled}})
+            answer_cache.clear()
+            before = answer_cache.get_stats()
+            latencies = []
+            for query in queries:
+                start = time.perf_counter()
+                response = client.post("/api/search", data={"index_id": index_id, "query": query, "top_k": 5})
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+            stats = answer_cache.get_stats()
+            hits = stats["hits"] - before["hits"]
+            record = {
+                "cache": enabled,
+                "queries": len(queries),
+                "mean_ms": statistics.mean(latencies) * 1000,
+                "median_ms": statistics.median(latencies) * 1000,
+                "hit_rate": hits / len(queries),
+            }
+            records.append(record)
+            print(f"[缓存{'开启' if enabled else '关闭'}] 平均 {record['mean_ms']:.1f}ms  "
+                  f"中位数 {record['median_ms']:.1f}ms  命中率 {record['hit_rate']:.1%}")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "created_at": datetime.now().isoformat(),
+            "git_commit": _git_commit(),
+            "size": args.size,
+            "distinct": args.distinct,
+            "threshold": args.threshold,
+            "llm_latency": args.llm_latency,
+        },
+        "results": records,
+    }
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存: {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""
+批量搜索吞吐量
+
+对同一组查询分别逐个调用 /api/search 和一次调用 /api/batch-search，比较每秒查询数，
+并确认两种方式返回的结果一致。嵌入模型使用伪造模型，可以通过 --embed-latency
+模拟远程嵌入服务每次请求的往返延迟；LLM 关闭，/api/search 不做重排序。
+
+用法（在 backend 目录下执行）:
+    python -m benchmarks.batch_search --size 20000 --queries 1000 --embed-latency 0.02
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from benchmarks.corpus import generate_chunks, generate_queries
+from benchmarks.run import RESULTS_DIR, _git_commit
+
+KINDS = ["faiss", "compact", "llamaindex", "tfidf"]
+
+
+def _same_results(a: List[Dict[str, Any]], b: List[Dict[str, Any]]) -> bool:
+    """相似度相同的结果顺序可能不同，只比较相似度序列"""
+    return len(a) == len(b) and all(abs(x["similarity"] - y["similarity"]) <= 1e-4 for x, y in zip(a, b))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="批量搜索吞吐量")
+    parser.add_argument("--size", type=int, default=20000)
+    parser.add_argument("--lang", default="zh", choices=["zh", "en"])
+    parser.add_argument("--kinds", nargs="+", default=KINDS, choices=KINDS)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--embed-dim", type=int, default=1024)
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="模拟每次嵌入请求的延迟（秒）")
+    parser.add_argument("--out", type=Path, default=None, help="结果JSON路径")
+    args = parser.parse_args(argv)
+
+    out = (args.out or RESULTS_DIR / f"batch_search_{datetime.now().strftime('%Y%m%d%H%M%S')}.json").resolve()
+    workdir = Path(tempfile.mkdtemp(prefix="dataset_bench_"))
+    cwd = os.getcwd()
+    records = []
+    try:
+        # 应用模块在导入时会按相对路径创建目录，必须先切换到临时目录
+        os.chdir(workdir)
+        from fastapi.testclient import TestClient
+        from app.main import app
+        from app.services import vector_service
+        from app.services.config_service import ConfigService
+        from app.services.embedding_service import register_embedding_provider
+        from benchmarks.fakes import FakeEmbedding
+
+        register_embedding_provider("fake", lambda embed_config: FakeEmbedding(
+            model_name="fake", dimension=args.embed_dim, latency=args.embed_latency
+        ))
+        ConfigService.update_config({"llm_type": "none", "embedding_type": "fake", "fake": {"embedding_model": "fake"}})
+        client = TestClient(app)
+        chunks = generate_chunks(args.size, args.lang, args.seed)
+        queries = generate_queries(args.queries, args.lang, args.seed)
+
+        for kind in args.kinds:
+            if kind != "tfidf":
+                ConfigService.update_config({"index_storage": {"format": kind}})
+            index_id = vector_service.create_vector_index(chunks, f"batch_{kind}", use_llm=kind != "tfidf")
+
+            # 预热：打开索引并加载嵌入模型
+            client.post("/api/search", data={"index_id": index_id, "query": queries[0], "top_k": args.top_k})
+
+            start = time.perf_counter()
+            looped = []
+            for query in queries:
+                response = client.post("/api/search", data={"index_id": index_id, "query": query, "top_k": args.top_k})
+                response.raise_for_status()
+                looped.append(response.json()["results"])
+            loop_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            response = client.post("/api/batch-search", json={
+                "queries": queries, "index_ids": [index_id], "top_k": args.top_k
+            })
+            response.raise_for_status()
+            batched = response.json()["results"]
+            batch_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            with client.stream("POST", "/api/batch-search", json={
+                "queries": queries, "index_ids": [index_id], "top_k": args.top_k, "stream": True
+            }) as stream:
+                streamed = [json.loads(line)["results"] for line in stream.iter_lines() if line]
+            stream_seconds = time.perf_counter() - start
+
+            mismatches = sum(not _same_results(a, b) for a, b in zip(looped, batched))
+            mismatches += sum(not _same_results(a, b) for a, b in zip(batched, streamed))
+            record = {
+                "kind": kind,
+                "size": args.size,
+                "queries": len(queries),
+                "loop_qps": len(queries) / loop_seconds,
+                "batch_qps": len(queries) / batch_seconds,
+                "stream_qps": len(queries) / stream_seconds,
+                "speedup": loop_seconds / batch_seconds,
+                "mismatches": mismatches,
+            }
+            records.append(record)
+            print(f"[{kind}] 逐个搜索 {record['loop_qps']:.1f} QPS  批量 {record['batch_qps']:.1f} QPS  "
+                  f"流式 {record['stream_qps']:.1f} QPS  加速 {record['speedup']:.1f}x  不一致 {mismatches}")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "created_at": datetime.now().isoformat(),
+            "git_commit": _git_commit(),
+            "size": args.size,
+            "lang": args.lang,
+            "top_k": args.top_k,
+            "embed_dim": args.embed_dim,
+            "embed_latency": args.embed_latency,
+        },
+        "results": records,
+    }
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存: {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
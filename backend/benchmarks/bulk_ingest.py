@@ -0,0 +1,145 @@
+"""
+批量上传的吞吐量
+
+生成一批CSV和TXT文件（各占一半），比较逐个调用 /api/upload 与一次调用 /api/bulk-upload
+（1 个进程和多个进程）处理全部文件的耗时、每秒文件数和每秒MB数。每次运行前清空解析缓存，
+使每个文件都完整解析和清洗。
+
+用法（在 backend 目录下执行）:
+    python -m benchmarks.bulk_ingest --files 200 --rows 500 --workers 1 4 8
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+import pandas as pd
+
+from benchmarks.corpus import generate_chunks, generate_documents
+from benchmarks.run import RESULTS_DIR, _git_commit
+
+
+def _write_files(directory: Path, n_files: int, rows: int, seed: int) -> List[Path]:
+    """生成测试文件，CSV每行一个文本块，TXT为长文档"""
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(n_files):
+        lang = "zh" if i % 4 < 2 else "en"
+        if i % 2 == 0:
+            texts = generate_chunks(rows, lang, seed + i)
+            path = directory / f"table_{i:05d}.csv"
+            pd.DataFrame({"id": range(rows), "score": [j / 10 for j in range(rows)], "text": texts}).to_csv(
+                path, index=False
+            )
+        else:
+            path = directory / f"doc_{i:05d}.txt"
+            path.write_text("\n".join(generate_documents(rows, lang, seed + i)), encoding="utf-8")
+        paths.append(path)
+    return paths
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="批量上传的吞吐量")
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--rows", type=int, default=500, help="每个文件大约的文本块数")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", type=Path, default=None, help="结果JSON路径")
+    args = parser.parse_args(argv)
+
+    out = (args.out or RESULTS_DIR / f"bulk_ingest_{datetime.now().strftime('%Y%m%d%H%M%S')}.json").resolve()
+    workdir = Path(tempfile.mkdtemp(prefix="dataset_bench_"))
+    cwd = os.getcwd()
+    records = []
+    try:
+        # 应用模块在导入时会按相对路径创建目录，必须先切换到临时目录
+        os.chdir(workdir)
+        from fastapi.testclient import TestClient
+        from app.main import app
+        from app.services.bulk_ingest import shutdown_pool
+        from app.services.ingest_cache import INGEST_CACHE_DIR, wait_for_writes
+
+        paths = _write_files(workdir / "corpus", args.files, args.rows, args.seed)
+        total_mb = sum(path.stat().st_size for path in paths) / 1024 / 1024
+        print(f"{len(paths)} 个文件，共 {total_mb:.1f} MB")
+        client = TestClient(app)
+
+        def _clear():
+            wait_for_writes()
+            for path in INGEST_CACHE_DIR.iterdir():
+                path.unlink()
+
+        def _record(mode: str, workers: int, seconds: float, chunks: int):
+            record = {
+                "mode": mode,
+                "workers": workers,
+                "files": len(paths),
+                "mb": round(total_mb, 2),
+                "chunks": chunks,
+                "seconds": round(seconds, 3),
+                "files_per_second": round(len(paths) / seconds, 2),
+                "mb_per_second": round(total_mb / seconds, 2),
+            }
+            records.append(record)
+            print(f"{mode:10s} workers={workers:2d} {record['seconds']:8.2f}s "
+                  f"{record['files_per_second']:8.2f} 文件/秒 {record['mb_per_second']:7.2f} MB/秒")
+
+        _clear()
+        start = time.perf_counter()
+        chunks = 0
+        for path in paths:
+            with open(path, "rb") as f:
+                response = client.post("/api/upload", files={"file": (path.name, f)})
+            response.raise_for_status()
+            chunks += response.json()["summary"]["chunk_count"]
+        _record("sequential", 1, time.perf_counter() - start, chunks)
+
+        for workers in args.workers:
+            _clear()
+            # 进程启动不计入：先用同样的进程数处理一个文件
+            client.post("/api/bulk-upload", data={"workers": workers, "stream": "false"},
+                        files=[("files", (paths[0].name, paths[0].read_bytes()))]).raise_for_status()
+            if workers > 1:
+                # 只处理了一个文件时只用一个进程，这里直接预热进程池
+                from app.services.bulk_ingest import _get_pool
+                list(_get_pool(workers).map(abs, range(workers * 4)))
+            _clear()
+            handles = [open(path, "rb") for path in paths]
+            try:
+                start = time.perf_counter()
+                response = client.post("/api/bulk-upload", data={"workers": workers, "stream": "false"},
+                                       files=[("files", (path.name, handle)) for path, handle in zip(paths, handles)])
+                seconds = time.perf_counter() - start
+            finally:
+                for handle in handles:
+                    handle.close()
+            response.raise_for_status()
+            stats = response.json()["stats"]
+            assert stats["failed"] == 0, response.json()["files"]
+            _record("bulk", workers, seconds, stats["chunk_count"])
+        shutdown_pool()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({
+            "commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "cpu_count": os.cpu_count(),
+            "params": vars(args) | {"out": str(out)},
+            "records": records,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存到 {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,96 @@
+"""
+对比两次基准测试结果，发现性能回退
+
+用法（在 backend 目录下执行）:
+    python -m benchmarks.compare benchmarks/results/base.json benchmarks/results/new.json --threshold 0.10
+
+存在超过阈值的回退时以退出码 1 结束，可直接用于CI。
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+Key = Tuple[str, str, int]
+
+
+def load_results(path: Path) -> Dict[Key, Dict[str, Any]]:
+    """读取结果文件，按 (阶段, 语言, 规模) 建立索引"""
+    with open(path, "r", encoding="utf-8") as f:
+        report = json.load(f)
+    return {
+        (record["stage"], record["lang"], record["size"]): record
+        for record in report.get("results", [])
+    }
+
+
+def compare(base: Dict[Key, Dict[str, Any]], new: Dict[Key, Dict[str, Any]],
+            threshold: float = 0.10, metric: str = "median") -> List[Dict[str, Any]]:
+    """
+    比较两次运行中同一阶段的耗时
+
+    Args:
+        base: 基线结果
+        new: 新结果
+        threshold: 允许的相对变慢比例，超过则视为回退
+        metric: 使用的统计值，默认中位数
+
+    Returns:
+        每个共同阶段的对比记录
+    """
+    rows = []
+    for key in sorted(set(base) & set(new)):
+        old_stats, new_stats = base[key].get("stats"), new[key].get("stats")
+        if not old_stats or not new_stats:
+            status = "error"
+            ratio = None
+        else:
+            ratio = new_stats[metric] / old_stats[metric] if old_stats[metric] else None
+            if ratio is None:
+                status = "ok"
+            elif ratio > 1 + threshold:
+                status = "regression"
+            elif ratio < 1 - threshold:
+                status = "improvement"
+            else:
+                status = "ok"
+        rows.append({
+            "stage": key[0],
+            "lang": key[1],
+            "size": key[2],
+            "base": old_stats[metric] if old_stats else None,
+            "new": new_stats[metric] if new_stats else None,
+            "ratio": ratio,
+            "status": status,
+        })
+    return rows
+
+
+def _format(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.4f}"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="对比两次基准测试结果")
+    parser.add_argument("base", type=Path)
+    parser.add_argument("new", type=Path)
+    parser.add_argument("--threshold", type=float, default=0.10, help="回退阈值（相对比例）")
+    parser.add_argument("--metric", default="median", choices=["min", "median", "mean", "p95", "max"])
+    args = parser.parse_args(argv)
+
+    rows = compare(load_results(args.base), load_results(args.new), args.threshold, args.metric)
+    for row in rows:
+        ratio = "-" if row["ratio"] is None else f"{row['ratio']:.2f}x"
+        print(f"{row['stage']:<28} {row['lang']} {row['size']:>8}  "
+              f"{_format(row['base'])}s -> {_format(row['new'])}s  {ratio:>7}  {row['status']}")
+
+    regressions = [row for row in rows if row["status"] == "regression"]
+    if regressions:
+        print(f"发现 {len(regressions)} 项性能回退")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""
+回答生成的上下文组装
+
+对同一组查询分别在关闭和开启上下文组装时调用 semantic_search_multi，比较提示词元数和回答延迟。
+语料中除普通文本块外，还有一部分由 split_text 按字符窗口拆分的无标点长文本，相邻文本块之间有重叠。
+LLM 使用伪造模型，--char-latency 模拟预填充耗时随提示长度增长。
+
+用法（在 backend 目录下执行）:
+    python -m benchmarks.context_packing --size 5000 --top-k 5 20 50 --char-latency 0.00002
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+from benchmarks.corpus import generate_chunks, generate_documents, generate_queries
+from benchmarks.run import RESULTS_DIR, _git_commit
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="回答生成的上下文组装")
+    parser.add_argument("--size", type=int, default=5000)
+    parser.add_argument("--lang", default="zh", choices=["zh", "en"])
+    parser.add_argument("--top-k", type=int, nargs="+", default=[5, 20, 50])
+    parser.add_argument("--max-tokens", type=int, default=None, help="上下文词元预算，默认使用配置")
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--embed-dim", type=int, default=256)
+    parser.add_argument("--char-latency", type=float, default=0.0, help="模拟每个提示字符的预填充延迟（秒）")
+    parser.add_argument("--out", type=Path, default=None, help="结果JSON路径")
+    args = parser.parse_args(argv)
+
+    out = (args.out or RESULTS_DIR / f"context_packing_{datetime.now().strftime('%Y%m%d%H%M%S')}.json").resolve()
+    workdir = Path(tempfile.mkdtemp(prefix="dataset_bench_"))
+    cwd = os.getcwd()
+    records = []
+    try:
+        # 应用模块在导入时会按相对路径创建目录，必须先切换到临时目录
+        os.chdir(workdir)
+        from app.services import vector_service
+        from app.services.config_service import ConfigService
+        from app.services.context_packer import count_tokens
+        from app.services.file_processor import split_text
+        from benchmarks.fakes import FakeLLM
+
+        ConfigService.update_config({"embedding_type": "local", "local": {"embedding_dim": args.embed_dim}})
+        if args.max_tokens is not None:
+            ConfigService.update_config({"context_packing": {"max_tokens": args.max_tokens}})
+        vector_service.get_llm_model = lambda: FakeLLM(char_latency=args.char_latency)
+
+        # 一半为普通文本块，一半为去掉句末标点后按字符窗口拆分的长文本
+        chunks = generate_chunks(args.size // 2, args.lang, args.seed)
+        for document in generate_documents(args.size // 2, args.lang, args.seed + 1):
+            for mark in "。！？.!?":
+                document = document.replace(mark, "，" if args.lang == "zh" else ",")
+            chunks.extend(split_text(document, 512, 100))
+        queries = generate_queries(args.queries, args.lang, args.seed)
+        index_id = vector_service.create_vector_index(chunks, "context_packing", use_llm=True)
+        count_tokens("预热分词器")
+
+        for top_k in args.top_k:
+            row = {"size": len(chunks), "top_k": top_k}
+            for enabled in (False, True):
+                ConfigService.update_config({"context_packing": {"enabled": enabled}})
+                latencies, prompt_tokens, packing_ms = [], [], []
+                for query in queries:
+                    start = time.perf_counter()
+                    answer = vector_service.semantic_search_multi(query, [index_id], top_k=top_k)[0]
+                    latencies.append(time.perf_counter() - start)
+                    stats = answer["context_stats"]
+                    prompt_tokens.append(stats["prompt_tokens"])
+                    packing_ms.append(stats.get("packing_ms", 0.0))
+                key = "packed" if enabled else "full"
+                row[f"{key}_prompt_tokens"] = statistics.mean(prompt_tokens)
+                row[f"{key}_median_ms"] = statistics.median(latencies) * 1000
+                if enabled:
+                    row["packing_ms"] = statistics.mean(packing_ms)
+            row["token_reduction"] = 1 - row["packed_prompt_tokens"] / row["full_prompt_tokens"]
+            records.append(row)
+            print(f"[top_k={top_k}] 提示词元 {row['full_prompt_tokens']:.0f} -> {row['packed_prompt_tokens']:.0f}"
+                  f"（减少 {row['token_reduction']:.0%}）  延迟 {row['full_median_ms']:.1f}ms -> "
+                  f"{row['packed_median_ms']:.1f}ms  组装 {row['packing_ms']:.2f}ms")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "created_at": datetime.now().isoformat(),
+            "git_commit": _git_commit(),
+            "size": args.size,
+            "lang": args.lang,
+            "queries": args.queries,
+            "max_tokens": args.max_tokens,
+            "char_latency": args.char_latency,
+        },
+        "results": records,
+    }
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存: {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
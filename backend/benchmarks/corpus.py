@@ -0,0 +1,89 @@
+import random
+from typing import List
+
+# 中文语料使用的常用词
+ZH_WORDS = [
+    "数据", "向量", "索引", "模型", "文本", "搜索", "系统", "用户", "问题", "回答",
+    "检索", "语义", "文件", "处理", "清洗", "拆分", "存储", "查询", "结果", "相似",
+    "山门", "弟子", "修炼", "法宝", "长老", "江湖", "少年", "师父", "剑气", "天地",
+    "城市", "历史", "文化", "经济", "科技", "教育", "医疗", "交通", "环境", "能源",
+    "今天", "明天", "我们", "他们", "已经", "可以", "需要", "因为", "所以", "但是",
+]
+ZH_ENDINGS = ["。", "！", "？", "。", "。"]
+
+# 英文语料使用的常用词
+EN_WORDS = [
+    "data", "vector", "index", "model", "text", "search", "system", "user", "question", "answer",
+    "retrieval", "semantic", "file", "process", "clean", "split", "storage", "query", "result", "similar",
+    "mountain", "river", "student", "teacher", "ancient", "sword", "journey", "village", "storm", "light",
+    "city", "history", "culture", "economy", "science", "education", "health", "traffic", "climate", "energy",
+    "today", "tomorrow", "we", "they", "already", "can", "need", "because", "therefore", "however",
+]
+EN_ENDINGS = [".", "!", "?", ".", "."]
+
+
+def _make_sentence(rng: random.Random, lang: str) -> str:
+    """生成一个随机句子"""
+    if lang == "zh":
+        words = [rng.choice(ZH_WORDS) for _ in range(rng.randint(6, 18))]
+        return "".join(words) + rng.choice(ZH_ENDINGS)
+    words = [rng.choice(EN_WORDS) for _ in range(rng.randint(6, 18))]
+    sentence = " ".join(words)
+    return sentence[0].upper() + sentence[1:] + rng.choice(EN_ENDINGS) + " "
+
+
+def generate_chunks(n_chunks: int, lang: str = "zh", seed: int = 42,
+                    min_size: int = 120, max_size: int = 480) -> List[str]:
+    """
+    生成指定数量的合成文本块
+
+    Args:
+        n_chunks: 文本块数量
+        lang: 语言，zh 或 en
+        seed: 随机种子，相同参数生成完全相同的语料
+        min_size: 每个块的最小字符数
+        max_size: 每个块的最大字符数，默认小于 split_text 的块大小
+
+    Returns:
+        文本块列表
+    """
+    if lang not in ("zh", "en"):
+        raise ValueError(f"不支持的语言: {lang}")
+
+    rng = random.Random(f"{seed}-{lang}")
+    chunks = []
+    for _ in range(n_chunks):
+        target = rng.randint(min_size, max_size)
+        chunk = ""
+        while len(chunk) < target:
+            chunk += _make_sentence(rng, lang)
+        chunks.append(chunk[:max_size].strip())
+    return chunks
+
+
+def generate_documents(n_chunks: int, lang: str = "zh", seed: int = 42,
+                       chunks_per_document: int = 20) -> List[str]:
+    """
+    生成长文档，拆分后大约得到 n_chunks 个文本块
+
+    Args:
+        n_chunks: 期望的文本块总数
+        lang: 语言，zh 或 en
+        seed: 随机种子
+        chunks_per_document: 每个文档包含的块数
+
+    Returns:
+        文档列表
+    """
+    chunks = generate_chunks(n_chunks, lang, seed)
+    separator = "" if lang == "zh" else " "
+    return [
+        separator.join(chunks[i:i + chunks_per_document])
+        for i in range(0, len(chunks), chunks_per_document)
+    ]
+
+
+def generate_queries(n_queries: int, lang: str = "zh", seed: int = 7) -> List[str]:
+    """生成查询语句"""
+    rng = random.Random(f"query-{seed}-{lang}")
+    return [_make_sentence(rng, lang).strip() for _ in range(n_queries)]
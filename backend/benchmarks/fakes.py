@@ -0,0 +1,101 @@
+import re
+import time
+import zlib
+from typing import Any, List
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.llms import CustomLLM, CompletionResponse, CompletionResponseGen, LLMMetadata
+from llama_index.core.llms.callbacks import llm_completion_callback
+
+# 英文按单词切分，中文按单字切分后组成二元组
+_TOKEN_PATTERN = re.compile(r"[a-zA-Z0-9]+|[一-鿿]")
+
+
+def _tokenize(text: str) -> List[str]:
+    """将文本切分为用于哈希的词元"""
+    tokens = _TOKEN_PATTERN.findall(text.lower())
+    # 中文单字信息量太低，补充相邻二元组
+    bigrams = [a + b for a, b in zip(tokens, tokens[1:]) if len(a) == 1 and len(b) == 1]
+    return tokens + bigrams
+
+
+class FakeEmbedding(BaseEmbedding):
+    """确定性的伪造嵌入模型，相同文本总是得到相同的向量，无需网络"""
+
+    dimension: int = 1024
+    latency: float = 0.0
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "FakeEmbedding"
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for token in _tokenize(text):
+            h = zlib.crc32(token.encode("utf-8"))
+            sign = 1.0 if (h >> 31) & 1 else -1.0
+            vector[h % self.dimension] += sign
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector.tolist()
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._embed(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._embed(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        # 模拟一次批量请求的延迟
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+
+class FakeLLM(CustomLLM):
+    """确定性的伪造LLM，返回基于提示内容的固定格式回答"""
+
+    context_window: int = 32768
+    num_output: int = 512
+    model_name: str = "fake-llm"
+    latency: float = 0.0
+    # 每个提示字符的额外延迟，模拟预填充耗时随提示长度增长
+    char_latency: float = 0.0
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(
+            context_window=self.context_window,
+            num_output=self.num_output,
+            model_name=self.model_name
+        )
+
+    def _reply(self, prompt: str) -> str:
+        if self.latency or self.char_latency:
+            time.sleep(self.latency + self.char_latency * len(prompt))
+        # 引用提示中出现的片段编号，便于重排序逻辑解析
+        indices = re.findall(r"\[([0-9]+)\]", prompt)
+        ranking = "".join(f"[{idx}]" for idx in reversed(indices))
+        return f"{ranking} 伪造回答(prompt_chars={len(prompt)}, crc={zlib.crc32(prompt.encode('utf-8'))})"
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        return CompletionResponse(text=self._reply(prompt))
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        text = self._reply(prompt)
+        response = ""
+        for token in text.split(" "):
+            delta = token + " "
+            response += delta
+            yield CompletionResponse(text=response, delta=delta)
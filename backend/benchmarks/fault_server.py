@@ -0,0 +1,146 @@
+"""
+可注入故障的本地模型服务
+
+以 SiliconFlow/OpenAI 兼容的格式提供 POST /v1/embeddings 和 POST /v1/chat/completions，
+嵌入向量由 FakeEmbedding 确定性生成，回答为固定文本。通过 /_faults 为每个接口设置故障：
+
+- latency: 每次请求的固定延迟（秒）
+- error_rate: 返回错误状态码的概率
+- status: 错误状态码，默认 503
+- hang: 挂起请求直到 hang 秒后才返回（模拟无响应的上游）
+
+GET /_faults 返回当前故障设置和各接口收到的请求数，POST /_faults 以JSON更新设置，
+例如 {"embeddings": {"error_rate": 1.0}, "chat": {"latency": 2}}，传入 {"reset": true} 恢复正常。
+
+用法（在 backend 目录下执行）:
+    python -m benchmarks.fault_server --port 9100
+然后把 data/llm_config.json 中 siliconflow 的 embedding_api_base 和 completion_api_base 分别设为
+http://127.0.0.1:9100/v1/embeddings 和 http://127.0.0.1:9100/v1/chat/completions。
+"""
+import argparse
+import asyncio
+import random
+import socket
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from benchmarks.fakes import FakeEmbedding
+
+ENDPOINTS = ("embeddings", "chat")
+
+DEFAULT_FAULT = {"latency": 0.0, "error_rate": 0.0, "status": 503, "hang": 0.0}
+
+
+def create_app(dimension: int = 1024, seed: int = 42) -> FastAPI:
+    """创建可注入故障的模型服务"""
+    app = FastAPI()
+    embedder = FakeEmbedding(model_name="fault-server", dimension=dimension)
+    rng = random.Random(seed)
+    state: Dict[str, Any] = {
+        "faults": {name: dict(DEFAULT_FAULT) for name in ENDPOINTS},
+        "requests": {name: 0 for name in ENDPOINTS},
+        "errors": {name: 0 for name in ENDPOINTS},
+    }
+
+    async def _apply_fault(name: str) -> Optional[JSONResponse]:
+        """按当前设置延迟、挂起或返回错误，正常时返回 None"""
+        fault = state["faults"][name]
+        state["requests"][name] += 1
+        if fault["hang"]:
+            await asyncio.sleep(fault["hang"])
+        if fault["latency"]:
+            await asyncio.sleep(fault["latency"])
+        if fault["error_rate"] and rng.random() < fault["error_rate"]:
+            state["errors"][name] += 1
+            return JSONResponse({"code": fault["status"], "message": "injected fault"}, status_code=fault["status"])
+        return None
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        error = await _apply_fault("embeddings")
+        if error is not None:
+            return error
+        body = await request.json()
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        data = [{"object": "embedding", "index": i, "embedding": embedder._embed(text)}
+                for i, text in enumerate(texts)]
+        return {"object": "list", "model": body.get("model"), "data": data}
+
+    @app.post("/v1/chat/completions")
+    async def chat(request: Request):
+        error = await _apply_fault("chat")
+        if error is not None:
+            return error
+        body = await request.json()
+        prompt = body["messages"][-1]["content"]
+        return {
+            "id": f"fault-{state['requests']['chat']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": f"根据上下文（{len(prompt)} 个字符）生成的回答"}
+            }],
+            "usage": {"prompt_tokens": len(prompt), "completion_tokens": 16, "total_tokens": len(prompt) + 16}
+        }
+
+    @app.get("/_faults")
+    async def get_faults():
+        return state
+
+    @app.post("/_faults")
+    async def set_faults(request: Request):
+        body = await request.json()
+        if body.get("reset"):
+            state["faults"] = {name: dict(DEFAULT_FAULT) for name in ENDPOINTS}
+        for name in ENDPOINTS:
+            state["faults"][name].update(body.get(name, {}))
+        return state
+
+    return app
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve_in_thread(app: Any, port: Optional[int] = None) -> Tuple[str, uvicorn.Server]:
+    """
+    在后台线程中启动 ASGI 应用，等待就绪后返回
+
+    Returns:
+        (基础URL, uvicorn.Server)，结束时设置 server.should_exit = True
+    """
+    port = port or free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline or not thread.is_alive():
+            raise RuntimeError(f"服务在端口 {port} 启动失败")
+        time.sleep(0.02)
+    return f"http://127.0.0.1:{port}", server
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="可注入故障的本地模型服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--dim", type=int, default=1024, help="嵌入向量维度")
+    args = parser.parse_args(argv)
+    uvicorn.run(create_app(args.dim), host=args.host, port=args.port, log_level="info")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
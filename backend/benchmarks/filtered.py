@@ -0,0 +1,138 @@
+"""
+元数据过滤搜索的延迟和正确性
+
+为每种支持过滤的持久化格式建一个索引，每个文本块带有均匀分布的 row_id，
+用 row_id 的范围条件构造不同选择率的过滤表达式，测量过滤搜索的延迟，
+并与在命中行上暴力计算的结果对比，确认返回的仍是满足条件的前 top_k 个。
+
+用法（在 backend 目录下执行）:
+    python -m benchmarks.filtered --size 100000 --selectivity 1 0.1 0.01 0.001
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+from benchmarks.corpus import generate_chunks, generate_queries
+from benchmarks.run import RESULTS_DIR, _git_commit
+
+FORMATS = ["faiss", "compact"]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="元数据过滤搜索的延迟和正确性")
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--lang", default="zh", choices=["zh", "en"])
+    parser.add_argument("--formats", nargs="+", default=FORMATS, choices=FORMATS)
+    parser.add_argument("--selectivity", type=float, nargs="+", default=[1.0, 0.5, 0.1, 0.01, 0.001])
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--embed-dim", type=int, default=1024)
+    parser.add_argument("--out", type=Path, default=None, help="结果JSON路径")
+    args = parser.parse_args(argv)
+
+    out = (args.out or RESULTS_DIR / f"filtered_{datetime.now().strftime('%Y%m%d%H%M%S')}.json").resolve()
+    workdir = Path(tempfile.mkdtemp(prefix="dataset_bench_"))
+    cwd = os.getcwd()
+    records = []
+    try:
+        # 应用模块在导入时会按相对路径创建目录，必须先切换到临时目录
+        os.chdir(workdir)
+        from app.services import vector_service
+        from app.services.config_service import ConfigService
+
+        ConfigService.update_config({"embedding_type": "local", "local": {"embedding_dim": args.embed_dim}})
+        chunks = generate_chunks(args.size, args.lang, args.seed)
+        queries = generate_queries(args.queries, args.lang, args.seed)
+        # row_id 打乱后分配，范围条件命中的行分散在整个索引中
+        row_ids = np.random.default_rng(args.seed).permutation(args.size)
+        metadata = [{"file_id": "filtered", "row_id": int(row_id)} for row_id in row_ids]
+
+        embed_model = vector_service.get_embedding_model()
+        query_vectors = np.asarray([embed_model.get_query_embedding(q) for q in queries], dtype=np.float32)
+        query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+
+        for storage_format in args.formats:
+            ConfigService.update_config({"index_storage": {"format": storage_format}})
+            index_id = vector_service.create_vector_index(
+                chunks, f"filtered_{storage_format}", use_llm=True, metadata=metadata
+            )
+            index_data, lease = vector_service.load_index_version(index_id)
+            try:
+                mmap_index = vector_service.load_mmap_index(index_data)
+                table = vector_service.load_metadata_table(index_data)
+                if storage_format == "compact":
+                    vectors = mmap_index.get_rows(np.arange(len(mmap_index)))
+                else:
+                    vectors = mmap_index.index.reconstruct_n(0, len(mmap_index))
+
+                for selectivity in args.selectivity:
+                    filters = {"row_id": {"$lt": max(1, int(round(args.size * selectivity)))}}
+                    mask = table.evaluate(filters)
+                    selected = np.flatnonzero(mask)
+
+                    latencies = []
+                    mismatches = 0
+                    for query, query_vector in zip(queries, query_vectors):
+                        start = time.perf_counter()
+                        results = vector_service.search_vector_index(query, index_id, top_k=args.top_k, filters=filters)
+                        latencies.append(time.perf_counter() - start)
+
+                        # 暴力计算命中行上的前 top_k 个，比较相似度序列
+                        scores = vectors[selected] @ query_vector
+                        expected = np.sort(scores)[::-1][:args.top_k]
+                        actual = np.array([r["similarity"] for r in results])
+                        if len(actual) != len(expected) or not np.allclose(actual, expected, atol=1e-4) \
+                                or any(r["metadata"]["row_id"] >= filters["row_id"]["$lt"] for r in results):
+                            mismatches += 1
+
+                    record = {
+                        "format": storage_format,
+                        "size": args.size,
+                        "selectivity": selectivity,
+                        "matched_rows": int(len(selected)),
+                        "median_ms": statistics.median(latencies) * 1000,
+                        "p95_ms": float(np.percentile(latencies, 95)) * 1000,
+                        "mismatches": mismatches,
+                    }
+                    records.append(record)
+                    print(f"[{storage_format}] 选择率 {selectivity:g}（{record['matched_rows']} 行）: "
+                          f"中位数 {record['median_ms']:.2f}ms  p95 {record['p95_ms']:.2f}ms  不一致 {mismatches}")
+            finally:
+                if lease is not None:
+                    lease.release()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "created_at": datetime.now().isoformat(),
+            "git_commit": _git_commit(),
+            "size": args.size,
+            "lang": args.lang,
+            "queries": args.queries,
+            "top_k": args.top_k,
+            "embed_dim": args.embed_dim,
+        },
+        "results": records,
+    }
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存: {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
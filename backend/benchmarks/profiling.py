@@ -0,0 +1,144 @@
+"""
+按需采样分析的开销
+
+启动后端服务，以相同的查询并发调用 /api/search，分别在没有进行中的采样分析、
+采样分析只匹配其他路由（中间件判断后直接放行）、采样分析匹配所有搜索请求三种情况下比较延迟，
+并输出最后一次捕获中自身耗时最多的函数和折叠栈文件路径。
+
+用法（在 backend 目录下执行）:
+    python -m benchmarks.profiling --size 20000 --requests 200 --concurrency 4
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+import httpx
+
+from benchmarks.corpus import generate_chunks, generate_queries
+from benchmarks.fault_server import serve_in_thread
+from benchmarks.run import RESULTS_DIR, _git_commit
+
+TOKEN = "benchmark"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="按需采样分析的开销")
+    parser.add_argument("--size", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--interval-ms", type=float, default=5)
+    parser.add_argument("--embed-dim", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", type=Path, default=None, help="结果JSON路径")
+    args = parser.parse_args(argv)
+
+    out = (args.out or RESULTS_DIR / f"profiling_{datetime.now().strftime('%Y%m%d%H%M%S')}.json").resolve()
+    workdir = Path(tempfile.mkdtemp(prefix="dataset_bench_"))
+    cwd = os.getcwd()
+    records = []
+    collapsed_out = out.with_suffix(".collapsed")
+    server = None
+    try:
+        # 应用模块在导入时会按相对路径创建目录，必须先切换到临时目录
+        os.chdir(workdir)
+        os.environ["PROFILER_ADMIN_TOKEN"] = TOKEN
+        from app.main import app
+        from app.services import vector_service
+        from app.services.config_service import ConfigService
+        from app.services.embedding_service import register_embedding_provider
+        from benchmarks.fakes import FakeEmbedding
+
+        register_embedding_provider("fake", lambda embed_config: FakeEmbedding(
+            model_name="fake", dimension=args.embed_dim
+        ), remote=False)
+        # 不启用LLM，只测量检索路径
+        ConfigService.update_config({
+            "llm_type": "none",
+            "embedding_type": "fake",
+            "fake": {"embedding_model": "fake"},
+            "index_storage": {"format": "faiss"},
+        })
+        index_id = vector_service.create_vector_index(
+            generate_chunks(args.size, "zh", args.seed), "profiling", use_llm=True
+        )
+        url, server = serve_in_thread(app)
+        client = httpx.Client(base_url=url, timeout=60)
+        admin = {"X-Admin-Token": TOKEN}
+        queries = generate_queries(args.requests, "zh", args.seed)
+
+        def _search(query: str) -> float:
+            start = time.perf_counter()
+            client.post("/api/search", data={"index_id": index_id, "query": query, "top_k": 10}).raise_for_status()
+            return time.perf_counter() - start
+
+        # 预热：加载索引和模型
+        for query in queries[:10]:
+            _search(query)
+
+        modes = [("off", None), ("other_route", "/api/files"), ("on", "/api/search")]
+        summary = None
+        for mode, path in modes:
+            if path is not None:
+                client.post("/api/profiling/start", headers=admin, data={
+                    "path": path, "interval_ms": args.interval_ms
+                }).raise_for_status()
+            start = time.perf_counter()
+            with ThreadPoolExecutor(args.concurrency) as pool:
+                latencies = list(pool.map(_search, queries))
+            wall = time.perf_counter() - start
+            if path is not None:
+                response = client.post("/api/profiling/stop", headers=admin)
+                response.raise_for_status()
+                summary = response.json()["session"]
+            record = {
+                "mode": mode,
+                "requests": len(queries),
+                "throughput_qps": round(len(queries) / wall, 1),
+                "p50_ms": round(statistics.median(latencies) * 1000, 2),
+                "mean_ms": round(statistics.mean(latencies) * 1000, 2),
+                "profiled_requests": summary["requests"]["profiled"] if path is not None else 0,
+                "samples": summary["samples"] if path is not None else 0,
+            }
+            records.append(record)
+            print(f"{mode:12s} qps={record['throughput_qps']:7.1f} p50={record['p50_ms']:7.2f}ms "
+                  f"mean={record['mean_ms']:7.2f}ms profiled={record['profiled_requests']:4d} "
+                  f"samples={record['samples']}")
+
+        collapsed = client.get(f"/api/profiling/{summary['session_id']}/collapsed", headers=admin)
+        collapsed.raise_for_status()
+        collapsed_out.parent.mkdir(parents=True, exist_ok=True)
+        collapsed_out.write_text(collapsed.text, encoding="utf-8")
+        print("自身耗时最多的函数:")
+        for item in summary["top_self"][:10]:
+            print(f"  {item['percent']:6.2f}%  {item['function']}")
+        print(f"折叠栈已保存到 {collapsed_out}")
+    finally:
+        if server is not None:
+            server.should_exit = True
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({
+            "commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "params": vars(args) | {"out": str(out)},
+            "records": records,
+            "top_self": summary["top_self"] if summary else [],
+        }, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存到 {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,142 @@
+"""
+重建期间的搜索吞吐量
+
+先在空闲状态下用多个线程持续搜索同一索引，再在后台反复重建该索引的同时搜索，
+对比两种状态下的每秒查询数，并统计搜索错误数和结束时残留的旧版本数量。
+
+用法（在 backend 目录下执行）:
+    python -m benchmarks.rebuild --size 20000 --threads 4 --seconds 10
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from benchmarks.corpus import generate_chunks, generate_queries
+from benchmarks.run import RESULTS_DIR, _git_commit
+
+
+def _measure_throughput(search, queries: List[str], threads: int, seconds: float) -> Dict[str, Any]:
+    """threads 个线程持续搜索 seconds 秒"""
+    counts = [0] * threads
+    errors = [0] * threads
+    deadline = time.perf_counter() + seconds
+
+    def worker(slot: int):
+        i = slot
+        while time.perf_counter() < deadline:
+            try:
+                search(queries[i % len(queries)])
+                counts[slot] += 1
+            except Exception:
+                errors[slot] += 1
+            i += threads
+
+    workers = [threading.Thread(target=worker, args=(slot,)) for slot in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return {"queries": sum(counts), "errors": sum(errors), "qps": sum(counts) / seconds}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="重建期间的搜索吞吐量")
+    parser.add_argument("--size", type=int, default=20000)
+    parser.add_argument("--lang", default="zh", choices=["zh", "en"])
+    parser.add_argument("--format", default="faiss", choices=["llamaindex", "faiss", "compact"])
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--embed-dim", type=int, default=1024)
+    parser.add_argument("--out", type=Path, default=None, help="结果JSON路径")
+    args = parser.parse_args(argv)
+
+    out = (args.out or RESULTS_DIR / f"rebuild_{datetime.now().strftime('%Y%m%d%H%M%S')}.json").resolve()
+    workdir = Path(tempfile.mkdtemp(prefix="dataset_bench_"))
+    cwd = os.getcwd()
+    try:
+        # 应用模块在导入时会按相对路径创建目录，必须先切换到临时目录
+        os.chdir(workdir)
+        from app.services import vector_service
+        from app.services.config_service import ConfigService
+        from app.services.index_versions import list_versions
+
+        ConfigService.update_config({
+            "embedding_type": "local",
+            "local": {"embedding_dim": args.embed_dim},
+            "index_storage": {"format": args.format},
+        })
+        chunks = generate_chunks(args.size, args.lang, args.seed)
+        queries = generate_queries(args.queries, args.lang, args.seed)
+        index_id = vector_service.create_vector_index(chunks, "rebuild", use_llm=True)
+
+        def search(query: str):
+            vector_service.search_vector_index(query, index_id, top_k=10)
+
+        search(queries[0])
+        print(f"[{args.format}] {args.size} 个文本块，{args.threads} 个搜索线程")
+        idle = _measure_throughput(search, queries, args.threads, args.seconds)
+        print(f"    空闲: {idle['qps']:.1f} QPS，错误 {idle['errors']}")
+
+        # 后台反复重建同一索引
+        stop = threading.Event()
+        rebuilds = []
+
+        def rebuild_loop():
+            while not stop.is_set():
+                start = time.perf_counter()
+                vector_service.create_vector_index(chunks, "rebuild", use_llm=True, index_id=index_id)
+                rebuilds.append(time.perf_counter() - start)
+
+        rebuilder = threading.Thread(target=rebuild_loop)
+        rebuilder.start()
+        during = _measure_throughput(search, queries, args.threads, args.seconds)
+        stop.set()
+        rebuilder.join()
+        search(queries[0])
+        print(f"    重建期间: {during['qps']:.1f} QPS，错误 {during['errors']}，完成重建 {len(rebuilds)} 次")
+
+        record = {
+            "format": args.format,
+            "size": args.size,
+            "lang": args.lang,
+            "threads": args.threads,
+            "idle": idle,
+            "during_rebuild": during,
+            "qps_ratio": during["qps"] / idle["qps"] if idle["qps"] else None,
+            "rebuilds": len(rebuilds),
+            "rebuild_seconds": rebuilds,
+            "versions_left": len(list_versions(index_id)),
+        }
+        print(f"    吞吐量比例 {record['qps_ratio']:.2f}，残留版本 {record['versions_left']}")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "created_at": datetime.now().isoformat(),
+            "git_commit": _git_commit(),
+            "seconds": args.seconds,
+            "embed_dim": args.embed_dim,
+        },
+        "results": [record],
+    }
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存: {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
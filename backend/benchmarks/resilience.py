@@ -0,0 +1,175 @@
+"""
+远程模型调用的截止时间、并发限制和熔断
+
+启动可注入故障的本地模型服务（benchmarks.fault_server）并把 SiliconFlow 的嵌入和对话接口指向它，
+在上游正常、LLM变慢、嵌入接口全部报错、上游无响应四种情况下并发调用 /api/search，
+分别在关闭和开启准入控制（data/llm_config.json 的 resilience）时比较延迟、
+得到LLM回答和走降级路径的请求数，以及实际发往上游的请求数。
+
+用法（在 backend 目录下执行）:
+    python -m benchmarks.resilience --size 1000 --requests 24 --concurrency 8
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmarks.corpus import generate_chunks, generate_queries
+from benchmarks.fault_server import create_app, serve_in_thread
+from benchmarks.run import RESULTS_DIR, _git_commit
+
+
+def _scenarios(args: argparse.Namespace) -> Dict[str, Dict[str, Any]]:
+    return {
+        "healthy": {},
+        "llm_slow": {"chat": {"latency": args.slow}},
+        "embedding_errors": {"embeddings": {"error_rate": 1.0}},
+        "upstream_hang": {"embeddings": {"hang": args.hang}, "chat": {"hang": args.hang}},
+    }
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def _classify(response: httpx.Response) -> str:
+    """answered: LLM回答；degraded: 词法搜索或没有回答的原始结果；error: 请求失败"""
+    if response.status_code != 200:
+        return "error"
+    results = response.json()["results"]
+    if results and results[0].get("is_direct_answer") and not results[0].get("degraded"):
+        return "answered"
+    return "degraded"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="远程模型调用的截止时间、并发限制和熔断")
+    parser.add_argument("--size", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=24, help="每种情况的请求数")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--slow", type=float, default=3.0, help="llm_slow 情况下LLM的延迟（秒）")
+    parser.add_argument("--hang", type=float, default=5.0, help="upstream_hang 情况下上游挂起的时间（秒）")
+    parser.add_argument("--request-timeout", type=float, default=3.0, help="开启时请求的截止时间（秒）")
+    parser.add_argument("--embed-dim", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", type=Path, default=None, help="结果JSON路径")
+    args = parser.parse_args(argv)
+
+    out = (args.out or RESULTS_DIR / f"resilience_{datetime.now().strftime('%Y%m%d%H%M%S')}.json").resolve()
+    workdir = Path(tempfile.mkdtemp(prefix="dataset_bench_"))
+    cwd = os.getcwd()
+    records = []
+    servers = []
+    try:
+        # 应用模块在导入时会按相对路径创建目录，必须先切换到临时目录
+        os.chdir(workdir)
+        from app.main import app
+        from app.services import resilience, vector_service
+        from app.services.config_service import ConfigService
+
+        fault_url, fault_server = serve_in_thread(create_app(args.embed_dim, args.seed))
+        servers.append(fault_server)
+        ConfigService.update_config({
+            "llm_type": "siliconflow",
+            "embedding_type": "siliconflow",
+            "siliconflow": {
+                "api_key": "benchmark",
+                "embedding_model": "fault-embedding",
+                "completion_model": "fault-chat",
+                "embedding_api_base": f"{fault_url}/v1/embeddings",
+                "completion_api_base": f"{fault_url}/v1/chat/completions",
+            },
+            "index_storage": {"format": "faiss"},
+            # 每个请求都访问上游，不使用回答缓存
+            "answer_cache": {"enabled": False},
+            "resilience": {
+                "request_timeout_seconds": args.request_timeout,
+                "queue_timeout_seconds": 1,
+                "failure_threshold": 3,
+                "reset_seconds": 60,
+                "llm_call_timeout_seconds": 2,
+                "embedding_call_timeout_seconds": 1,
+            },
+        })
+        index_id = vector_service.create_vector_index(
+            generate_chunks(args.size, "zh", args.seed), "resilience", use_llm=True
+        )
+        app_url, app_server = serve_in_thread(app)
+        servers.append(app_server)
+        queries = generate_queries(args.requests, "zh", args.seed)
+
+        faults = httpx.Client(base_url=fault_url)
+        client = httpx.Client(base_url=app_url, timeout=300)
+        for enabled in (False, True):
+            for scenario, fault in _scenarios(args).items():
+                ConfigService.update_config({"resilience": {"enabled": enabled}})
+                # 每种情况从闭合的熔断器开始
+                for guard in list(resilience._guards.values()):
+                    guard[1].shutdown()
+                resilience._guards.clear()
+                faults.post("/_faults", json={"reset": True, **fault}).raise_for_status()
+                upstream_before = faults.get("/_faults").json()["requests"]
+
+                def _search(query: str):
+                    start = time.perf_counter()
+                    response = client.post("/api/search", data={"index_id": index_id, "query": query, "top_k": 5})
+                    return time.perf_counter() - start, _classify(response)
+
+                start = time.perf_counter()
+                with ThreadPoolExecutor(args.concurrency) as pool:
+                    outcomes = list(pool.map(_search, queries))
+                wall = time.perf_counter() - start
+                upstream_after = faults.get("/_faults").json()["requests"]
+                latencies = [latency for latency, _ in outcomes]
+                kinds = [kind for _, kind in outcomes]
+                record = {
+                    "resilience": enabled,
+                    "scenario": scenario,
+                    "requests": len(queries),
+                    "wall_seconds": round(wall, 2),
+                    "p50_ms": round(statistics.median(latencies) * 1000, 1),
+                    "p99_ms": round(_percentile(latencies, 0.99) * 1000, 1),
+                    "answered": kinds.count("answered"),
+                    "degraded": kinds.count("degraded"),
+                    "errors": kinds.count("error"),
+                    "upstream_requests": {name: upstream_after[name] - upstream_before[name]
+                                          for name in upstream_after},
+                    "breakers": {name: stats["state"] for name, stats in resilience.guard_stats().items()},
+                }
+                records.append(record)
+                print(f"resilience={str(enabled):5s} {scenario:16s} wall={record['wall_seconds']:6.2f}s "
+                      f"p50={record['p50_ms']:8.1f}ms p99={record['p99_ms']:8.1f}ms "
+                      f"answered={record['answered']:3d} degraded={record['degraded']:3d} "
+                      f"errors={record['errors']:3d} upstream={record['upstream_requests']} "
+                      f"breakers={record['breakers']}")
+    finally:
+        for server in servers:
+            server.should_exit = True
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({
+            "commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "params": vars(args) | {"out": str(out)},
+            "records": records,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存到 {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
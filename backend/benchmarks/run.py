@@ -0,0 +1,324 @@
+"""
+离线基准测试入口
+
+使用合成语料以及伪造的嵌入模型和LLM，对上传、清洗、拆分、建索引和搜索各阶段计时，
+结果以JSON格式保存，可以用 benchmarks.compare 对比两次运行。
+
+用法（在 backend 目录下执行）:
+    python -m benchmarks.run --sizes 1000 100000 --langs zh en
+    python -m benchmarks.run --sizes 1000000 --stages split_text create_vector_index_faiss
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = BACKEND_DIR / "benchmarks" / "results"
+
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from benchmarks.corpus import generate_chunks, generate_documents, generate_queries
+
+ALL_STAGES = [
+    "upload_file",
+    "rechunk_file",
+    "clean_data",
+    "split_text",
+    "deduplicate",
+    "create_vector_index_tfidf",
+    "create_vector_index_faiss",
+    "search_vector_index_tfidf",
+    "search_vector_index_faiss",
+    "semantic_search_multi",
+]
+
+
+def _max_rss_mb() -> float:
+    """当前进程的峰值常驻内存（MB）"""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return usage / 1024 / 1024 if sys.platform == "darwin" else usage / 1024
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def _summarize(samples: List[float]) -> Dict[str, float]:
+    """计算耗时样本的统计值"""
+    ordered = sorted(samples)
+    return {
+        "min": ordered[0],
+        "median": statistics.median(ordered),
+        "mean": statistics.fmean(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "max": ordered[-1],
+    }
+
+
+class BenchmarkRunner:
+    """在隔离的临时工作目录中运行各个基准测试阶段"""
+
+    def __init__(self, workdir: Path, repeat: int = 3, n_queries: int = 20, seed: int = 42,
+                 embed_dim: int = 1024, embedding_provider: str = "fake"):
+        self.workdir = workdir
+        self.repeat = repeat
+        self.n_queries = n_queries
+        self.seed = seed
+        self.embed_dim = embed_dim
+        self.records: List[Dict[str, Any]] = []
+
+        # 应用模块在导入时会按相对路径创建目录，必须先切换到临时目录
+        os.chdir(self.workdir)
+        from app.routers import files
+        from app.services import file_processor, vector_service
+        from app.services.config_service import ConfigService
+        from app.services.embedding_service import register_embedding_provider
+        from benchmarks.fakes import FakeEmbedding, FakeLLM
+
+        self.files = files
+        self.file_processor = file_processor
+        self.vector_service = vector_service
+
+        # 用伪造模型替换远程模型，保证离线且结果可复现
+        register_embedding_provider(
+            "fake", lambda embed_config: FakeEmbedding(model_name="fake", dimension=embed_dim)
+        )
+        ConfigService.update_config({
+            "embedding_type": embedding_provider,
+            "fake": {"embedding_model": "fake"},
+            "local": {"embedding_dim": embed_dim},
+        })
+        vector_service.get_llm_model = lambda: FakeLLM()
+
+    def _record(self, stage: str, lang: str, size: int, samples: List[float],
+                extra: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        record = {
+            "stage": stage,
+            "lang": lang,
+            "size": size,
+            "repeat": len(samples),
+            "seconds": samples,
+            "stats": _summarize(samples) if samples else None,
+            "max_rss_mb": round(_max_rss_mb(), 1),
+            "extra": extra or {},
+            "error": error,
+        }
+        self.records.append(record)
+        if error:
+            print(f"  {stage:<28} {lang} {size:>8}  失败: {error}")
+        else:
+            print(f"  {stage:<28} {lang} {size:>8}  median={record['stats']['median']:.4f}s")
+
+    def _measure(self, stage: str, lang: str, size: int, fn: Callable[[], Any],
+                 repeat: Optional[int] = None, setup: Optional[Callable[[], Any]] = None) -> Any:
+        """重复执行 fn 并记录耗时，返回最后一次的结果；setup 在每次执行前调用，不计入耗时"""
+        samples = []
+        result = None
+        try:
+            for _ in range(repeat or self.repeat):
+                if setup is not None:
+                    setup()
+                start = time.perf_counter()
+                result = fn()
+                samples.append(time.perf_counter() - start)
+        except Exception as e:
+            self._record(stage, lang, size, samples, error=f"{type(e).__name__}: {e}")
+            return None
+        self._record(stage, lang, size, samples)
+        return result
+
+    def _measure_queries(self, stage: str, lang: str, size: int, queries: List[str],
+                         fn: Callable[[str], Any]):
+        """逐条执行查询并记录单次查询延迟"""
+        samples = []
+        try:
+            for query in queries:
+                start = time.perf_counter()
+                fn(query)
+                samples.append(time.perf_counter() - start)
+        except Exception as e:
+            self._record(stage, lang, size, samples, error=f"{type(e).__name__}: {e}")
+            return
+        total = sum(samples)
+        self._record(stage, lang, size, samples,
+                     extra={"queries": len(samples), "qps": len(samples) / total if total else None})
+
+    def _clear_ingest_cache(self):
+        """等待后台写入完成后清空解析缓存，使下一次上传完整解析和清洗"""
+        from app.services.ingest_cache import INGEST_CACHE_DIR, wait_for_writes
+        wait_for_writes()
+        for path in INGEST_CACHE_DIR.iterdir():
+            path.unlink()
+
+    def _upload(self, filename: str, content: bytes):
+        from fastapi import UploadFile
+        upload = UploadFile(file=io.BytesIO(content), filename=filename)
+        return asyncio.run(self.files.upload_file(upload, max_chunk_size=512, overlap=100))
+
+    def _rechunk(self, filename: str):
+        return asyncio.run(self.files.rechunk_file(filename, max_chunk_size=512, overlap=100, text_column=None))
+
+    def run_size(self, lang: str, size: int, stages: List[str]):
+        """针对一种语言和规模运行所有选中的阶段"""
+        import pandas as pd
+
+        print(f"[{lang}] {size} 个文本块")
+        start = time.perf_counter()
+        chunks = generate_chunks(size, lang, self.seed)
+        documents = generate_documents(size, lang, self.seed)
+        self._record("generate_corpus", lang, size, [time.perf_counter() - start],
+                     extra={"chars": sum(len(c) for c in chunks), "documents": len(documents)})
+
+        file_id = f"bench_{lang}_{size}"
+        queries = generate_queries(self.n_queries, lang, self.seed)
+
+        if "upload_file" in stages or "rechunk_file" in stages:
+            frame = pd.DataFrame({"id": range(size), "score": [i / 10 for i in range(size)], "text": chunks})
+            csv_bytes = frame.to_csv(index=False).encode("utf-8")
+            del frame
+            if "upload_file" in stages:
+                self._measure("upload_file", lang, size, lambda: self._upload(f"{file_id}.csv", csv_bytes),
+                              setup=self._clear_ingest_cache)
+                txt_bytes = "\n".join(documents).encode("utf-8")
+                self._measure("upload_file_txt", lang, size, lambda: self._upload(f"{file_id}.txt", txt_bytes))
+                del txt_bytes
+            if "rechunk_file" in stages:
+                # 解析缓存已由上传写入，重新拆分只读取文本列
+                if "upload_file" not in stages:
+                    self._upload(f"{file_id}.csv", csv_bytes)
+                from app.services.ingest_cache import wait_for_writes
+                self._measure("rechunk_file", lang, size, lambda: self._rechunk(f"{file_id}.csv"),
+                              setup=wait_for_writes)
+            del csv_bytes
+
+        if "clean_data" in stages:
+            frame = pd.DataFrame({"id": range(size), "score": [i / 10 for i in range(size)], "text": chunks})
+            self._measure("clean_data", lang, size, lambda: self.file_processor.clean_data(frame))
+            del frame
+
+        if "split_text" in stages:
+            split_text = self.file_processor.split_text
+            self._measure("split_text", lang, size,
+                          lambda: [chunk for doc in documents for chunk in split_text(doc)])
+
+        if "deduplicate" in stages:
+            from app.services.dedup_service import deduplicate
+            self._measure("deduplicate", lang, size, lambda: deduplicate(chunks))
+
+        index_ids = {}
+        for kind, use_llm in (("tfidf", False), ("faiss", True)):
+            stage = f"create_vector_index_{kind}"
+            if stage not in stages:
+                continue
+            # 建索引成本较高，只执行一次
+            index_id = self._measure(
+                stage, lang, size,
+                lambda: self.vector_service.create_vector_index(chunks, file_id, use_llm=use_llm),
+                repeat=1
+            )
+            if index_id:
+                metadata_file = self.vector_service.VECTOR_DIR / f"{index_id}.json"
+                with open(metadata_file, "r", encoding="utf-8") as f:
+                    embedding_type = json.load(f).get("embedding_type")
+                self.records[-1]["extra"]["embedding_type"] = embedding_type
+                self.records[-1]["extra"]["metadata_bytes"] = metadata_file.stat().st_size
+                index_ids[kind] = index_id
+
+        for kind, index_id in index_ids.items():
+            stage = f"search_vector_index_{kind}"
+            if stage in stages:
+                self._measure_queries(
+                    stage, lang, size, queries,
+                    lambda q: self.vector_service.search_vector_index(q, index_id, top_k=5)
+                )
+
+        if "semantic_search_multi" in stages and index_ids:
+            ids = list(index_ids.values())
+            self._measure_queries(
+                "semantic_search_multi", lang, size, queries,
+                lambda q: self.vector_service.semantic_search_multi(q, ids, top_k=5)
+            )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="离线基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000],
+                        help="文本块数量")
+    parser.add_argument("--langs", nargs="+", default=["zh", "en"], choices=["zh", "en"])
+    parser.add_argument("--stages", nargs="+", default=ALL_STAGES, choices=ALL_STAGES)
+    parser.add_argument("--repeat", type=int, default=3, help="快速阶段的重复次数")
+    parser.add_argument("--queries", type=int, default=20, help="每个搜索阶段的查询数")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--embed-dim", type=int, default=1024)
+    parser.add_argument("--embedding-provider", default="fake", choices=["fake", "local"],
+                        help="FAISS索引使用的嵌入模型，local 为进程内哈希嵌入")
+    parser.add_argument("--out", type=Path, default=None, help="结果JSON路径")
+    parser.add_argument("--keep-workdir", action="store_true", help="保留临时工作目录")
+    args = parser.parse_args(argv)
+
+    out = args.out or RESULTS_DIR / f"bench_{datetime.now().strftime('%Y%m%d%H%M%S')}.json"
+    out = out.resolve()
+    workdir = Path(tempfile.mkdtemp(prefix="dataset_bench_"))
+    cwd = os.getcwd()
+
+    try:
+        runner = BenchmarkRunner(workdir, repeat=args.repeat, n_queries=args.queries,
+                                 seed=args.seed, embed_dim=args.embed_dim,
+                                 embedding_provider=args.embedding_provider)
+        for lang in args.langs:
+            for size in args.sizes:
+                runner.run_size(lang, size, args.stages)
+    finally:
+        os.chdir(cwd)
+        if args.keep_workdir:
+            print(f"工作目录已保留: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "created_at": datetime.now().isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "seed": args.seed,
+            "sizes": args.sizes,
+            "langs": args.langs,
+            "stages": args.stages,
+            "repeat": args.repeat,
+            "queries": args.queries,
+            "embed_dim": args.embed_dim,
+            "embedding_provider": args.embedding_provider,
+        },
+        "results": runner.records,
+    }
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存: {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""
+JSON序列化的耗时和体积
+
+比较原来的写法（标准库 json，ensure_ascii=False；接口响应经过 jsonable_encoder 和 JSONResponse）
+与 app.services.serialization（安装了 orjson 时使用 orjson）在典型负载上的编码耗时、解码耗时和字节数：
+TF-IDF 索引文件（稠密向量）、文本块元数据、单次搜索结果、批量搜索结果和文本块分页。
+另外检查新代码能否读取旧版本写入的文件（带缩进、包含 NaN）。
+
+用法（在 backend 目录下执行）:
+    python -m benchmarks.serialization --size 500 --repeat 5
+"""
+import argparse
+import json
+import math
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.corpus import generate_chunks, generate_queries
+from benchmarks.run import RESULTS_DIR, _git_commit
+
+
+def _payloads(size: int, seed: int) -> Dict[str, Any]:
+    """按各接口和索引文件的实际结构生成负载"""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    texts = generate_chunks(size, "zh", seed)
+    vectorizer = TfidfVectorizer()
+    matrix = vectorizer.fit_transform(texts)
+    tfidf_index = {
+        "index_id": "bench",
+        "texts": texts,
+        "vectors": matrix.toarray().tolist(),
+        "vocabulary": vectorizer.vocabulary_,
+        "idf": vectorizer.idf_.tolist(),
+        "embedding_type": "tfidf"
+    }
+
+    def _metadata(i: int) -> Dict[str, Any]:
+        return {"file_id": "products.csv", "column": "description", "row_id": i, "tags": {"lang": "zh", "batch": i % 7}}
+
+    def _result(i: int) -> Dict[str, Any]:
+        return {"text": texts[i % size], "similarity": 1.0 / (i + 1.5), "metadata": _metadata(i)}
+
+    queries = generate_queries(100, "zh", seed)
+    return {
+        "tfidf_index": tfidf_index,
+        "chunk_metadata": {"chunks": [_metadata(i) for i in range(size)]},
+        "search_response": {"message": "搜索成功", "results": [_result(i) for i in range(50)]},
+        "batch_search_response": {
+            "message": "批量搜索成功",
+            "results": [[_result(q * 10 + i) for i in range(10)] for q in range(len(queries))]
+        },
+        "chunk_page": {
+            "message": "获取文本块成功",
+            "file_id": "products.csv",
+            "chunks": [{"id": f"{i}:0", "group": i, "chunk": 0, "row_id": i, "text": texts[i % size]}
+                       for i in range(1000)],
+            "total": size,
+            "next_cursor": "1000"
+        }
+    }
+
+
+def _median_ms(func: Callable[[], Any], repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return round(statistics.median(times) * 1000, 3)
+
+
+def _check_legacy_files(workdir: Path) -> Dict[str, bool]:
+    """旧版本以 json.dump 写入的文件：带缩进的配置、包含 NaN 的索引文件"""
+    from app.services.serialization import load
+
+    config = {"llm_type": "siliconflow", "siliconflow": {"model": "模型"}, "dedup": {"threshold": 0.95}}
+    config_path = workdir / "legacy_config.json"
+    with open(config_path, "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+    index_path = workdir / "legacy_index.json"
+    with open(index_path, "w", encoding="utf-8") as f:
+        json.dump({"vectors": [[0.5, float("nan")]], "texts": ["文本"]}, f, ensure_ascii=False)
+    legacy_index = load(index_path)
+    return {
+        "indented_config": load(config_path) == config,
+        "nan_index": legacy_index["texts"] == ["文本"] and math.isnan(legacy_index["vectors"][0][1])
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="JSON序列化的耗时和体积")
+    parser.add_argument("--size", type=int, default=500, help="TF-IDF 索引和元数据的文本块数")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", type=Path, default=None, help="结果JSON路径")
+    args = parser.parse_args(argv)
+
+    out = (args.out or RESULTS_DIR / f"serialization_{datetime.now().strftime('%Y%m%d%H%M%S')}.json").resolve()
+    cwd = os.getcwd()
+    records = []
+    with tempfile.TemporaryDirectory(prefix="dataset_bench_") as workdir:
+        try:
+            # 应用模块在导入时会按相对路径创建目录，必须先切换到临时目录
+            os.chdir(workdir)
+            from fastapi.encoders import jsonable_encoder
+            from fastapi.responses import JSONResponse
+            from app.services import serialization
+            from app.services.serialization import FastJSONResponse, dumps, loads
+
+            backend = "orjson" if serialization.orjson is not None else "json"
+            print(f"serialization 使用 {backend}")
+            compatible = _check_legacy_files(Path(workdir))
+            print(f"读取旧版本文件: {compatible}")
+
+            for name, payload in _payloads(args.size, args.seed).items():
+                old_bytes = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                new_bytes = dumps(payload)
+                assert loads(new_bytes) == json.loads(old_bytes), name
+                record = {
+                    "payload": name,
+                    "stdlib_bytes": len(old_bytes),
+                    "bytes": len(new_bytes),
+                    "stdlib_encode_ms": _median_ms(
+                        lambda: json.dumps(payload, ensure_ascii=False).encode("utf-8"), args.repeat),
+                    "encode_ms": _median_ms(lambda: dumps(payload), args.repeat),
+                    "stdlib_decode_ms": _median_ms(lambda: json.loads(old_bytes), args.repeat),
+                    "decode_ms": _median_ms(lambda: loads(new_bytes), args.repeat)
+                }
+                if name.endswith("_response") or name == "chunk_page":
+                    # 原来接口返回字典时经过 jsonable_encoder 再由 JSONResponse 编码
+                    record["stdlib_response_ms"] = _median_ms(
+                        lambda: JSONResponse(jsonable_encoder(payload)), args.repeat)
+                    record["response_ms"] = _median_ms(lambda: FastJSONResponse(payload), args.repeat)
+                records.append(record)
+                line = (f"{name:22s} {record['stdlib_bytes'] / 1024:10.1f} -> {record['bytes'] / 1024:10.1f} KB  "
+                        f"编码 {record['stdlib_encode_ms']:9.2f} -> {record['encode_ms']:8.2f} ms  "
+                        f"解码 {record['stdlib_decode_ms']:9.2f} -> {record['decode_ms']:8.2f} ms")
+                if "response_ms" in record:
+                    line += f"  响应 {record['stdlib_response_ms']:8.2f} -> {record['response_ms']:7.2f} ms"
+                print(line)
+        finally:
+            os.chdir(cwd)
+
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({
+            "commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "backend": backend,
+            "params": vars(args) | {"out": str(out)},
+            "legacy_compatible": compatible,
+            "records": records
+        }, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存到 {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,211 @@
+"""
+分片索引的分散-汇聚搜索
+
+同一份语料分别建一个不分片的索引和分为 N 个分片的索引，N 个分片各由一个本机分片服务进程
+（shard_worker.py）搜索。比较不分片时在本进程中搜索与分片后分散-汇聚搜索的延迟（p50、p99）、
+并发请求下的吞吐量，以及每个进程需要打开的索引大小和常驻内存：单个进程能容纳的索引大小
+决定了分片前的容量上限。查询向量预先计算，结果只反映检索本身。
+
+用法（在 backend 目录下执行，仅支持 Linux）:
+    python -m benchmarks.sharding --size 100000 --shards 2 4 8 --concurrency 8
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+import numpy as np
+
+from benchmarks.corpus import generate_chunks, generate_queries
+from benchmarks.fault_server import free_port
+from benchmarks.run import BACKEND_DIR, RESULTS_DIR, _git_commit
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def _rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status", "r") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def _start_workers(workdir: Path, count: int) -> List[Any]:
+    """启动 count 个分片服务进程，等待就绪后返回 [(地址, 进程)]"""
+    env = {**os.environ, "PYTHONPATH": str(BACKEND_DIR)}
+    workers = []
+    for _ in range(count):
+        port = free_port()
+        process = subprocess.Popen(
+            [sys.executable, str(BACKEND_DIR / "shard_worker.py"), "--port", str(port)],
+            cwd=workdir, env=env, stderr=subprocess.DEVNULL
+        )
+        workers.append((f"http://127.0.0.1:{port}", process))
+    deadline = time.monotonic() + 60
+    for url, process in workers:
+        while True:
+            try:
+                httpx.get(f"{url}/health", timeout=1).raise_for_status()
+                break
+            except httpx.HTTPError:
+                if time.monotonic() > deadline or process.poll() is not None:
+                    raise RuntimeError(f"分片服务进程 {url} 启动失败")
+                time.sleep(0.1)
+    return workers
+
+
+def _measure(search: Callable[[int], Any], n_queries: int, requests: int, concurrency: int) -> Dict[str, Any]:
+    """顺序请求的延迟分布，以及 concurrency 个线程并发时的吞吐量"""
+    for i in range(min(n_queries, 5)):
+        search(i)
+    latencies = []
+    for i in range(requests):
+        start = time.perf_counter()
+        search(i % n_queries)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(search, [i % n_queries for i in range(requests)]))
+    elapsed = time.perf_counter() - start
+    return {
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 2),
+        "qps": round(requests / elapsed, 1),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="分片索引的分散-汇聚搜索")
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--lang", default="zh", choices=["zh", "en"])
+    parser.add_argument("--shards", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--format", default="faiss", choices=["faiss", "compact"])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=200, help="每种配置的请求数")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--embed-dim", type=int, default=256)
+    parser.add_argument("--out", type=Path, default=None, help="结果JSON路径")
+    args = parser.parse_args(argv)
+
+    out = (args.out or RESULTS_DIR / f"sharding_{datetime.now().strftime('%Y%m%d%H%M%S')}.json").resolve()
+    workdir = Path(tempfile.mkdtemp(prefix="dataset_bench_"))
+    cwd = os.getcwd()
+    records = []
+    workers = []
+    try:
+        # 应用模块在导入时会按相对路径创建目录，必须先切换到临时目录
+        os.chdir(workdir)
+        from app.services import vector_service
+        from app.services.compact_store import directory_size
+        from app.services.config_service import ConfigService
+        from app.services.embedding_service import embed_texts, get_embedding_model
+        from app.services.shard_store import SHARD_DIR
+
+        # 分片服务进程读取同一份配置，使用本地嵌入模型保证离线
+        ConfigService.update_config({
+            "embedding_type": "local",
+            "local": {"embedding_dim": args.embed_dim},
+            "index_storage": {"format": args.format, "quantization": "float32"},
+            "sharding": {"shards": 1, "workers": [], "timeout_seconds": 10}
+        })
+        chunks = generate_chunks(args.size, args.lang, args.seed)
+        queries = generate_queries(args.queries, args.lang, args.seed)
+        query_vectors = embed_texts(queries, get_embedding_model())
+
+        def _search(index_id: str) -> Callable[[int], Any]:
+            def search(i: int):
+                results = vector_service.search_vector_index(queries[i], index_id, args.top_k,
+                                                             query_vector=query_vectors[i])
+                assert results and not results[0].get("degraded"), results[:1]
+                return results
+            return search
+
+        print(f"{args.size} 个文本块，{args.format} 格式，CPU {os.cpu_count()} 核")
+        base_id = vector_service.create_vector_index(chunks, "base", use_llm=True)
+        base_data = vector_service.load(vector_service.VECTOR_DIR / f"{base_id}.json")
+        rss_before = _rss_mb(os.getpid())
+        record = _measure(_search(base_id), len(queries), args.requests, args.concurrency)
+        record.update({
+            "shards": 1,
+            "mode": "in_process",
+            "largest_process_index_mb": round(directory_size(base_data["index_store_path"]) / 1024 / 1024, 1),
+            "coordinator_rss_growth_mb": round(_rss_mb(os.getpid()) - rss_before, 1),
+        })
+        records.append(record)
+        expected = [[r["text"] for r in _search(base_id)(i)] for i in range(len(queries))]
+        print(f"不分片      p50 {record['p50_ms']:8.2f}ms  p99 {record['p99_ms']:8.2f}ms  "
+              f"{record['qps']:8.1f} 次/秒  单进程索引 {record['largest_process_index_mb']}MB")
+
+        for shards in args.shards:
+            ConfigService.update_config({"sharding": {"shards": shards, "workers": []}})
+            index_id = vector_service.create_vector_index(chunks, f"sharded_{shards}", use_llm=True)
+            index_data = vector_service.load(vector_service.VECTOR_DIR / f"{index_id}.json")
+            shard_dir = Path(index_data["index_store_path"]) / SHARD_DIR
+            workers = _start_workers(workdir, shards)
+            ConfigService.update_config({"sharding": {"workers": [url for url, _ in workers]}})
+
+            search = _search(index_id)
+            rss_before = _rss_mb(os.getpid())
+            record = _measure(search, len(queries), args.requests, args.concurrency)
+            # 分片结果与不分片时相同
+            recall = np.mean([
+                len(set(r["text"] for r in search(i)) & set(expected[i])) / len(expected[i])
+                for i in range(len(queries))
+            ])
+            record.update({
+                "shards": shards,
+                "mode": "scatter_gather",
+                "recall_vs_unsharded": round(float(recall), 4),
+                "largest_process_index_mb": round(max(
+                    directory_size(shard_dir / str(shard)) for shard in range(index_data["shards"])
+                ) / 1024 / 1024, 1),
+                "coordinator_rss_growth_mb": round(_rss_mb(os.getpid()) - rss_before, 1),
+                "worker_rss_mb": [round(_rss_mb(process.pid), 1) for _, process in workers],
+            })
+            records.append(record)
+            print(f"{shards:2d} 个分片   p50 {record['p50_ms']:8.2f}ms  p99 {record['p99_ms']:8.2f}ms  "
+                  f"{record['qps']:8.1f} 次/秒  单进程索引 {record['largest_process_index_mb']}MB  "
+                  f"召回 {record['recall_vs_unsharded']}")
+            for _, process in workers:
+                process.terminate()
+                process.wait()
+            workers = []
+    finally:
+        for _, process in workers:
+            process.terminate()
+            process.wait()
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({
+            "commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "cpu_count": os.cpu_count(),
+            "params": vars(args) | {"out": str(out)},
+            "records": records,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存到 {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,174 @@
+"""
+索引持久化格式对比
+
+分别以原有的LlamaIndex JSON格式、FAISS原生格式和紧凑格式（float32/float16/int8 量化，可选zstd压缩）
+为同一份语料建索引，报告磁盘占用、加载耗时、首次查询延迟以及相对精确搜索的召回率。
+
+用法（在 backend 目录下执行）:
+    python -m benchmarks.storage_format --sizes 1000 100000 --langs zh
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+from benchmarks.corpus import generate_chunks, generate_queries
+from benchmarks.run import BenchmarkRunner, RESULTS_DIR, _git_commit
+
+FORMATS = [
+    ("llamaindex", "float32", "none"),
+    ("faiss", "float32", "none"),
+    ("compact", "float32", "none"),
+    ("compact", "float16", "none"),
+    ("compact", "int8", "none"),
+    ("compact", "float16", "zstd"),
+    ("compact", "int8", "zstd"),
+]
+
+
+def _recall(results: List[List[str]], truth: List[List[str]]) -> float:
+    """结果文本与精确搜索结果的平均重合率"""
+    hits = [len(set(r) & set(t)) / max(1, len(t)) for r, t in zip(results, truth)]
+    return float(np.mean(hits)) if hits else 0.0
+
+
+def run_storage_formats(runner: BenchmarkRunner, lang: str, size: int, top_k: int = 10):
+    """为一种语言和规模对比所有持久化格式"""
+    from llama_index.core import load_index_from_storage
+    from llama_index.core.storage.storage_context import StorageContext
+    from llama_index.vector_stores.faiss import FaissVectorStore
+    from app.services.compact_store import CompactIndex, directory_size
+    from app.services.faiss_store import FaissMmapIndex
+    from app.services.config_service import ConfigService
+    from app.services.embedding_service import embed_texts, get_embedding_model
+
+    vector_service = runner.vector_service
+    print(f"[{lang}] {size} 个文本块")
+    chunks = generate_chunks(size, lang, runner.seed)
+    queries = generate_queries(runner.n_queries, lang, runner.seed)
+
+    # 以 float32 精确搜索结果作为召回率的基准
+    embed_model = get_embedding_model()
+    corpus_vectors = embed_texts(chunks, embed_model)
+    corpus_vectors /= np.maximum(np.linalg.norm(corpus_vectors, axis=1, keepdims=True), 1e-12)
+    query_vectors = np.asarray([embed_model.get_query_embedding(q) for q in queries], dtype=np.float32)
+    truth_ids = np.argsort(-(query_vectors @ corpus_vectors.T), axis=1)[:, :top_k]
+    truth = [[chunks[i] for i in row] for row in truth_ids]
+
+    for storage_format, quantization, compression in FORMATS:
+        name = f"storage_{storage_format}_{quantization}_{compression}"
+        ConfigService.update_config({"index_storage": {
+            "format": storage_format, "quantization": quantization, "compression": compression
+        }})
+
+        start = time.perf_counter()
+        index_id = vector_service.create_vector_index(chunks, f"storage_{lang}_{size}", use_llm=True)
+        build_seconds = time.perf_counter() - start
+
+        metadata_file = vector_service.VECTOR_DIR / f"{index_id}.json"
+        with open(metadata_file, "r", encoding="utf-8") as f:
+            index_data = json.load(f)
+        index_store_path = index_data["index_store_path"]
+        disk_bytes = directory_size(Path(index_store_path)) + metadata_file.stat().st_size
+
+        if storage_format in ("compact", "faiss"):
+            start = time.perf_counter()
+            if storage_format == "faiss":
+                compact_index = FaissMmapIndex(Path(index_store_path) / vector_service.FAISS_DIR)
+            else:
+                compact_index = CompactIndex(Path(index_store_path) / vector_service.COMPACT_DIR)
+            load_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            scores, ids = compact_index.search(query_vectors[:1], top_k)
+            compact_index.get_texts(ids[0].tolist())
+            first_query_seconds = time.perf_counter() - start
+
+            _, ids = compact_index.search(query_vectors, top_k)
+            results = [compact_index.get_texts(row.tolist()) for row in ids]
+            compact_index.close()
+        else:
+            start = time.perf_counter()
+            storage_context = StorageContext.from_defaults(
+                vector_store=FaissVectorStore.from_persist_dir(index_store_path),
+                persist_dir=index_store_path
+            )
+            loaded_index = load_index_from_storage(storage_context=storage_context, embed_model=embed_model)
+            load_seconds = time.perf_counter() - start
+
+            retriever = loaded_index.as_retriever(similarity_top_k=top_k)
+            start = time.perf_counter()
+            retriever.retrieve(queries[0])
+            first_query_seconds = time.perf_counter() - start
+
+            results = [[node.node.text for node in retriever.retrieve(q)] for q in queries]
+
+        runner._record(name, lang, size, [load_seconds], extra={
+            "format": storage_format,
+            "quantization": quantization,
+            "compression": compression,
+            "disk_bytes": disk_bytes,
+            "build_seconds": build_seconds,
+            "load_seconds": load_seconds,
+            "first_query_seconds": first_query_seconds,
+            "recall_at_k": _recall(results, truth),
+            "top_k": top_k,
+        })
+        print(f"    磁盘 {disk_bytes / 1024 / 1024:.2f}MB  召回率 {runner.records[-1]['extra']['recall_at_k']:.4f}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="索引持久化格式对比")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000])
+    parser.add_argument("--langs", nargs="+", default=["zh", "en"], choices=["zh", "en"])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--embed-dim", type=int, default=1024)
+    parser.add_argument("--embedding-provider", default="local", choices=["fake", "local"])
+    parser.add_argument("--out", type=Path, default=None, help="结果JSON路径")
+    args = parser.parse_args(argv)
+
+    out = (args.out or RESULTS_DIR / f"storage_{datetime.now().strftime('%Y%m%d%H%M%S')}.json").resolve()
+    workdir = Path(tempfile.mkdtemp(prefix="dataset_bench_"))
+    cwd = os.getcwd()
+    try:
+        runner = BenchmarkRunner(workdir, repeat=1, n_queries=args.queries, seed=args.seed,
+                                 embed_dim=args.embed_dim, embedding_provider=args.embedding_provider)
+        for lang in args.langs:
+            for size in args.sizes:
+                run_storage_formats(runner, lang, size, args.top_k)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "created_at": datetime.now().isoformat(),
+            "git_commit": _git_commit(),
+            "sizes": args.sizes,
+            "langs": args.langs,
+            "queries": args.queries,
+            "top_k": args.top_k,
+            "embed_dim": args.embed_dim,
+            "embedding_provider": args.embedding_provider,
+        },
+        "results": runner.records,
+    }
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存: {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+"""
+多 worker 内存占用对比
+
+模拟以多个 uvicorn worker 部署时，每个进程搜索同一个索引的内存占用和冷启动查询延迟。
+为每种持久化格式建一个索引，清空其页缓存后启动 N 个进程同时搜索，
+在所有进程都完成搜索后读取 /proc/<pid>/smaps_rollup：PSS 按共享进程数分摊共享页，
+所有进程的 PSS 之和即为实际占用的物理内存。
+
+用法（在 backend 目录下执行，仅支持 Linux）:
+    python -m benchmarks.workers --size 100000 --workers 1 8
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from benchmarks.corpus import generate_chunks, generate_queries
+from benchmarks.run import BACKEND_DIR, RESULTS_DIR, _git_commit
+
+FORMATS = ["llamaindex", "faiss", "compact"]
+
+
+def _memory_mb() -> Dict[str, float]:
+    """当前进程的 RSS、PSS 和私有内存（MB）"""
+    values = {}
+    with open("/proc/self/smaps_rollup", "r") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                values[parts[0][:-1]] = int(parts[1]) / 1024
+    return {
+        "rss_mb": values.get("Rss", 0.0),
+        "pss_mb": values.get("Pss", 0.0),
+        "private_mb": values.get("Private_Clean", 0.0) + values.get("Private_Dirty", 0.0),
+    }
+
+
+def _evict_page_cache(path: Path):
+    """让操作系统丢弃索引文件的页缓存，使首次查询为冷启动"""
+    for file in Path(path).rglob("*"):
+        if file.is_file():
+            fd = os.open(file, os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+
+
+def _worker(workdir: str, index_id: str, queries: List[str], barrier, results):
+    """单个 worker：冷启动查询、热查询，等待所有 worker 完成后报告内存"""
+    os.chdir(workdir)
+    if str(BACKEND_DIR) not in sys.path:
+        sys.path.insert(0, str(BACKEND_DIR))
+    import faiss  # noqa: F401
+    from app.services import vector_service
+
+    # 预热嵌入模型，使导入和模型初始化不计入索引的内存和延迟
+    vector_service.get_embedding_model().get_query_embedding(queries[0])
+    barrier.wait()
+
+    before = _memory_mb()
+    start = time.perf_counter()
+    vector_service.search_vector_index(queries[0], index_id, top_k=10)
+    first_query_seconds = time.perf_counter() - start
+
+    warm = []
+    for query in queries[1:]:
+        start = time.perf_counter()
+        vector_service.search_vector_index(query, index_id, top_k=10)
+        warm.append(time.perf_counter() - start)
+
+    # 所有 worker 都完成搜索后再读取内存，PSS 才能反映共享情况
+    barrier.wait()
+    results.put({
+        "pid": os.getpid(),
+        "first_query_seconds": first_query_seconds,
+        "warm_query_seconds": statistics.median(warm) if warm else None,
+        "before": before,
+        "after": _memory_mb(),
+    })
+    barrier.wait()
+
+
+def run_workers(workdir: Path, index_id: str, index_store_path: Path, queries: List[str],
+                n_workers: int) -> Dict[str, Any]:
+    """启动 n_workers 个进程同时搜索同一索引"""
+    _evict_page_cache(index_store_path)
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(n_workers)
+    results = context.Queue()
+    processes = [
+        context.Process(target=_worker, args=(str(workdir), index_id, queries, barrier, results))
+        for _ in range(n_workers)
+    ]
+    for process in processes:
+        process.start()
+    reports = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    return {
+        "workers": n_workers,
+        "total_pss_mb": sum(r["after"]["pss_mb"] for r in reports),
+        "total_pss_growth_mb": sum(r["after"]["pss_mb"] - r["before"]["pss_mb"] for r in reports),
+        "total_private_growth_mb": sum(r["after"]["private_mb"] - r["before"]["private_mb"] for r in reports),
+        "max_rss_mb": max(r["after"]["rss_mb"] for r in reports),
+        "first_query_seconds": statistics.median(r["first_query_seconds"] for r in reports),
+        "warm_query_seconds": statistics.median(
+            r["warm_query_seconds"] for r in reports if r["warm_query_seconds"] is not None
+        ) if len(queries) > 1 else None,
+        "per_worker": reports,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="多 worker 内存占用对比")
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--lang", default="zh", choices=["zh", "en"])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--formats", nargs="+", default=FORMATS, choices=FORMATS)
+    parser.add_argument("--queries", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--embed-dim", type=int, default=1024)
+    parser.add_argument("--out", type=Path, default=None, help="结果JSON路径")
+    args = parser.parse_args(argv)
+
+    out = (args.out or RESULTS_DIR / f"workers_{datetime.now().strftime('%Y%m%d%H%M%S')}.json").resolve()
+    workdir = Path(tempfile.mkdtemp(prefix="dataset_bench_"))
+    cwd = os.getcwd()
+    records = []
+    try:
+        # 应用模块在导入时会按相对路径创建目录，必须先切换到临时目录
+        os.chdir(workdir)
+        from app.services import vector_service
+        from app.services.config_service import ConfigService
+
+        # worker 进程读取同一份配置，使用本地嵌入模型保证离线
+        ConfigService.update_config({"embedding_type": "local", "local": {"embedding_dim": args.embed_dim}})
+        chunks = generate_chunks(args.size, args.lang, args.seed)
+        queries = generate_queries(args.queries, args.lang, args.seed)
+
+        for storage_format in args.formats:
+            ConfigService.update_config({"index_storage": {"format": storage_format}})
+            index_id = vector_service.create_vector_index(chunks, f"workers_{storage_format}", use_llm=True)
+            with open(vector_service.VECTOR_DIR / f"{index_id}.json", "r", encoding="utf-8") as f:
+                index_store_path = Path(json.load(f)["index_store_path"])
+
+            for n_workers in args.workers:
+                print(f"[{storage_format}] {args.size} 个文本块，{n_workers} 个 worker")
+                record = run_workers(workdir, index_id, index_store_path, queries, n_workers)
+                record.update({"format": storage_format, "size": args.size, "lang": args.lang})
+                records.append(record)
+                print(f"    PSS合计 {record['total_pss_mb']:.1f}MB  私有内存增长 "
+                      f"{record['total_private_growth_mb']:.1f}MB  冷查询 {record['first_query_seconds'] * 1000:.1f}ms")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "created_at": datetime.now().isoformat(),
+            "git_commit": _git_commit(),
+            "size": args.size,
+            "lang": args.lang,
+            "workers": args.workers,
+            "queries": args.queries,
+            "embed_dim": args.embed_dim,
+        },
+        "results": records,
+    }
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存: {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""
+批量导入本地目录或压缩包
+
+与 /api/bulk-upload 相同，在进程池中并行解析、清洗和拆分，逐个输出文件的处理结果，
+最后输出每秒处理的文件数和MB数；--create-index 时用全部文本块创建一个向量索引。
+
+用法（在 backend 目录下执行）:
+    python ingest.py ./docs --workers 8 --create-index --index-name docs
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+from app.services.bulk_ingest import (
+    build_index, collect_directory, extract_archive, is_archive, iter_ingest, shutdown_pool, worker_count
+)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="批量导入本地目录或压缩包")
+    parser.add_argument("path", type=Path, help="目录，或 zip/tar 压缩包")
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认使用配置（0 为CPU核数）")
+    parser.add_argument("--max-chunk-size", type=int, default=512)
+    parser.add_argument("--overlap", type=int, default=100)
+    parser.add_argument("--no-recursive", action="store_true", help="不处理子目录")
+    parser.add_argument("--create-index", action="store_true", help="处理完成后创建一个向量索引")
+    parser.add_argument("--index-name", default="bulk")
+    parser.add_argument("--tags", default=None, help="附加到每个文本块的自定义标签（JSON对象）")
+    parser.add_argument("--json", action="store_true", help="以NDJSON输出每个事件")
+    args = parser.parse_args(argv)
+
+    if args.max_chunk_size < 1 or args.overlap < 0 or args.overlap >= args.max_chunk_size:
+        parser.error("需要 0 <= overlap < max_chunk_size")
+    tags = json.loads(args.tags) if args.tags else None
+    if tags is not None and not isinstance(tags, dict):
+        parser.error("标签必须是JSON对象")
+
+    if args.path.is_dir():
+        items = collect_directory(args.path, recursive=not args.no_recursive)
+    elif args.path.is_file() and is_archive(args.path.name):
+        items = extract_archive(args.path, prefix=args.path.name.split('.')[0])
+    else:
+        parser.error(f"不是目录或支持的压缩包: {args.path}")
+    if not items:
+        print("没有支持的文件", file=sys.stderr)
+        return 1
+
+    print(f"处理 {len(items)} 个文件，{min(worker_count(args.workers), len(items))} 个进程", file=sys.stderr)
+    succeeded = []
+    failed = 0
+    try:
+        for event in iter_ingest(items, args.max_chunk_size, args.overlap, args.workers):
+            if args.json:
+                print(json.dumps(event, ensure_ascii=False), flush=True)
+            elif event["event"] == "file":
+                detail = f"{event['chunk_count']} 个文本块" if event["status"] == "ok" else event["error"]
+                print(f"[{event['done']}/{event['total']}] {event['status']:5s} {event['file_id']} "
+                      f"({event['seconds']:.2f}s) {detail}", flush=True)
+            else:
+                print(f"完成: 成功 {event['succeeded']}，失败 {event['failed']}，{event['chunk_count']} 个文本块，"
+                      f"{event['seconds']:.2f}s，{event['files_per_second']} 文件/秒，{event['mb_per_second']} MB/秒")
+            if event["event"] == "file":
+                if event["status"] == "ok":
+                    succeeded.append(event["file_id"])
+                else:
+                    failed += 1
+    finally:
+        shutdown_pool()
+
+    if args.create_index and succeeded:
+        result = build_index(succeeded, args.index_name, tags)
+        if args.json:
+            print(json.dumps({"event": "index", "status": "ok", **result}, ensure_ascii=False))
+        else:
+            print(f"已创建向量索引 {result['index_id']}（{result['chunk_count']} 个文本块，{result['seconds']:.2f}s）")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,4 +1,9 @@
+import os
+
 import uvicorn
 
+# worker 数量，多个 worker 时不能启用自动重载
+WORKERS = int(os.environ.get("UVICORN_WORKERS", "1"))
+
 if __name__ == "__main__":
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=WORKERS == 1, workers=WORKERS)
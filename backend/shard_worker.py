@@ -0,0 +1,63 @@
+"""
+启动分片服务进程
+
+每个进程可以搜索任意分片索引的任意分片（由请求指定），读取与主服务相同的 index_store 目录；
+主服务按配置 sharding.workers 把第 i 个分片发往 workers[i % len(workers)]。
+--count 大于 1 时在连续端口上启动多个进程，便于在本机部署。
+
+用法（在 backend 目录下执行）:
+    python shard_worker.py --port 8101 --count 4
+"""
+import argparse
+import json
+import multiprocessing
+import signal
+import sys
+from typing import List, Optional
+
+import uvicorn
+
+
+def serve(host: str, port: int, log_level: str):
+    from app.services.shard_worker import create_app
+
+    uvicorn.run(create_app(), host=host, port=port, log_level=log_level)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="启动分片服务进程")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8101, help="第一个进程的端口")
+    parser.add_argument("--count", type=int, default=1, help="进程数，端口依次递增")
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args(argv)
+    if args.count < 1:
+        parser.error("--count 必须为正整数")
+
+    ports = list(range(args.port, args.port + args.count))
+    workers = [f"http://{args.host}:{port}" for port in ports]
+    print("在 data/llm_config.json 中配置: " + json.dumps({"sharding": {"workers": workers}}), file=sys.stderr)
+    if args.count == 1:
+        serve(args.host, args.port, args.log_level)
+        return 0
+
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=serve, args=(args.host, port, args.log_level)) for port in ports]
+    # 收到 SIGTERM 时与 Ctrl+C 一样结束所有子进程
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,19 +1,30 @@
 import { defineStore } from 'pinia'
 import { ref, computed } from 'vue'
 
+// 每次加载的文本块数量
+const CHUNK_PAGE_SIZE = 200
+
 export const useFileStore = defineStore('file', () => {
     // 状态
     const isLoading = ref(false)
     const error = ref(null)
     const fileId = ref(null)
-    const splitResults = ref([])
-    const selectedChunks = ref([])
+    const summary = ref(null)
+    const chunks = ref([]) // 已加载的文本块 {id, group, chunk, row_id, text}
+    const nextCursor = ref(null)
+    const isLoadingChunks = ref(false)
+    const selectedChunks = ref([]) // 选中的文本块ID
+    const selectAllChunks = ref(false)
     const indexId = ref(null)
     const indexCreated = ref(false)
     const searchResults = ref([])
 
     // 计算属性
-    const hasSelectedChunks = computed(() => selectedChunks.value.length > 0)
+    const hasSelectedChunks = computed(() => selectAllChunks.value || selectedChunks.value.length > 0)
+    const selectedCount = computed(() =>
+        selectAllChunks.value ? (summary.value?.chunk_count || 0) : selectedChunks.value.length)
+    const hasMoreChunks = computed(() => nextCursor.value !== null)
+    const chunkTextById = computed(() => new Map(chunks.value.map(chunk => [chunk.id, chunk.text])))
     const canCreateIndex = computed(() => hasSelectedChunks.value && fileId.value && !indexCreated.value)
 
     // 上传文件
@@ -37,7 +48,12 @@ export const useFileStore = defineStore('file', () => {
 
             const data = await response.json()
             fileId.value = data.file_id
-            splitResults.value = data.split_results
+            summary.value = data.summary
+            chunks.value = []
+            nextCursor.value = '0'
+            selectedChunks.value = []
+            selectAllChunks.value = false
+            await loadMoreChunks()
             return data
         } catch (err) {
             error.value = err.message
@@ -47,6 +63,40 @@ export const useFileStore = defineStore('file', () => {
         }
     }
 
+    // 分页加载下一批文本块
+    async function loadMoreChunks() {
+        if (!fileId.value || nextCursor.value === null || isLoadingChunks.value) return
+
+        isLoadingChunks.value = true
+        error.value = null
+
+        try {
+            const params = new URLSearchParams({ cursor: nextCursor.value, limit: CHUNK_PAGE_SIZE })
+            const response = await fetch(
+                `http://localhost:8000/api/files/${encodeURIComponent(fileId.value)}/chunks?${params}`)
+
+            if (!response.ok) {
+                const errorData = await response.json()
+                throw new Error(errorData.detail || '获取文本块失败')
+            }
+
+            const data = await response.json()
+            chunks.value.push(...data.chunks)
+            nextCursor.value = data.next_cursor
+            return data
+        } catch (err) {
+            error.value = err.message
+            throw err
+        } finally {
+            isLoadingChunks.value = false
+        }
+    }
+
+    // 获取已加载文本块的内容
+    function chunkText(chunkId) {
+        return chunkTextById.value.get(chunkId) || ''
+    }
+
     // 提交选择的文本块
     async function submitSelectedChunks() {
         if (!hasSelectedChunks.value || !fileId.value) return
@@ -55,22 +105,46 @@ export const useFileStore = defineStore('file', () => {
         error.value = null
 
         try {
-            // 分批处理，每批最多1000个文本块
-            const BATCH_SIZE = 500
-            const chunks = [...selectedChunks.value]
-            const totalChunks = chunks.length
+            // 全选时由后端直接选中全部文本块
+            if (selectAllChunks.value) {
+                const formData = new FormData()
+                formData.append('file_id', fileId.value)
+                formData.append('select_all', 'true')
+
+                const response = await fetch('http://localhost:8000/api/select-chunks', {
+                    method: 'POST',
+                    body: formData
+                })
+
+                if (!response.ok) {
+                    const errorData = await response.json()
+                    throw new Error(errorData.detail || '提交文本块失败')
+                }
+
+                const data = await response.json()
+                return {
+                    ...data,
+                    message: `已成功提交所有文本块，共${data.selected_count}个`,
+                    total_processed: data.selected_count
+                }
+            }
+
+            // 分批提交文本块ID
+            const BATCH_SIZE = 1000
+            const chunkIds = [...selectedChunks.value]
+            const totalChunks = chunkIds.length
             let processedCount = 0
             let lastResponse = null
 
             // 处理每一批次
             for (let i = 0; i < totalChunks; i += BATCH_SIZE) {
-                const batchChunks = chunks.slice(i, i + BATCH_SIZE)
+                const batchChunks = chunkIds.slice(i, i + BATCH_SIZE)
                 const formData = new FormData()
                 formData.append('file_id', fileId.value)
 
-                // 添加当前批次的文本块
-                batchChunks.forEach(chunk => {
-                    formData.append('selected_chunks', chunk)
+                // 添加当前批次的文本块ID
+                batchChunks.forEach(chunkId => {
+                    formData.append('chunk_ids', chunkId)
                 })
 
                 const response = await fetch('http://localhost:8000/api/select-chunks', {
@@ -170,8 +244,11 @@ export const useFileStore = defineStore('file', () => {
     // 重置状态
     function reset() {
         fileId.value = null
-        splitResults.value = []
+        summary.value = null
+        chunks.value = []
+        nextCursor.value = null
         selectedChunks.value = []
+        selectAllChunks.value = false
         indexId.value = null
         indexCreated.value = false
         searchResults.value = []
@@ -183,18 +260,25 @@ export const useFileStore = defineStore('file', () => {
         isLoading,
         error,
         fileId,
-        splitResults,
+        summary,
+        chunks,
+        isLoadingChunks,
         selectedChunks,
+        selectAllChunks,
         indexId,
         indexCreated,
         searchResults,
 
         // 计算属性
         hasSelectedChunks,
+        selectedCount,
+        hasMoreChunks,
         canCreateIndex,
 
         // 方法
         uploadFile,
+        loadMoreChunks,
+        chunkText,
         submitSelectedChunks,
         createIndex,
         searchVectors,